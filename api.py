@@ -0,0 +1,281 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import clients
+import pipeline
+import scheduling
+import cancellation
+
+# --- HTTP JOB API ---
+# Programmatic curriculum generation for LMS integrations, on the same
+# TOC/lesson/video pipeline as the UI, served asynchronously:
+#
+#   POST   /jobs                      {"subject", "grade", "mode", "max_topics"?, "split"?, "batch"?, "models"?}
+#   GET    /jobs/{id}                 status and progress
+#   GET    /jobs/{id}/topics?since=N  lessons finished since cursor N, in completion order
+#   DELETE /jobs/{id}                 cancel
+#   GET    /health                    job counts and capacity
+#
+#   uvicorn api:app --port 8000
+#
+# Jobs live in memory, so run a single server process. Every job uses the
+# registry's shared OpenAI client (and its keep-alive connection pool);
+# pipeline calls run on a bounded thread pool, so load beyond
+# EDUPLAN_API_CONCURRENCY queues instead of opening more connections.
+
+logger = logging.getLogger("eduplan.api")
+
+MODES = ("Physical (Classroom)", "Online (Virtual)")
+# Pipeline calls (TOC or lesson) running at once across all jobs
+CONCURRENCY = int(os.environ.get("EDUPLAN_API_CONCURRENCY", 16))
+# Unfinished jobs accepted before new submissions get 429
+MAX_ACTIVE_JOBS = int(os.environ.get("EDUPLAN_API_MAX_JOBS", 200))
+# Finished jobs are forgotten after this many seconds
+JOB_TTL_S = int(os.environ.get("EDUPLAN_API_JOB_TTL_S", 3600))
+# Optional bearer token required on every request
+API_TOKEN = os.environ.get("EDUPLAN_API_TOKEN")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+
+FINISHED = ("done", "failed", "cancelled")
+
+JOBS = {}
+EXECUTOR = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="eduplan-api")
+
+
+class Job:
+    """One curriculum request: status, the TOC, and lessons in the order they finished."""
+
+    def __init__(self, subject, grade, mode, max_topics=None, split=False, batch=False, models=None):
+        self.id = uuid.uuid4().hex
+        self.subject = subject
+        self.grade = grade
+        self.mode = mode
+        self.max_topics = max_topics
+        self.split = split
+        self.batch = batch
+        self.status = "queued"
+        self.error = None
+        self.toc_text = ""
+        self.topics = []
+        self.total = None
+        self.results = []
+        self.tokens = 0
+        self.created_at = time.time()
+        self.finished_at = None
+        self.token = cancellation.CancelToken()
+        self.session = pipeline.GenerationSession(
+            stage_models=dict(pipeline.DEFAULT_STAGE_MODELS, **(models or {})), flow=self.id
+        )
+        self.task = None
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "subject": self.subject,
+            "grade": self.grade,
+            "mode": self.mode,
+            "topics": self.topics,
+            "total": self.total,
+            "done": sum(1 for result in self.results if result["status"] == "done"),
+            "failed": sum(1 for result in self.results if result["status"] == "failed"),
+            "tokens": self.tokens,
+            "cache_hits": self.session.counters["cache_hits"],
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+async def call(job, fn, *args, **kwargs):
+    """Run a pipeline function for `job` on the bounded pool, under the job's session and token."""
+    def work():
+        pipeline.set_session(job.session)
+        cancellation.set_current_token(job.token)
+        job.token.raise_if_cancelled()
+        pipeline.llm_usage.tokens = 0
+        return fn(*args, **kwargs), pipeline.llm_usage.tokens
+
+    result, tokens = await asyncio.get_running_loop().run_in_executor(EXECUTOR, work)
+    job.tokens += tokens
+    return result
+
+
+async def run_chunk(job, chunk):
+    args = (clients.get_client(OPENAI_API_KEY), job.grade, job.subject, job.mode)
+    if len(chunk) == 1:
+        seq, topic = chunk[0]
+        results = [await call(job, pipeline.cached_lesson, *args, topic, seq, split=job.split)]
+    else:
+        results = await call(job, pipeline.cached_lesson_batch, *args, chunk, split=job.split)
+    for (seq, topic), (data, tokens, cached) in zip(chunk, results):
+        job.results.append({
+            "seq": seq,
+            "topic": topic,
+            "status": "done" if data else "failed",
+            "cached": cached,
+            "lesson": data,
+        })
+
+
+async def run_job(job):
+    """TOC first, then every topic's lesson (or batch of lessons) concurrently."""
+    try:
+        job.status = "toc"
+        toc, cached = await call(job, pipeline.cached_toc, clients.get_client(OPENAI_API_KEY), job.grade, job.subject)
+        if not toc:
+            raise RuntimeError("No table of contents returned")
+        job.toc_text = toc
+        job.topics = pipeline.parse_topics(toc)
+        items = list(enumerate(job.topics, 1))[:job.max_topics]
+        job.total = len(items)
+
+        job.status = "lessons"
+        size = await call(job, pipeline.lesson_batch_size) if job.batch else 1
+        await asyncio.gather(*(run_chunk(job, items[i:i + size]) for i in range(0, len(items), size)))
+        job.status = "done"
+    except (asyncio.CancelledError, cancellation.GenerationCancelled):
+        job.status = "cancelled"
+    except Exception as e:
+        logger.exception("Job %s failed", job.id)
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = time.time()
+
+
+def purge_finished():
+    cutoff = time.time() - JOB_TTL_S
+    for job_id in [job_id for job_id, job in JOBS.items() if job.finished_at and job.finished_at < cutoff]:
+        del JOBS[job_id]
+
+
+def error(status_code, message):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+def authorized(request):
+    return not API_TOKEN or request.headers.get("authorization") == f"Bearer {API_TOKEN}"
+
+
+def api_route(handler):
+    """Bearer-token check and job lookup shared by the endpoints."""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        if not authorized(request):
+            return error(401, "Missing or invalid bearer token")
+        if "job_id" in request.path_params:
+            job = JOBS.get(request.path_params["job_id"])
+            if job is None:
+                return error(404, "No such job")
+            return await handler(request, job)
+        return await handler(request)
+    return wrapper
+
+
+@api_route
+async def submit_job(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return error(400, "Body must be JSON")
+    if not isinstance(body, dict):
+        return error(400, "Body must be a JSON object")
+    subject = str(body.get("subject") or "").strip()
+    grade = str(body.get("grade") or "").strip()
+    mode = body.get("mode", MODES[0])
+    max_topics = body.get("max_topics")
+    models = body.get("models") or {}
+    if not subject or not grade:
+        return error(400, "subject and grade are required")
+    if mode not in MODES:
+        return error(400, f"mode must be one of: {', '.join(MODES)}")
+    if max_topics is not None and (not isinstance(max_topics, int) or max_topics < 1):
+        return error(400, "max_topics must be a positive integer")
+    if not isinstance(models, dict) or any(
+        stage not in pipeline.DEFAULT_STAGE_MODELS or model not in pipeline.MODEL_CHOICES for stage, model in models.items()
+    ):
+        return error(400, f"models maps stages ({', '.join(pipeline.DEFAULT_STAGE_MODELS)}) to one of: {', '.join(pipeline.MODEL_CHOICES)}")
+
+    purge_finished()
+    if sum(1 for job in JOBS.values() if job.status not in FINISHED) >= MAX_ACTIVE_JOBS:
+        return error(429, "Too many jobs in progress, retry later")
+
+    job = Job(subject, grade, mode, max_topics, bool(body.get("split")), bool(body.get("batch")), models)
+    JOBS[job.id] = job
+    job.task = asyncio.create_task(run_job(job))
+    return JSONResponse(job.summary(), status_code=202, headers={"Location": f"/jobs/{job.id}"})
+
+
+@api_route
+async def get_job(request, job):
+    return JSONResponse(dict(job.summary(), toc_text=job.toc_text))
+
+
+@api_route
+async def get_topics(request, job):
+    try:
+        since = max(0, int(request.query_params.get("since", 0)))
+    except ValueError:
+        return error(400, "since must be an integer")
+    results = job.results[since:]
+    return JSONResponse({
+        "status": job.status,
+        "total": job.total,
+        "next": since + len(results),
+        "topics": results,
+    })
+
+
+@api_route
+async def cancel_job(request, job):
+    if job.status not in FINISHED:
+        job.token.cancel()
+        job.task.cancel()
+    return JSONResponse(job.summary())
+
+
+@api_route
+async def health(request):
+    counts = {}
+    for job in JOBS.values():
+        counts[job.status] = counts.get(job.status, 0) + 1
+    return JSONResponse({
+        "jobs": counts,
+        "concurrency": CONCURRENCY,
+        "max_active_jobs": MAX_ACTIVE_JOBS,
+        "schedulers": {f"{resource}:{pool}": scheduler.snapshot() for (resource, pool), scheduler in scheduling.get_schedulers().items()},
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    try:
+        yield
+    finally:
+        for job in JOBS.values():
+            job.token.cancel()
+        clients.REGISTRY.close_all()
+        EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route("/jobs", submit_job, methods=["POST"]),
+        Route("/jobs/{job_id}", get_job, methods=["GET"]),
+        Route("/jobs/{job_id}", cancel_job, methods=["DELETE"]),
+        Route("/jobs/{job_id}/topics", get_topics, methods=["GET"]),
+        Route("/health", health, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
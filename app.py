@@ -1,232 +1,153 @@
+import time
+RERUN_START = time.perf_counter()
+
 import streamlit as st
-import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import os
-import re
-import json
-from openai import OpenAI
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+import curriculum_store as store
+import clients
+import inflight
+import prewarm
+import speculative
+import cancellation
+import hedging
+import scheduling
+import bulk
+import pipeline
+import job_queue
+import lesson_model
+import session_memory
 # Removed youtube-search-python - using direct HTTP scraping instead
 
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(page_title="EduPlan Pro", page_icon="🎓", layout="wide")
 
+# --- STARTUP AND RERUN TIMING ---
+@st.cache_resource
+def get_timings():
+    """Process-wide timings: the cold first run, then recent reruns as (first paint, total) seconds."""
+    return {"cold_start": None, "reruns": deque(maxlen=200)}
+
+
 # --- MODERN CSS STYLING ---
+# Stylesheets live in static/. With static serving on (.streamlit/config.toml)
+# a rerun sends a <link> to a file the browser has cached instead of the CSS.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+@st.cache_resource
+def stylesheet(name):
+    """Markup that applies static/<name>: a versioned <link>, or the CSS inline when static serving is off."""
+    with open(os.path.join(STATIC_DIR, name)) as f:
+        css = f.read()
+    if st.get_option("server.enableStaticServing"):
+        version = hashlib.sha256(css.encode()).hexdigest()[:8]
+        return f'<link rel="stylesheet" href="app/static/{name}?v={version}">'
+    return f"<style>\n{css}</style>"
+
+st.markdown(stylesheet("eduplan.css"), unsafe_allow_html=True)
+
+# The header goes out before the sidebar and helpers run, so the page paints at once
 st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap');
-    
-    * {
-        font-family: 'Inter', sans-serif;
-    }
-    
-    .main-header {
-        text-align: center;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 40px;
-        border-radius: 15px;
-        margin-bottom: 30px;
-        box-shadow: 0 8px 16px rgba(102, 126, 234, 0.3);
-    }
-    
-    .topic-card {
-        background: white;
-        border-radius: 15px;
-        padding: 35px;
-        margin: 30px 0;
-        box-shadow: 0 4px 12px rgba(0,0,0,0.08);
-        border-left: 5px solid #667eea;
-    }
-    
-    .topic-header {
-        font-size: 30px;
-        font-weight: 700;
-        color: #1a202c;
-        margin-bottom: 20px;
-        display: flex;
-        align-items: center;
-    }
-    
-    .topic-number {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        width: 55px;
-        height: 55px;
-        border-radius: 50%;
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-        margin-right: 20px;
-        font-weight: 700;
-        font-size: 24px;
-        box-shadow: 0 4px 8px rgba(102, 126, 234, 0.3);
-    }
-    
-    .section-header {
-        font-size: 20px;
-        font-weight: 600;
-        color: #1a202c;
-        margin-top: 30px;
-        margin-bottom: 15px;
-        padding-bottom: 10px;
-        border-bottom: 3px solid #e2e8f0;
-    }
-    
-    .overview-box {
-        background: white;
-        border-left: 4px solid #667eea;
-        padding: 25px;
-        border-radius: 10px;
-        margin: 15px 0;
-        font-size: 16px;
-        line-height: 1.8;
-        color: #1a202c;
-    }
-    
-    .objectives-list, .materials-list {
-        background: white;
-        padding: 20px;
-        border-radius: 10px;
-        margin: 10px 0;
-    }
-    
-    .list-item {
-        padding: 12px 0;
-        border-bottom: 1px solid #e2e8f0;
-        font-size: 15px;
-        line-height: 1.6;
-        color: #1a202c;
-        font-weight: 500;
-    }
-    
-    .list-item:last-child {
-        border-bottom: none;
-    }
-    
-    .video-section-header {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 15px 25px;
-        border-radius: 10px;
-        margin: 30px 0 20px 0;
-        font-size: 19px;
-        font-weight: 600;
-    }
-    
-    .video-scroll-container {
-        display: flex;
-        overflow-x: auto;
-        gap: 20px;
-        padding: 20px 0;
-        scroll-behavior: smooth;
-        -webkit-overflow-scrolling: touch;
-    }
-    
-    .video-scroll-container::-webkit-scrollbar {
-        height: 8px;
-    }
-    
-    .video-scroll-container::-webkit-scrollbar-track {
-        background: #f1f1f1;
-        border-radius: 10px;
-    }
-    
-    .video-scroll-container::-webkit-scrollbar-thumb {
-        background: #667eea;
-        border-radius: 10px;
-    }
-    
-    .video-scroll-container::-webkit-scrollbar-thumb:hover {
-        background: #764ba2;
-    }
-    
-    .video-container {
-        background: white;
-        border-radius: 12px;
-        padding: 20px;
-        min-width: 400px;
-        max-width: 400px;
-        flex-shrink: 0;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.08);
-        border: 1px solid #e2e8f0;
-    }
-    
-    @media (max-width: 768px) {
-        .video-container {
-            min-width: 300px;
-            max-width: 300px;
-        }
-    }
-    
-    .video-title {
-        font-weight: 600;
-        font-size: 17px;
-        color: #2d3748;
-        margin-bottom: 8px;
-    }
-    
-    .video-channel {
-        font-size: 14px;
-        color: #718096;
-        margin-bottom: 12px;
-    }
-    
-    .video-description {
-        font-size: 14px;
-        color: #4a5568;
-        margin-bottom: 15px;
-        line-height: 1.6;
-        padding: 10px;
-        background: #f7fafc;
-        border-radius: 6px;
-        font-style: italic;
-    }
-    
-    .experiment-box {
-        background: white;
-        border-left: 4px solid #fbbf24;
-        padding: 25px;
-        border-radius: 10px;
-        margin: 20px 0;
-    }
-    
-    .experiment-title {
-        font-size: 22px;
-        font-weight: 600;
-        color: #1a202c;
-        margin-bottom: 20px;
-    }
-    
-    .step-item {
-        background: white;
-        padding: 18px;
-        margin: 12px 0;
-        border-radius: 8px;
-        border-left: 4px solid #fbbf24;
-        font-size: 15px;
-        line-height: 1.7;
-        color: #1a202c;
-        font-weight: 500;
-    }
-    
-    .step-number {
-        display: inline-block;
-        background: #fbbf24;
-        color: white;
-        width: 32px;
-        height: 32px;
-        border-radius: 50%;
-        text-align: center;
-        line-height: 32px;
-        margin-right: 12px;
-        font-weight: 600;
-        font-size: 15px;
-    }
-    
-    div[data-testid="stToolbar"] {visibility: hidden;}
-    footer {visibility: hidden;}
-    </style>
+    <div class="main-header">
+        <h1 style="margin:0; font-size: 42px;">🎓 EduPlan Pro</h1>
+        <p style="margin:10px 0 0 0; font-size: 18px; opacity: 0.9;">AI-Powered US Curriculum Designer</p>
+    </div>
 """, unsafe_allow_html=True)
+first_paint_s = time.perf_counter() - RERUN_START
+
+# --- MODEL TIERS ---
+# Tiers, budgets and the pipeline itself live in pipeline.py; these are UI labels.
+STAGE_LABELS = {
+    "toc": "Table of Contents",
+    "lesson": "Lesson Body",
+    "video_intents": "Video Intents",
+    "repair": "JSON Repair",
+}
+
+REGENERABLE_SECTIONS = {
+    "overview": "Overview",
+    "objectives": "Learning Objectives",
+    "materials": "Required Materials",
+    "experiment": "Hands-On Activity",
+    "videos": "Video Resources",
+}
+LATENCY_BUDGET_LABELS = {
+    "llm_s": "LLM call",
+    "videos_s": "Video resolution",
+    "topic_s": "Whole topic",
+}
+
+# With EDUPLAN_QUEUE=1 this process only submits jobs and renders progress;
+# generation runs in worker.py processes, with the workers' own API key.
+QUEUE_ENABLED = os.environ.get("EDUPLAN_QUEUE") == "1"
+
+def summarize_stage_metrics(metrics):
+    """Average latency, tokens and quality proxies per stage/variant/model."""
+    import pandas as pd
+    df = pd.DataFrame(metrics)
+    quality_cols = [c for c in df.columns if c.startswith("q_")]
+    agg = {"latency_s": "mean", "prompt_tokens": "mean", "cached_tokens": "mean", "completion_tokens": "mean"}
+    agg.update({c: "mean" for c in quality_cols})
+    summary = df.groupby(["stage", "variant", "model"]).agg(agg).round(2)
+    summary.insert(0, "calls", df.groupby(["stage", "variant", "model"]).size())
+    return summary.reset_index()
+
+def summarize_topic_latencies(latencies):
+    """
+    p50/p95 LLM latency per request and tokens/topic and topics/minute per
+    generation strategy (monolithic vs. split vs. batched).
+    """
+    import pandas as pd
+    df = pd.DataFrame(latencies)
+    summary = df.groupby("strategy")["latency_s"].describe(percentiles=[0.5, 0.95])
+    summary = summary[["count", "50%", "95%"]].rename(columns={"50%": "p50_s", "95%": "p95_s"})
+    totals = df.groupby("strategy")[["topics", "tokens", "latency_s"]].sum()
+    summary["tokens_per_topic"] = totals["tokens"] / totals["topics"].clip(lower=1)
+    summary["topics_per_min"] = 60 * totals["topics"] / totals["latency_s"]
+    return summary.round(2).reset_index()
+
+def memoized_summary(name, summarize, rows):
+    """summarize(rows), recomputed only when the rows changed rather than on every rerun."""
+    key = f"summary_{name}"
+    signature = (id(rows), len(rows))
+    cached = st.session_state.get(key)
+    if cached is None or cached[0] != signature:
+        cached = st.session_state[key] = (signature, summarize(rows))
+    return cached[1]
+
+# --- SESSION MEMORY ---
+def session_alive(session_id):
+    """
+    False once a session has left the runtime entirely. A disconnected tab is
+    kept (and can reconnect) for a while, so is_active_session() isn't enough.
+    """
+    from streamlit import runtime
+    if not runtime.exists():
+        return True
+    session_mgr = getattr(runtime.get_instance(), "_session_mgr", None)
+    if session_mgr is None or not hasattr(session_mgr, "get_session_info"):
+        return True
+    return session_mgr.get_session_info(session_id) is not None
+
+def session_busy(state):
+    """Background fill-ins write into a session's lessons; it can't be spilled under them."""
+    return 'fill_jobs' in state and any(not job.done() for job in state['fill_jobs'].values())
+
+@st.cache_resource
+def get_session_memory():
+    """Process-wide memory budgets for session curricula (see session_memory.py)."""
+    return session_memory.SessionMemory(is_alive=session_alive, is_busy=session_busy)
+
+# Spilled curricula are back in place before anything below reads them
+run_ctx = get_script_run_ctx()
+get_session_memory().begin(run_ctx.session_id, run_ctx.session_state)
 
 # --- SESSION STATE ---
 if 'topics' not in st.session_state:
@@ -241,6 +162,44 @@ if 'grade_level' not in st.session_state:
     st.session_state.grade_level = ""
 if 'mode' not in st.session_state:
     st.session_state.mode = "Physical (Classroom)"
+if 'owner' not in st.session_state:
+    # Whose generation runs these are; kept in the page URL so it survives a refresh
+    st.session_state.owner = st.query_params.get("owner") or os.urandom(16).hex()
+    st.query_params["owner"] = st.session_state.owner
+if 'stage_models' not in st.session_state:
+    st.session_state.stage_models = dict(pipeline.DEFAULT_STAGE_MODELS)
+if 'ab_test_enabled' not in st.session_state:
+    st.session_state.ab_test_enabled = False
+if 'ab_stage_models' not in st.session_state:
+    st.session_state.ab_stage_models = dict(pipeline.DEFAULT_STAGE_MODELS, lesson="gpt-4o-mini")
+if 'stage_metrics' not in st.session_state:
+    st.session_state.stage_metrics = []
+if 'curriculum_id' not in st.session_state:
+    st.session_state.curriculum_id = None
+if 'split_generation' not in st.session_state:
+    st.session_state.split_generation = False
+if 'topic_latencies' not in st.session_state:
+    st.session_state.topic_latencies = []
+if 'batch_generation' not in st.session_state:
+    st.session_state.batch_generation = False
+if 'generation_counters' not in st.session_state:
+    st.session_state.generation_counters = {"cache_hits": 0, "coalesced_calls": 0}
+if 'speculator' not in st.session_state:
+    st.session_state.speculator = None
+if 'run_id' not in st.session_state:
+    st.session_state.run_id = None
+if 'generation_cancelled' not in st.session_state:
+    st.session_state.generation_cancelled = False
+if 'speculation_suppressed' not in st.session_state:
+    st.session_state.speculation_suppressed = False
+if 'latency_budgets' not in st.session_state:
+    st.session_state.latency_budgets = dict(pipeline.DEFAULT_LATENCY_BUDGETS)
+if 'fill_jobs' not in st.session_state:
+    st.session_state.fill_jobs = {}
+if 'hedge_enabled' not in st.session_state:
+    st.session_state.hedge_enabled = False
+if 'hedge_percentile' not in st.session_state:
+    st.session_state.hedge_percentile = 90
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -254,6 +213,99 @@ with st.sidebar:
     else:
         openai_api_key = None
     
+    with st.expander("🧠 Model Tiers"):
+        for stage, label in STAGE_LABELS.items():
+            current = st.session_state.stage_models[stage]
+            st.session_state.stage_models[stage] = st.selectbox(
+                label, pipeline.MODEL_CHOICES, index=pipeline.MODEL_CHOICES.index(current), key=f"model_{stage}"
+            )
+        
+        st.session_state.ab_test_enabled = st.toggle(
+            "A/B test tiers", value=st.session_state.ab_test_enabled,
+            help="Randomly route each call to variant A (above) or variant B (below) and record latency, tokens and quality per stage."
+        )
+        if st.session_state.ab_test_enabled:
+            for stage, label in STAGE_LABELS.items():
+                current = st.session_state.ab_stage_models[stage]
+                st.session_state.ab_stage_models[stage] = st.selectbox(
+                    f"{label} (B)", pipeline.MODEL_CHOICES, index=pipeline.MODEL_CHOICES.index(current), key=f"ab_model_{stage}"
+                )
+        
+        if st.session_state.stage_metrics:
+            st.caption("Per-stage averages")
+            st.dataframe(memoized_summary("stages", summarize_stage_metrics, st.session_state.stage_metrics), use_container_width=True)
+            if st.button("Clear metrics", use_container_width=True):
+                st.session_state.stage_metrics = []
+                st.rerun()
+    
+    with st.expander("⚡ Generation Strategy"):
+        st.session_state.split_generation = st.toggle(
+            "Split lesson into parallel requests", value=st.session_state.split_generation,
+            help="Generate text sections, the activity and video intents as concurrent calls instead of one large completion."
+        )
+        st.session_state.batch_generation = st.toggle(
+            "Batch several topics per request", value=st.session_state.batch_generation,
+            help="Generate lessons for several topics in one structured completion, sized to the model's output limit. Topics that fail validation are re-issued on their own."
+        )
+        
+        st.session_state.hedge_enabled = st.toggle(
+            "Hedge slow lesson calls", value=st.session_state.hedge_enabled,
+            help="Fire a duplicate request when a lesson call runs past the chosen latency percentile and keep whichever finishes first."
+        )
+        if st.session_state.hedge_enabled:
+            st.session_state.hedge_percentile = st.slider(
+                "Hedge after percentile", 50, 99, st.session_state.hedge_percentile, key="hedge_percentile_slider"
+            )
+            for name, hedger in hedging.get_hedgers().items():
+                stats = hedger.stats
+                st.caption(
+                    f"🪁 {name}: {stats['hedges']} hedge(s) in {stats['calls']} calls, "
+                    f"hedge won {stats['hedge_wins']} • extra prompt tokens {stats['extra_tokens']:,}"
+                )
+        
+        st.caption("Latency budgets (seconds, 0 = unlimited)")
+        for budget, label in LATENCY_BUDGET_LABELS.items():
+            st.session_state.latency_budgets[budget] = st.number_input(
+                label, min_value=0, max_value=600, step=5,
+                value=int(st.session_state.latency_budgets[budget]), key=f"budget_{budget}"
+            )
+        if st.session_state.topic_latencies:
+            st.caption("LLM latency per request, tokens and throughput per topic")
+            st.dataframe(memoized_summary("topics", summarize_topic_latencies, st.session_state.topic_latencies), use_container_width=True)
+        
+        stats = inflight.REGISTRY.stats
+        st.caption(
+            f"🔗 Coalesced calls: {st.session_state.generation_counters['coalesced_calls']} this session, "
+            f"{stats['coalesced']} of {stats['executed'] + stats['coalesced']} server-wide"
+        )
+        st.caption(f"💾 Served from cache: {st.session_state.generation_counters['cache_hits']} this session")
+        client_stats = clients.REGISTRY.snapshot()
+        st.caption(
+            f"🔌 OpenAI clients: {client_stats['reused']} reused, {client_stats['created']} created, "
+            f"{client_stats['evicted']} evicted idle"
+        )
+        memory = get_session_memory().snapshot()
+        st.caption(
+            f"🧠 Session memory: {memory['resident_bytes'] / 2**20:.1f} of {memory['global_budget'] / 2**20:.0f} MB "
+            f"in {memory['sessions'] - memory['spilled_sessions']} session(s), {memory['spilled_sessions']} spilled • "
+            f"{sum(memory['spills'].values())} spills, {memory['rehydrations']} rehydrations"
+        )
+        prompt_tokens = sum(m["prompt_tokens"] for m in st.session_state.stage_metrics)
+        if prompt_tokens:
+            cached_tokens = sum(m.get("cached_tokens", 0) for m in st.session_state.stage_metrics)
+            st.caption(f"🧩 Prompt-cached input: {cached_tokens:,} of {prompt_tokens:,} tokens ({cached_tokens / prompt_tokens:.0%})")
+        for (resource, pool), scheduler in sorted(scheduling.get_schedulers().items()):
+            sched = scheduler.snapshot()
+            mine = scheduler.flow_stats(run_ctx.session_id)
+            st.caption(
+                f"🚦 {resource} ({pool}): {sched['running']}/{sched['slots']} busy, "
+                f"{sched['queued']['interactive']} interactive + {sched['queued']['background']} background queued • "
+                f"your wait {mine['wait_s'] / max(1, mine['calls']):.2f}s avg, {mine['max_wait_s']:.1f}s max"
+            )
+        if QUEUE_ENABLED:
+            queue = job_queue.queue_stats()
+            st.caption(f"🏗️ Worker queue: {queue['queued']} queued, {queue['running']} running on {queue['workers']} worker(s)")
+    
     st.divider()
     
     st.markdown("### 📚 Features")
@@ -272,6 +324,13 @@ with st.sidebar:
         st.session_state.subject_name = ""
         st.session_state.grade_level = ""
         st.session_state.mode = "Physical (Classroom)"
+        st.session_state.curriculum_id = None
+        st.session_state.run_id = None
+        st.session_state.fill_jobs = {}
+        if st.session_state.speculator:
+            st.session_state.speculator.stop()
+        st.session_state.speculator = None
+        st.session_state.speculation_suppressed = False
         st.rerun()
 
 # --- HELPER FUNCTIONS ---
@@ -279,361 +338,37 @@ def get_openai_client():
     if not openai_api_key:
         st.error("⚠️ Please enter your OpenAI API Key in the sidebar.")
         st.stop()
-    return OpenAI(api_key=openai_api_key)
-
-def get_real_youtube_video(search_query):
-    """
-    Search YouTube and return the first real video URL using direct HTTP scraping.
-    This is more reliable than the youtube-search-python library.
-    """
-    try:
-        import urllib.parse
-        import urllib.request
-        import re
-        
-        # Encode the search query
-        encoded_query = urllib.parse.quote(search_query)
-        search_url = f"https://www.youtube.com/results?search_query={encoded_query}"
-        
-        # Make HTTP request to YouTube search
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        req = urllib.request.Request(search_url, headers=headers)
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8')
-            
-            # Extract video ID using regex
-            # YouTube video IDs are in the format: "videoId":"VIDEO_ID_HERE"
-            pattern = r'"videoId":"([a-zA-Z0-9_-]{11})"'
-            matches = re.findall(pattern, html)
-            
-            if matches:
-                video_id = matches[0]  # Get the first video
-                video_url = f"https://www.youtube.com/watch?v={video_id}"
-                return video_url
-            else:
-                return None
-                
-    except Exception as e:
-        st.error(f"YouTube search failed for '{search_query}': {str(e)}")
-        return None
+    return clients.get_client(openai_api_key)
 
 
-def extract_video_id(url):
-    """Extract YouTube video ID from various URL formats."""
-    if not url:
-        return None
-    patterns = [
-        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-        r'(?:embed\/)([0-9A-Za-z_-]{11})',
-        r'^([0-9A-Za-z_-]{11})$'
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
-def get_table_of_contents(client, grade, subject):
-    """Generate REALISTIC curriculum topics based on actual subject standards."""
-    
-    prompt = f"""
-You are a US curriculum expert with deep knowledge of standard textbooks and curriculum frameworks.
-
-TASK: Generate the complete Table of Contents for {subject}, Grade {grade} based on ACTUAL US curriculum standards.
-
-CRITICAL INSTRUCTIONS:
-1. Research what topics are ACTUALLY taught in {subject} for Grade {grade} in US schools
-2. The number of topics should match REAL textbook chapter counts:
-   - Physics: typically 10-14 major topics
-   - Chemistry: typically 10-14 major topics  
-   - Biology: typically 9-12 major topics
-   - Algebra: typically 8-11 units
-   - Geometry: typically 10-12 units
-   - US History: typically 10-15 units
-   - World History: typically 12-16 units
-
-3. Topics must be:
-   - Aligned with NGSS (Science), Common Core (Math), or NCSS (Social Studies)
-   - Age-appropriate for Grade {grade}
-   - Sequenced in the order they're typically taught
-   - Use proper terminology from standard textbooks
-
-4. Include the FULL CURRICULUM - don't abbreviate or skip topics
-
-EXAMPLES OF REAL CURRICULA:
-- Chemistry Grade 10: Atomic Structure, Periodic Table, Chemical Bonding, Chemical Reactions, Stoichiometry, Gas Laws, Solutions, Acids and Bases, Thermochemistry, Kinetics, Equilibrium, Electrochemistry, Organic Chemistry
-- Physics Grade 9: Motion and Forces, Energy and Work, Momentum, Waves, Sound, Light, Electricity, Magnetism, Heat and Temperature, Simple Machines
-
-Output format STRICTLY:
-1. Topic Name
-2. Topic Name
-3. Topic Name
-... (continue for ALL topics in the standard curriculum)
-
-OUTPUT ONLY THE NUMBERED LIST. No introduction, no conclusion, no extra text.
-"""
+class StreamlitSession(pipeline.GenerationSession):
+    """Pipeline session backed by this browser session's state; problems are shown on the page."""
     
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a US curriculum expert who generates realistic, standards-aligned topic lists."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        st.error(f"Error generating curriculum: {e}")
-        return None
+    def report(self, level, message):
+        # Logged too: from a thread with no script context st.* draws nothing
+        pipeline.logger.log(logging.getLevelName(level.upper()), message)
+        getattr(st, level)(message)
 
-def parse_topics(toc_text):
-    """Extract clean topic names from numbered list."""
-    lines = toc_text.split('\n')
-    topics = []
-    for line in lines:
-        clean_line = re.sub(r'^\d+\.\s*', '', line).strip()
-        if clean_line and len(clean_line) > 3:
-            topics.append(clean_line)
-    return topics
-
-def generate_topic_content(client, grade, subject, mode, topic, sequence_num):
-    """Generate comprehensive lesson content with MULTIPLE relevant videos."""
-    
-    if mode == "Physical (Classroom)":
-        exp_context = "PHYSICAL CLASSROOM LAB"
-        exp_guide = "Use standard school science lab equipment (microscopes, beakers, graduated cylinders, safety goggles, Bunsen burners, etc.)."
-        video_guide = "Include formal laboratory demonstrations showing proper equipment usage and safety procedures."
-    else:
-        exp_context = "HOME/VIRTUAL LEARNING"
-        exp_guide = "Use ONLY safe, common household items (no hazardous chemicals, no dangerous equipment)."
-        video_guide = "Include DIY demonstrations using household materials that are safe for home experiments."
-
-    MASTER_PROMPT = f"""
-You are an expert US curriculum designer creating a comprehensive lesson plan.
-
-Subject: {subject}
-Grade: {grade}
-Topic: {topic}
-Mode: {exp_context}
-
-Create a detailed, professional lesson plan with the following structure:
-
-1. TOPIC OVERVIEW
-Write 4-5 sentences that explain:
-- What this topic covers
-- Why it matters for Grade {grade} students
-- Real-world applications
-- How it connects to other topics
-
-2. LEARNING OBJECTIVES
-List 3-4 specific, measurable objectives:
-- Use action verbs (understand, analyze, calculate, demonstrate, etc.)
-- Make them assessable
-- Align with US standards
-
-3. REQUIRED MATERIALS
-List 6-10 specific materials needed.
-{exp_guide}
-Be precise with quantities and specifications.
-
-4. HANDS-ON ACTIVITY
-Create an engaging activity with:
-- Creative, descriptive title
-- 7-10 detailed, numbered steps
-- Safety notes (if applicable)
-- Expected outcomes
-
-5. VIDEO RESOURCES
-
-CRITICAL: Generate 10-12 TOTAL videos with diverse, highly relevant content:
-- 6-8 videos of type "Theory" for conceptual learning
-- 4-6 videos of type "Experiment Demo" for practical demonstrations
-
-**MODE-SPECIFIC EXPERIMENT VIDEOS:**
-{video_guide}
-
-For each video, provide:
-- title: Descriptive, specific title
-- channel: Real educational channel (Khan Academy, CrashCourse, TED-Ed, Veritasium, SciShow, Bozeman Science, MIT OpenCourseWare, etc.)
-- search_query: HIGHLY SPECIFIC search query that will find the exact video type needed
-- description: What students will learn (2-3 sentences)
-- type: "Theory" or "Experiment Demo"
-- duration: Estimated video length
-
-**SEARCH QUERY REQUIREMENTS:**
-- Include channel name for better results
-- Include specific keywords related to {topic}
-- For experiments, include "{exp_context}" keywords
-- Examples: 
-  - "{topic} Khan Academy tutorial"
-  - "{topic} CrashCourse chemistry"
-  - "{topic} {exp_context} experiment demonstration"
-  - "{topic} laboratory procedure Bozeman Science"
-
-OUTPUT AS VALID JSON:
-{{
-    "title": "{topic}",
-    "overview": "Comprehensive 4-5 sentence overview...",
-    "objectives": [
-        "Students will be able to...",
-        "Students will be able to...",
-        "Students will be able to...",
-        "Students will be able to..."
-    ],
-    "materials": [
-        "Material 1",
-        "Material 2",
-        "Material 3",
-        "Material 4",
-        "Material 5",
-        "Material 6"
-    ],
-    "experiment": {{
-        "title": "Activity Title",
-        "steps": [
-            "Step 1...",
-            "Step 2...",
-            "Step 3...",
-            "Step 4...",
-            "Step 5...",
-            "Step 6...",
-            "Step 7..."
-        ]
-    }},
-    "videos": [
-        {{
-            "title": "Introduction to {topic}",
-            "channel": "Khan Academy",
-            "search_query": "{topic} Khan Academy tutorial",
-            "description": "Comprehensive introduction to fundamental concepts.",
-            "type": "Theory",
-            "duration": "10:00"
-        }},
-        {{
-            "title": "{topic} Explained",
-            "channel": "CrashCourse",
-            "search_query": "{topic} CrashCourse",
-            "description": "Engaging overview with visual explanations.",
-            "type": "Theory",
-            "duration": "12:00"
-        }},
-        {{
-            "title": "{topic} Visual Guide",
-            "channel": "TED-Ed",
-            "search_query": "{topic} TED-Ed animation",
-            "description": "Animated explanation of key concepts.",
-            "type": "Theory",
-            "duration": "5:30"
-        }},
-        {{
-            "title": "{topic} Deep Dive",
-            "channel": "Veritasium",
-            "search_query": "{topic} Veritasium explained",
-            "description": "In-depth exploration with real-world examples.",
-            "type": "Theory",
-            "duration": "14:00"
-        }},
-        {{
-            "title": "{topic} Fundamentals",
-            "channel": "Professor Dave Explains",
-            "search_query": "{topic} Professor Dave tutorial",
-            "description": "Clear explanation of fundamental principles.",
-            "type": "Theory",
-            "duration": "8:30"
-        }},
-        {{
-            "title": "{topic} Advanced Concepts",
-            "channel": "MIT OpenCourseWare",
-            "search_query": "{topic} MIT lecture",
-            "description": "Advanced concepts and applications.",
-            "type": "Theory",
-            "duration": "20:00"
-        }},
-        {{
-            "title": "{topic} Quick Review",
-            "channel": "Amoeba Sisters",
-            "search_query": "{topic} Amoeba Sisters",
-            "description": "Quick, engaging review of key points.",
-            "type": "Theory",
-            "duration": "6:00"
-        }},
-        {{
-            "title": "{topic} Practical Guide",
-            "channel": "SciShow",
-            "search_query": "{topic} SciShow science",
-            "description": "Practical applications and interesting facts.",
-            "type": "Theory",
-            "duration": "9:00"
-        }},
-        {{
-            "title": "{topic} {exp_context} Experiment",
-            "channel": "SciShow",
-            "search_query": "{topic} {exp_context} experiment demonstration",
-            "description": "Hands-on demonstration using {exp_context} materials.",
-            "type": "Experiment Demo",
-            "duration": "8:45"
-        }},
-        {{
-            "title": "{topic} Lab Procedure",
-            "channel": "Bozeman Science",
-            "search_query": "{topic} {exp_context} laboratory procedure Bozeman",
-            "description": "Step-by-step {exp_context} lab procedures.",
-            "type": "Experiment Demo",
-            "duration": "15:00"
-        }},
-        {{
-            "title": "{topic} Practical Demo",
-            "channel": "The Organic Chemistry Tutor",
-            "search_query": "{topic} {exp_context} practical demonstration",
-            "description": "Detailed {exp_context} practical demonstration.",
-            "type": "Experiment Demo",
-            "duration": "12:00"
-        }},
-        {{
-            "title": "{topic} Real World Application",
-            "channel": "Veritasium",
-            "search_query": "{topic} real world application experiment",
-            "description": "Real-world applications with experimental proof.",
-            "type": "Experiment Demo",
-            "duration": "11:00"
-        }}
-    ]
-}}
-
-CRITICAL: Output ONLY valid JSON. Generate 10-12 videos total with highly specific search queries.
-"""
-    
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "You are a US curriculum expert creating detailed lesson plans with real YouTube video resources."},
-                {"role": "user", "content": MASTER_PROMPT}
-            ],
-            temperature=0.7
-        )
-        
-        data = json.loads(response.choices[0].message.content)
-        
-        # Fetch real YouTube videos for each search query
-        if 'videos' in data:
-            for idx, video in enumerate(data['videos']):
-                search_query = video.get('search_query', '')
-                if search_query:
-                    # Get real video from YouTube scraping
-                    real_url = get_real_youtube_video(search_query)
-                    video['real_url'] = real_url if real_url else None
-        
-        return data, response.usage.total_tokens
-    
-    except Exception as e:
-        st.error(f"Error generating content: {e}")
-        return None, 0
+
+def session_flow():
+    """This browser session's flow in the fair scheduler."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+def streamlit_session():
+    """The pipeline session for this rerun, sharing the session-state settings and metric lists."""
+    return StreamlitSession(
+        stage_models=st.session_state.stage_models,
+        ab_stage_models=st.session_state.ab_stage_models if st.session_state.ab_test_enabled else None,
+        latency_budgets=st.session_state.latency_budgets,
+        hedge_percentile=st.session_state.hedge_percentile / 100 if st.session_state.hedge_enabled else None,
+        stage_metrics=st.session_state.stage_metrics,
+        topic_latencies=st.session_state.topic_latencies,
+        counters=st.session_state.generation_counters,
+        flow=session_flow(),
+    )
+
+pipeline.set_session(streamlit_session())
 
 def render_video_section(videos, section_title, section_icon):
     """Render videos in a horizontal scrollable container - supports any number of videos!"""
@@ -643,72 +378,7 @@ def render_video_section(videos, section_title, section_icon):
     st.markdown(f'<div class="video-section-header">{section_icon} {section_title} ({len(videos)} Videos)</div>', unsafe_allow_html=True)
     
     # Build horizontal scrollable container with all videos
-    html_content = """
-    <style>
-        .video-scroll-container {
-            display: flex;
-            overflow-x: auto;
-            overflow-y: hidden;
-            gap: 20px;
-            padding: 20px 0;
-            scroll-behavior: smooth;
-            -webkit-overflow-scrolling: touch;
-        }
-        .video-scroll-container::-webkit-scrollbar {
-            height: 10px;
-        }
-        .video-scroll-container::-webkit-scrollbar-track {
-            background: #f1f1f1;
-            border-radius: 10px;
-        }
-        .video-scroll-container::-webkit-scrollbar-thumb {
-            background: #667eea;
-            border-radius: 10px;
-        }
-        .video-scroll-container::-webkit-scrollbar-thumb:hover {
-            background: #764ba2;
-        }
-        .video-card-scroll {
-            background: white;
-            border-radius: 12px;
-            padding: 20px;
-            min-width: 350px;
-            max-width: 350px;
-            flex-shrink: 0;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.08);
-            border: 1px solid #e2e8f0;
-        }
-        .video-card-title {
-            font-weight: 600;
-            font-size: 16px;
-            color: #1a202c;
-            margin-bottom: 8px;
-            overflow: hidden;
-            text-overflow: ellipsis;
-            display: -webkit-box;
-            -webkit-line-clamp: 2;
-            -webkit-box-orient: vertical;
-        }
-        .video-card-channel {
-            font-size: 13px;
-            color: #718096;
-            margin-bottom: 10px;
-        }
-        .video-card-desc {
-            font-size: 13px;
-            color: #4a5568;
-            margin-bottom: 12px;
-            line-height: 1.5;
-            padding: 8px;
-            background: #f7fafc;
-            border-radius: 6px;
-            overflow: hidden;
-            text-overflow: ellipsis;
-            display: -webkit-box;
-            -webkit-line-clamp: 3;
-            -webkit-box-orient: vertical;
-        }
-    </style>
+    html_content = stylesheet("videos.css") + """
     <div class="video-scroll-container">
     """
     
@@ -728,7 +398,7 @@ def render_video_section(videos, section_title, section_icon):
         """
         
         if real_url:
-            video_id = extract_video_id(real_url)
+            video_id = pipeline.extract_video_id(real_url)
             if video_id:
                 html_content += f"""
                 <iframe 
@@ -747,6 +417,13 @@ def render_video_section(videos, section_title, section_icon):
                     Could not load video
                 </div>
                 """
+        elif video.get('search_url'):
+            # Video resolution ran out of time budget - link to the search until it's filled in
+            html_content += f"""
+            <div style="width: 310px; height: 200px; background: #f1f1f1; border-radius: 8px; display: flex; align-items: center; justify-content: center;">
+                <a href="{video['search_url']}" target="_blank" style="color: #667eea; font-weight: 600;">🔎 Find on YouTube</a>
+            </div>
+            """
         else:
             html_content += """
             <div style="width: 310px; height: 200px; background: #f1f1f1; border-radius: 8px; display: flex; align-items: center; justify-content: center; color: #999;">
@@ -759,16 +436,508 @@ def render_video_section(videos, section_title, section_icon):
     html_content += "</div>"
     
     # Use components.html for rendering
+    import streamlit.components.v1 as components
     components.html(html_content, height=400, scrolling=False)
 
 
+# --- SPECULATIVE GENERATION ---
+def start_speculation():
+    """
+    Start generating this session's lessons in the background as soon as the
+    topics are known. Results land in the generation cache (and in-flight
+    registry), so the Generate button picks them up instead of re-running them.
+    """
+    api_key = openai_api_key
+    models = dict(st.session_state.stage_models)
+    split = st.session_state.split_generation
+    grade = st.session_state.grade_level
+    subject = st.session_state.subject_name
+    mode = st.session_state.mode
+    flow = session_flow()
+    
+    def generate(client, seq, topic):
+        pipeline.set_session(pipeline.GenerationSession(stage_models=models, flow=flow, priority="background"))
+        pipeline.cached_lesson(client, grade, subject, mode, topic, seq, split=split)
+    
+    topics = [(i+1, t) for i, t in enumerate(st.session_state.topics)]
+    # A dedicated client while workers run, closed on stop to abort requests in
+    # flight and checked back in once the last worker exits
+    speculator = speculative.SpeculativeGenerator(
+        generate, topics, acquire=lambda: clients.checkout(api_key), release=clients.checkin,
+        abort=lambda client: client.close()
+    )
+    return speculator.start()
+
+def stop_speculation():
+    if st.session_state.get('speculator'):
+        st.session_state.speculator.stop()
+        st.session_state.speculator = None
+
+def speculation_allowed():
+    """
+    No speculation once the teacher cancelled, or while their run still has
+    topics to go: that work waits for Resume rather than being redone.
+    """
+    if st.session_state.speculation_suppressed:
+        return False
+    if not st.session_state.run_id:
+        return True
+    run = store.load_run(st.session_state.run_id, with_data=False)
+    return not (run and any(item["status"] == "pending" for item in run["items"]))
+
+
+# --- WORKER QUEUE ---
+def queue_payload(**fields):
+    """Job payload: the given fields plus this session's models, budgets and hedging."""
+    session = pipeline.current_session()
+    return dict(
+        fields,
+        models=dict(session.stage_models),
+        ab_models=session.ab_stage_models,
+        budgets=session.latency_budgets,
+        hedge_percentile=session.hedge_percentile,
+    )
+
+def merge_job_result(result):
+    """Fold a finished job's metrics into this session and show its problems on the page."""
+    st.session_state.stage_metrics.extend(result["stage_metrics"])
+    st.session_state.topic_latencies.extend(result["topic_latencies"])
+    for name, value in result["counters"].items():
+        st.session_state.generation_counters[name] = st.session_state.generation_counters.get(name, 0) + value
+    for message in result["messages"]:
+        getattr(st, message["level"])(message["message"])
+
+def wait_for_jobs(job_ids, on_finished):
+    """
+    Poll queued jobs until every one has finished, calling on_finished(job)
+    as each does. The page is touched between polls, so Cancel, Start New
+    Curriculum or a closed tab interrupts the wait and cancels what's left.
+    """
+    remaining = set(job_ids)
+    ticker = st.empty()
+    start = time.perf_counter()
+    try:
+        while remaining:
+            for job in job_queue.get_jobs(sorted(remaining)).values():
+                if job["status"] in job_queue.FINISHED:
+                    remaining.discard(job["id"])
+                    on_finished(job)
+            if remaining:
+                queue = job_queue.queue_stats()
+                ticker.caption(
+                    f"⏱️ {time.perf_counter() - start:.0f}s • {queue['queued']} queued, "
+                    f"{queue['running']} running on {queue['workers']} worker(s)"
+                )
+                time.sleep(0.25)
+    except BaseException:
+        job_queue.cancel(sorted(remaining))
+        raise
+    ticker.empty()
+
+def queued_toc(grade, subject):
+    """Table of contents generated by a worker, or None (with the error shown)."""
+    job_id = job_queue.submit("toc", queue_payload(subject=subject, grade=grade), priority=1)
+    finished = []
+    wait_for_jobs([job_id], finished.append)
+    job = finished[0]
+    if job["status"] != "done":
+        st.error(f"Error generating TOC: {job['error'] or job['status']}")
+        return None
+    merge_job_result(job["result"])
+    return job["result"]["toc"]
+
+def run_generation_queued(run_id, items):
+    """
+    run_generation through the worker queue: every chunk is submitted up
+    front so idle workers pick them up in parallel, and topics are
+    checkpointed as their jobs finish.
+    """
+    st.button("⛔ Cancel Generation", on_click=request_cancel, use_container_width=True)
+    progress_bar = st.progress(0)
+    status = st.empty()
+    
+    job_ids = []
+    done = 0
+    while done < len(items):
+        chunk = items[done:done + pipeline.lesson_batch_size()] if st.session_state.batch_generation else items[done:done + 1]
+        job_ids.append(job_queue.submit("lessons", queue_payload(
+            subject=st.session_state.subject_name,
+            grade=st.session_state.grade_level,
+            mode=st.session_state.mode,
+            items=chunk,
+            split=st.session_state.split_generation,
+        )))
+        done += len(chunk)
+    
+    finished_topics = []
+    status.info(f"⏳ Generating {len(items)} topic(s) in {len(job_ids)} queued job(s)")
+    
+    def on_finished(job):
+        if job["status"] == "done":
+            merge_job_result(job["result"])
+            for seq, data, tokens, cached in job["result"]["lessons"]:
+                if data:
+                    store.checkpoint_topic(run_id, seq, data)
+                else:
+                    store.fail_topic(run_id, seq, "No lesson returned")
+        else:
+            for seq, topic_name in job["payload"]["items"]:
+                store.fail_topic(run_id, seq, job["error"] or f"Job {job['status']}")
+        finished_topics.extend(topic_name for seq, topic_name in job["payload"]["items"])
+        progress_bar.progress(len(finished_topics) / len(items))
+        status.info(f"⏳ {len(finished_topics)}/{len(items)} done • last: **{finished_topics[-1]}**")
+    
+    wait_for_jobs(job_ids, on_finished)
+    return sync_run_to_session(run_id)
+
+
+# --- CHECKPOINTED RUNS ---
+def request_cancel():
+    st.session_state.generation_cancelled = True
+    st.session_state.speculation_suppressed = True
+
+def run_cancellable(token, pool, fn, *args, **kwargs):
+    """
+    Run fn on a worker thread under `token` while the script thread keeps
+    touching the page. Each touch is a Streamlit checkpoint, so a Cancel
+    click, Start New Curriculum or a closed tab interrupts the wait at once
+    instead of after the current OpenAI call or scrape returns.
+    """
+    ctx = get_script_run_ctx()
+    session = pipeline.current_session()
+    
+    def work():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        pipeline.set_session(session)
+        cancellation.set_current_token(token)
+        return fn(*args, **kwargs)
+    
+    future = pool.submit(work)
+    ticker = st.empty()
+    start = time.perf_counter()
+    while True:
+        try:
+            result = future.result(timeout=0.25)
+            ticker.empty()
+            return result
+        except FutureTimeout:
+            ticker.caption(f"⏱️ {time.perf_counter() - start:.0f}s")
+
+def run_generation(client, run_id, items):
+    """
+    Generate lessons for (seq, topic) items of a run, checkpointing every
+    finished topic and recording failures as they happen.
+    """
+    if QUEUE_ENABLED:
+        return run_generation_queued(run_id, items)
+    
+    # A dedicated client, so cancelling can close it to abort the request in flight
+    client = clients.checkout(client.api_key)
+    token = cancellation.CancelToken()
+    token.on_cancel(client.close)
+    pool = ThreadPoolExecutor(max_workers=1)
+    
+    st.button("⛔ Cancel Generation", on_click=request_cancel, use_container_width=True)
+    progress_bar = st.progress(0)
+    status = st.empty()
+    
+    try:
+        done = 0
+        while done < len(items):
+            # Batch size is re-derived each time as observed lesson lengths come in
+            batch = items[done:done + pipeline.lesson_batch_size()] if st.session_state.batch_generation else items[done:done + 1]
+            
+            if len(batch) == 1:
+                seq, topic_name = batch[0]
+                status.info(f"⏳ Generating: **{topic_name}** ({done+1}/{len(items)})")
+                results = [run_cancellable(
+                    token,
+                    pool,
+                    pipeline.cached_lesson,
+                    client, 
+                    st.session_state.grade_level, 
+                    st.session_state.subject_name, 
+                    st.session_state.mode, 
+                    topic_name, 
+                    seq,
+                    split=st.session_state.split_generation
+                )]
+            else:
+                status.info(
+                    f"⏳ Generating {len(batch)} topics in one request: **{', '.join(t for s, t in batch)}** "
+                    f"({done+1}-{done+len(batch)}/{len(items)})"
+                )
+                results = run_cancellable(
+                    token,
+                    pool,
+                    pipeline.cached_lesson_batch,
+                    client,
+                    st.session_state.grade_level,
+                    st.session_state.subject_name,
+                    st.session_state.mode,
+                    batch,
+                    split=st.session_state.split_generation
+                )
+            
+            for (seq, topic_name), (data, tokens, cached) in zip(batch, results):
+                if data:
+                    store.checkpoint_topic(run_id, seq, data)
+                else:
+                    store.fail_topic(run_id, seq, "No lesson returned")
+            
+            done += len(batch)
+            progress_bar.progress(done / len(items))
+    except BaseException:
+        # Rerun/stop requests (Cancel, Start New, tab closed) land here: abort the
+        # in-flight OpenAI call and scrape, and drop any background speculation
+        token.cancel()
+        stop_speculation()
+        raise
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        clients.checkin(client)
+    
+    stop_speculation()
+    return sync_run_to_session(run_id)
+
+def sync_run_to_session(run_id):
+    """Rebuild generated_content from a run's checkpoints and save it as a curriculum. Returns the run."""
+    run = store.load_run(run_id)
+    lessons = [item["data"] for item in run["items"] if item["status"] == "done"]
+    
+    st.session_state.subject_name = run["subject"]
+    st.session_state.grade_level = run["grade"]
+    st.session_state.mode = run["mode"]
+    st.session_state.toc_text = run["toc_text"]
+    st.session_state.topics = run["topics"]
+    st.session_state.generated_content = lesson_model.pack_all(lessons)
+    st.session_state.run_id = run_id
+    st.session_state.curriculum_id = run["curriculum_id"]
+    
+    if lessons:
+        if st.session_state.curriculum_id:
+            store.replace_lessons(st.session_state.curriculum_id, lessons)
+        elif not any(item["status"] == "pending" for item in run["items"]):
+            st.session_state.curriculum_id = store.save_curriculum(
+                run["subject"], run["grade"], run["mode"], run["toc_text"], run["topics"], lessons
+            )
+    
+    if not any(item["status"] == "pending" for item in run["items"]):
+        store.finish_run(run_id, st.session_state.curriculum_id)
+    return run
+
+def persist_lesson(position, lesson):
+    """
+    Save an edited lesson to the curriculum and to the run checkpoint it came
+    from: Resume and Retry rebuild the curriculum from the checkpoints.
+    """
+    if st.session_state.curriculum_id:
+        store.update_lesson(st.session_state.curriculum_id, position, lesson)
+    if st.session_state.run_id:
+        store.update_run_lesson(st.session_state.run_id, position, lesson)
+
+def render_run_recovery():
+    """Offer resume / retry-failed-only actions for the session's current run."""
+    if st.session_state.generation_cancelled:
+        st.info("⛔ Generation cancelled. Finished topics were kept - resume any time.")
+        st.session_state.generation_cancelled = False
+    
+    if not st.session_state.run_id:
+        return
+    run = store.load_run(st.session_state.run_id, with_data=False)
+    if not run:
+        return
+    
+    pending = [(item["seq"], item["topic"]) for item in run["items"] if item["status"] == "pending"]
+    failed = [(item["seq"], item["topic"]) for item in run["items"] if item["status"] == "failed"]
+    if not pending and not failed:
+        return
+    
+    if pending:
+        st.warning(f"⏸️ Generation was interrupted with {len(pending)} topic(s) still to go.")
+    if failed:
+        st.warning(f"⚠️ {len(failed)} topic(s) failed: " + ", ".join(topic for seq, topic in failed))
+    
+    recover_col1, recover_col2 = st.columns(2)
+    with recover_col1:
+        if pending and st.button(f"⏯️ Resume ({len(pending)} remaining)", use_container_width=True):
+            run_generation(get_openai_client(), st.session_state.run_id, pending)
+            st.rerun()
+    with recover_col2:
+        if failed and st.button(f"🔁 Retry Failed Topics Only ({len(failed)})", use_container_width=True):
+            run_generation(get_openai_client(), st.session_state.run_id, failed)
+            st.rerun()
+
+
+# --- PENDING PART FILL-IN ---
+@st.cache_resource
+def get_fill_pool():
+    """Process-wide pool for filling in parts that missed their latency budget."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="eduplan-fill")
+
+def schedule_pending_fills():
+    """Start background fill-in for this session's lessons that have pending parts. Returns how many remain."""
+    jobs = st.session_state.fill_jobs
+    content = st.session_state.generated_content
+    remaining = 0
+    
+    for position, packed in enumerate(content):
+        if not packed.get('pending'):
+            continue
+        remaining += 1
+        job = jobs.get(position)
+        if job is not None and (not job.done() or job.exception() is None):
+            continue
+        
+        client = clients.checkout(openai_api_key)
+        models = dict(st.session_state.stage_models)
+        flow = session_flow()
+        
+        def fill(client=client, packed=packed, position=position,
+                 grade=st.session_state.grade_level, subject=st.session_state.subject_name,
+                 mode=st.session_state.mode, curriculum_id=st.session_state.curriculum_id,
+                 run_id=st.session_state.run_id):
+            pipeline.set_session(pipeline.GenerationSession(stage_models=models, flow=flow, priority="background"))
+            lesson = lesson_model.unpack(packed)
+            try:
+                pipeline.fill_pending(client, lesson, grade, subject, mode, curriculum_id, position, run_id)
+            finally:
+                clients.checkin(client)
+            # Unless the lesson was regenerated or adapted meanwhile
+            if content[position] is packed:
+                content[position] = lesson_model.pack(lesson)
+        
+        jobs[position] = get_fill_pool().submit(fill)
+    return remaining
+
+
+# --- BACKGROUND PRE-WARM ---
+def get_server_api_key():
+    """API key for background jobs, which have no sidebar input to read from."""
+    if os.environ.get("OPENAI_API_KEY"):
+        return os.environ["OPENAI_API_KEY"]
+    return st.secrets["OPENAI_API_KEY"] if "OPENAI_API_KEY" in st.secrets else None
+
+@st.cache_resource
+def start_prewarm_job():
+    """Start the process-wide off-peak pre-warm scheduler (once per server)."""
+    client = clients.checkout(get_server_api_key())
+    session = pipeline.GenerationSession(flow="prewarm", priority="background")
+    
+    def warm_toc(subject, grade):
+        pipeline.set_session(session)
+        return pipeline.prewarm_toc(client, subject, grade)
+    
+    def warm_lesson(subject, grade, mode, topic, seq):
+        pipeline.set_session(session)
+        return pipeline.prewarm_lesson(client, subject, grade, mode, topic, seq)
+    
+    job = prewarm.job_from_env(warm_toc, warm_lesson)
+    return job.start()
+
+if os.environ.get("EDUPLAN_PREWARM") == "1" and get_server_api_key():
+    prewarm_job = start_prewarm_job()
+    with st.sidebar:
+        with st.expander("🌙 Pre-warm"):
+            status = prewarm_job.status
+            st.caption(f"State: {status['state']} • window {prewarm_job.window[0]:02d}:00-{prewarm_job.window[1]:02d}:00")
+            st.caption(f"TOCs warmed: {status['tocs_warmed']} • Lessons warmed: {status['lessons_warmed']}")
+            st.caption(f"Tokens this run: {status['tokens_spent']:,} / {prewarm_job.token_budget:,}")
+            st.caption(f"Already cached: {status['cache_hits']} • Failures: {status['failures']}")
+
+
+# --- OFFLINE BULK GENERATION ---
+BULK_BACKENDS = ["OpenAI Batch API", "Local (synchronous)"]
+BULK_DIR = os.environ.get("EDUPLAN_BULK_DIR", "bulk_jobs")
+
+@st.cache_resource
+def get_bulk_jobs():
+    """Process-wide list of bulk jobs, so they keep running (and stay visible) across sessions."""
+    return []
+
+def start_bulk_job(entries, backend_name, work_dir=None):
+    """
+    Start an offline bulk job for (subject, grade, mode) entries on the
+    selected backend, or resume the one saved in `work_dir`.
+    """
+    client = clients.checkout(openai_api_key)
+    models = dict(st.session_state.stage_models)
+    backend = bulk.OpenAIBatchBackend(client) if backend_name == BULK_BACKENDS[0] else bulk.LocalBatchBackend(client)
+    work_dir = work_dir or os.path.join(BULK_DIR, time.strftime("%Y%m%d-%H%M%S"))
+    
+    def parse_lesson(subject, grade, mode, topic, text):
+        pipeline.set_session(pipeline.GenerationSession(stage_models=models, flow="bulk", priority="background"))
+        return pipeline.ingest_bulk_lesson(client, subject, grade, mode, topic, text)
+    
+    job = bulk.BulkJob(
+        backend,
+        entries,
+        toc_request=lambda subject, grade: pipeline.bulk_toc_request(subject, grade, models),
+        lesson_request=lambda subject, grade, mode, topic: pipeline.bulk_lesson_request(subject, grade, mode, topic, models),
+        parse_toc=pipeline.parse_topics,
+        parse_lesson=parse_lesson,
+        save=store.save_curriculum,
+        work_dir=work_dir,
+        poll_interval=int(os.environ.get("EDUPLAN_BULK_POLL_S", 60)),
+        meta={"backend": backend_name},
+        on_exit=lambda: clients.checkin(client)
+    )
+    jobs = get_bulk_jobs()
+    jobs[:] = [other for other in jobs if other.work_dir != work_dir]
+    jobs.append(job)
+    return job.start()
+
+with st.sidebar:
+    with st.expander("🏭 Bulk Generation"):
+        st.caption("Generate whole curricula offline at batch pricing. One 'Subject, Grade, Mode' per line.")
+        bulk_entries = st.text_area(
+            "Curricula", key="bulk_entries",
+            placeholder="Biology, 9, Physical (Classroom)\nChemistry, 10, Online (Virtual)"
+        )
+        bulk_backend = st.selectbox("Backend", BULK_BACKENDS, key="bulk_backend")
+        if st.button("🏭 Start Bulk Job", use_container_width=True, disabled=not openai_api_key):
+            try:
+                entries = bulk.parse_entries(bulk_entries)
+                if entries:
+                    start_bulk_job(entries, bulk_backend)
+                else:
+                    st.warning("Add at least one curriculum.")
+            except ValueError as e:
+                st.error(str(e))
+        
+        for job in reversed(get_bulk_jobs()):
+            status = job.status
+            st.caption(
+                f"📦 {len(job.entries)} curricula • {status['state']} • {status['round'] or '-'} round, attempt {status['attempt']}"
+            )
+            st.caption(
+                f"Requests ok {status['succeeded']} / failed {status['failed']}"
+                + (f" / stopped {status['stopped']}" if status['stopped'] else "")
+                + f" • tokens {status['tokens']:,} • saved {status['curricula_saved']}"
+            )
+            if status['failures']:
+                st.caption("Failed: " + ", ".join(sorted(status['failures'])[:5]))
+            if job.is_running():
+                if st.button("⏹️ Stop", key=f"stop_bulk_{job.work_dir}", use_container_width=True):
+                    job.stop()
+                    st.rerun()
+        
+        # Jobs stopped here, or interrupted by a restart, pick up from their saved state
+        running = {job.work_dir for job in get_bulk_jobs() if job.is_running()}
+        for work_dir, state in bulk.unfinished_jobs(BULK_DIR):
+            if work_dir in running:
+                continue
+            backend_name = state["meta"].get("backend", BULK_BACKENDS[0])
+            st.caption(
+                f"⏸️ {os.path.basename(work_dir)} • {len(state['entries'])} curricula • {backend_name} • "
+                f"saved {len(state['saved'])}"
+            )
+            if st.button("⏯️ Resume", key=f"resume_bulk_{work_dir}", use_container_width=True, disabled=not openai_api_key):
+                start_bulk_job([tuple(entry) for entry in state["entries"]], backend_name, work_dir)
+                st.rerun()
+
+
 # --- MAIN APP ---
-st.markdown("""
-    <div class="main-header">
-        <h1 style="margin:0; font-size: 42px;">🎓 EduPlan Pro</h1>
-        <p style="margin:10px 0 0 0; font-size: 18px; opacity: 0.9;">AI-Powered US Curriculum Designer</p>
-    </div>
-""", unsafe_allow_html=True)
 
 # STEP 1: Input Form
 if not st.session_state.topics:
@@ -796,15 +965,77 @@ if not st.session_state.topics:
                 
                 client = get_openai_client()
                 with st.spinner("🧠 Analyzing curriculum standards and generating topics..."):
-                    toc = get_table_of_contents(client, grade, subject)
+                    if QUEUE_ENABLED:
+                        toc = queued_toc(grade, subject)
+                    else:
+                        toc, cached = pipeline.cached_toc(client, grade, subject)
                     if toc:
                         st.session_state.toc_text = toc
-                        st.session_state.topics = parse_topics(toc)
+                        st.session_state.topics = pipeline.parse_topics(toc)
+                        st.session_state.speculation_suppressed = False
                         if st.session_state.topics:
                             st.success(f"✅ Generated {len(st.session_state.topics)} topics!")
                             st.rerun()
                         else:
                             st.error("Failed to parse topics. Please try again.")
+    
+    # Runs interrupted by a refresh, dropped connection or error can pick up where they stopped
+    unfinished = store.list_unfinished_runs(st.session_state.owner)
+    if unfinished:
+        st.markdown("<br>", unsafe_allow_html=True)
+        with st.expander(f"⏯️ Unfinished Runs ({len(unfinished)})"):
+            for row in unfinished:
+                run_col1, run_col2, run_col3 = st.columns([4, 1, 1])
+                with run_col1:
+                    st.markdown(
+                        f"**{row['subject']}** - Grade {row['grade']} • {row['mode']} • "
+                        f"{row['done']} done, {row['pending']} pending, {row['failed']} failed"
+                    )
+                with run_col2:
+                    if st.button("⏯️ Open", key=f"open_run_{row['id']}", use_container_width=True):
+                        sync_run_to_session(row["id"])
+                        st.rerun()
+                with run_col3:
+                    if st.button("🗑️ Discard", key=f"discard_run_{row['id']}", use_container_width=True):
+                        store.discard_run(row["id"], st.session_state.owner)
+                        st.rerun()
+    
+    # Saved curricula open straight into Step 3 with no API calls
+    st.markdown("<br>", unsafe_allow_html=True)
+    with st.expander("📚 My Curricula"):
+        filter_col1, filter_col2, filter_col3 = st.columns([2, 1, 1])
+        with filter_col1:
+            filter_subject = st.text_input("Subject", key="store_filter_subject").strip()
+        with filter_col2:
+            filter_grade = st.text_input("Grade", key="store_filter_grade").strip()
+        with filter_col3:
+            filter_mode = st.selectbox("Mode", ["Any", "Physical (Classroom)", "Online (Virtual)"], key="store_filter_mode")
+        
+        saved = store.list_curricula(
+            subject=filter_subject or None,
+            grade=filter_grade or None,
+            mode=None if filter_mode == "Any" else filter_mode
+        )
+        if not saved:
+            st.caption("No saved curricula yet.")
+        
+        for row in saved:
+            row_col1, row_col2 = st.columns([4, 1])
+            with row_col1:
+                created = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["created_at"]))
+                st.markdown(f"**{row['subject']}** - Grade {row['grade']} • {row['mode']} • {row['lesson_count']} lessons • {created}")
+            with row_col2:
+                if st.button("📂 Open", key=f"open_curriculum_{row['id']}", use_container_width=True):
+                    curriculum = store.load_curriculum(row["id"], decode=lesson_model.pack)
+                    st.session_state.subject_name = curriculum["subject"]
+                    st.session_state.grade_level = curriculum["grade"]
+                    st.session_state.mode = curriculum["mode"]
+                    st.session_state.toc_text = curriculum["toc_text"]
+                    st.session_state.topics = curriculum["topics"]
+                    st.session_state.generated_content = curriculum["lessons"]
+                    st.session_state.curriculum_id = curriculum["id"]
+                    st.session_state.run_id = None
+                    st.rerun()
 
 # STEP 2: Topic Selection
 elif not st.session_state.generated_content:
@@ -823,6 +1054,8 @@ elif not st.session_state.generated_content:
             for i, topic in enumerate(st.session_state.topics[mid_point:], mid_point + 1):
                 st.markdown(f"**{i}.** {topic}")
     
+    render_run_recovery()
+    
     st.markdown("---")
     st.markdown("### 📝 Step 2: Generate Detailed Lesson Plans")
     
@@ -847,43 +1080,108 @@ elif not st.session_state.generated_content:
     else:
         selected_topics = [(i+1, t) for i, t in enumerate(st.session_state.topics)]
     
+    # Speculatively generate the selected lessons while the teacher decides
+    if openai_api_key and not st.session_state.ab_test_enabled and not QUEUE_ENABLED and speculation_allowed():
+        if st.session_state.speculator is None:
+            st.session_state.speculator = start_speculation()
+        st.session_state.speculator.reprioritize(selected_topics)
+        done, running, pending = st.session_state.speculator.progress()
+        if done or running:
+            st.caption(f"⚡ {done} lesson(s) ready, {running} in progress in the background")
+    
     st.markdown("<br>", unsafe_allow_html=True)
     
     if st.button(f"✨ Generate {len(selected_topics)} Lesson Plan(s)", type="primary", use_container_width=True):
         if not selected_topics:
             st.warning("⚠️ Please select at least one topic")
         else:
+            client = get_openai_client()
+            st.session_state.run_id = store.create_run(
+                st.session_state.subject_name,
+                st.session_state.grade_level,
+                st.session_state.mode,
+                st.session_state.toc_text,
+                st.session_state.topics,
+                selected_topics,
+                owner=st.session_state.owner
+            )
+            
+            run = run_generation(client, st.session_state.run_id, selected_topics)
+            
+            if all(item["status"] == "done" for item in run["items"]):
+                st.success("✅ All lesson plans generated!")
+                st.balloons()
+            st.rerun()
+
+# STEP 3: Display Generated Content
+else:
+    st.success(f"🎉 Complete Curriculum: **{st.session_state.subject_name} - Grade {st.session_state.grade_level}** ({len(st.session_state.generated_content)} Topics)")
+    
+    render_run_recovery()
+    
+    # Parts that missed their latency budget are filled in in the background
+    if openai_api_key:
+        still_pending = schedule_pending_fills()
+        if still_pending:
+            fill_col1, fill_col2 = st.columns([4, 1])
+            with fill_col1:
+                st.info(f"⏳ {still_pending} topic(s) are still filling in sections or videos that missed their time budget.")
+            with fill_col2:
+                if st.button("🔄 Refresh", use_container_width=True):
+                    st.rerun()
+    
+    # Switch mode / adjacent grade without regenerating the whole curriculum
+    with st.expander("🔁 Switch Learning Mode or Grade"):
+        adapt_col1, adapt_col2 = st.columns(2)
+        with adapt_col1:
+            modes = ["Physical (Classroom)", "Online (Virtual)"]
+            new_mode = st.radio("🏫 Learning Mode", modes, index=modes.index(st.session_state.mode), key="adapt_mode")
+        with adapt_col2:
+            new_grade = st.text_input("🎯 Grade Level", value=st.session_state.grade_level, key="adapt_grade").strip()
+        
+        mode_changed = new_mode != st.session_state.mode
+        grade_changed = new_grade != st.session_state.grade_level
+        
+        if grade_changed and not pipeline.is_adjacent_grade(st.session_state.grade_level, new_grade):
+            st.warning("⚠️ Only adjacent grades can be adapted. Start a new curriculum for larger grade changes.")
+        elif st.button("🔁 Apply Changes", disabled=not (mode_changed or grade_changed), use_container_width=True):
             client = get_openai_client()
             progress_bar = st.progress(0)
             status = st.empty()
+            lessons = st.session_state.generated_content
             
-            for i, (seq, topic_name) in enumerate(selected_topics):
-                status.info(f"⏳ Generating: **{topic_name}** ({i+1}/{len(selected_topics)})")
+            for i, packed in enumerate(lessons):
+                lesson = lesson_model.unpack(packed)
+                status.info(f"⏳ Adapting: **{lesson.get('title', '')}** ({i+1}/{len(lessons)})")
                 
-                data, tokens = generate_topic_content(
-                    client, 
-                    st.session_state.grade_level, 
-                    st.session_state.subject_name, 
-                    st.session_state.mode, 
-                    topic_name, 
-                    seq
+                adapted, tokens = pipeline.adapt_lesson(
+                    client,
+                    lesson,
+                    new_grade,
+                    st.session_state.subject_name,
+                    new_mode,
+                    mode_changed,
+                    grade_changed
                 )
                 
-                if data:
-                    st.session_state.generated_content.append(data)
+                if adapted:
+                    lessons[i] = lesson_model.pack(adapted)
+                    persist_lesson(i, adapted)
                 
-                progress_bar.progress((i + 1) / len(selected_topics))
+                progress_bar.progress((i + 1) / len(lessons))
             
-            status.success("✅ All lesson plans generated!")
-            st.balloons()
+            st.session_state.mode = new_mode
+            st.session_state.grade_level = new_grade
+            if st.session_state.curriculum_id:
+                store.update_curriculum_meta(st.session_state.curriculum_id, new_grade, new_mode)
+            if st.session_state.run_id:
+                store.update_run_meta(st.session_state.run_id, new_grade, new_mode)
+            status.success("✅ Curriculum adapted!")
             st.rerun()
-
-# STEP 3: Display Generated Content
-else:
-    st.success(f"🎉 Complete Curriculum: **{st.session_state.subject_name} - Grade {st.session_state.grade_level}** ({len(st.session_state.generated_content)} Topics)")
     
     # Display each topic
-    for idx, item in enumerate(st.session_state.generated_content):
+    for idx, packed in enumerate(st.session_state.generated_content):
+        item = lesson_model.unpack(packed)
         
         st.markdown(f"""
             <div class="topic-card">
@@ -954,5 +1252,62 @@ else:
             
             st.markdown('</div>', unsafe_allow_html=True)
         
+        # Section-level regeneration: one small call patches this topic only
+        regen_col1, regen_col2 = st.columns([3, 1])
+        with regen_col1:
+            section = st.selectbox(
+                "Regenerate section",
+                list(REGENERABLE_SECTIONS),
+                format_func=REGENERABLE_SECTIONS.get,
+                key=f"regen_section_{idx}",
+                label_visibility="collapsed"
+            )
+        with regen_col2:
+            if st.button("♻️ Regenerate", key=f"regen_btn_{idx}", use_container_width=True):
+                client = get_openai_client()
+                with st.spinner(f"Regenerating {REGENERABLE_SECTIONS[section].lower()}..."):
+                    value, tokens = pipeline.regenerate_section(
+                        client,
+                        st.session_state.grade_level,
+                        st.session_state.subject_name,
+                        st.session_state.mode,
+                        item.get('title', ''),
+                        section
+                    )
+                if value:
+                    item[section] = value
+                    st.session_state.generated_content[idx] = lesson_model.pack(item)
+                    persist_lesson(idx, item)
+                    st.rerun()
+        
         st.markdown('</div>', unsafe_allow_html=True)
-        st.markdown("<br><br>", unsafe_allow_html=True)
\ No newline at end of file
+        st.markdown("<br><br>", unsafe_allow_html=True)
+
+
+# --- SESSION MEMORY BUDGETS ---
+# Skipped by runs cut short with st.rerun()/st.stop(); the next run reports in.
+get_session_memory().end(run_ctx.session_id, run_ctx.session_state)
+
+
+# --- STARTUP AND RERUN TIMING ---
+# Runs cut short by st.rerun()/st.stop() aren't recorded.
+rerun_s = time.perf_counter() - RERUN_START
+timings = get_timings()
+if timings["cold_start"] is None:
+    timings["cold_start"] = (first_paint_s, rerun_s)
+else:
+    timings["reruns"].append((first_paint_s, rerun_s))
+
+with st.sidebar:
+    with st.expander("⏱️ Performance"):
+        cold_paint, cold_total = timings["cold_start"]
+        st.caption(f"Cold start: first paint {cold_paint * 1000:.0f} ms, full run {cold_total * 1000:.0f} ms")
+        if timings["reruns"]:
+            paints = sorted(paint for paint, total in timings["reruns"])
+            totals = sorted(total for paint, total in timings["reruns"])
+            p50, p95 = len(totals) // 2, min(len(totals) - 1, int(0.95 * len(totals)))
+            st.caption(
+                f"Reruns ({len(totals)}): first paint p50 {paints[p50] * 1000:.0f} ms • "
+                f"full run p50 {totals[p50] * 1000:.0f} ms, p95 {totals[p95] * 1000:.0f} ms"
+            )
+        st.caption(f"This run: first paint {first_paint_s * 1000:.0f} ms, full run {rerun_s * 1000:.0f} ms")
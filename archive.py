@@ -0,0 +1,322 @@
+import io
+import sys
+import json
+import mmap
+import zlib
+import struct
+import argparse
+import importlib.util
+
+import curriculum_store as store
+
+# --- CURRICULUM ARCHIVES ---
+# A compact file format for saving and sharing whole curricula:
+#
+#   header   magic, format version, codec, encoding, index length
+#   index    curriculum fields (subject, grade, mode, toc_text, topics, ...)
+#            plus each topic's title and the offset/length of its block
+#   blocks   one independently compressed block per lesson
+#
+# Reading a topic maps the file, decodes the small index and decompresses
+# just that topic's block. Blocks are compressed against a preset dictionary
+# of the lesson keys and common values, so even a single small lesson
+# doesn't pay to spell out every key again. zstd and msgpack are used when
+# installed (zstandard, msgpack), stdlib zlib and JSON otherwise; an archive
+# records what it was written with, and reading it needs the same modules.
+#
+#   python archive.py export 12 physics-9.eduplan
+#   python archive.py import physics-9.eduplan
+#   python archive.py show physics-9.eduplan --topic 3
+#   python archive.py from-json curricula_out/physics-grade-9.json physics-9.eduplan
+
+MAGIC = b"EDUPLAN\x00"
+VERSION = 1
+HEADER = struct.Struct(">8sBBBxI")
+CODECS = {"zlib": 1, "zstd": 2}
+ENCODINGS = {"json": 1, "msgpack": 2}
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 19
+# Part of the format: changing it needs a new VERSION
+PRESET_DICT = json.dumps({
+    "title": "", "overview": "", "objectives": [], "materials": [],
+    "experiment": {"title": "", "steps": []},
+    "videos": [{
+        "type": "Theory", "search_query": "", "video_id": "", "real_url": "https://www.youtube.com/watch?v=",
+        "title": "", "channel": "", "duration": "", "description": "",
+        "search_url": "https://www.youtube.com/results?search_query=",
+    }, {"type": "Experiment Demo"}],
+    "pending": ["videos"],
+}, separators=(",", ":")).encode()
+
+
+def _available(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def default_codec():
+    return "zstd" if _available("zstandard") else "zlib"
+
+
+def default_encoding():
+    return "msgpack" if _available("msgpack") else "json"
+
+
+def available_formats():
+    """(codec, encoding) pairs this install can read and write."""
+    codecs = ["zlib"] + (["zstd"] if _available("zstandard") else [])
+    encodings = ["json"] + (["msgpack"] if _available("msgpack") else [])
+    return [(codec, encoding) for codec in codecs for encoding in encodings]
+
+
+def _encode(value, encoding):
+    if encoding == "msgpack":
+        import msgpack
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _decode(data, encoding):
+    if encoding == "msgpack":
+        import msgpack
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        import zstandard
+        preset = zstandard.ZstdCompressionDict(PRESET_DICT, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=preset).compress(data)
+    compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, zdict=PRESET_DICT)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        import zstandard
+        preset = zstandard.ZstdCompressionDict(PRESET_DICT, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        return zstandard.ZstdDecompressor(dict_data=preset).decompress(data)
+    decompressor = zlib.decompressobj(-15, zdict=PRESET_DICT)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def write_archive(target, curriculum, codec=None, encoding=None):
+    """
+    Write a curriculum (generate_curriculum's dict: subject, grade, mode,
+    toc_text, topics, lessons, ...) to a path or binary file object.
+    Lessons that failed (None) are kept as such. Returns the bytes written.
+    """
+    codec = codec or default_codec()
+    encoding = encoding or default_encoding()
+    lessons = curriculum.get("lessons") or []
+    topics = curriculum.get("topics") or []
+
+    blocks, entries, offset = [], [], 0
+    for position, lesson in enumerate(lessons):
+        block = _compress(_encode(lesson, encoding), codec)
+        if lesson:
+            title = lesson.get("title", "")
+        else:
+            title = topics[position] if position < len(topics) else ""
+        entries.append([title, offset, len(block)])
+        blocks.append(block)
+        offset += len(block)
+
+    meta = {k: v for k, v in curriculum.items() if k != "lessons"}
+    index = _compress(_encode({"meta": meta, "topics": entries}, encoding), codec)
+    header = HEADER.pack(MAGIC, VERSION, CODECS[codec], ENCODINGS[encoding], len(index))
+
+    if isinstance(target, (str, bytes)) or hasattr(target, "__fspath__"):
+        with open(target, "wb") as f:
+            return _write(f, header, index, blocks)
+    return _write(target, header, index, blocks)
+
+
+def _write(f, header, index, blocks):
+    f.write(header)
+    f.write(index)
+    for block in blocks:
+        f.write(block)
+    return len(header) + len(index) + sum(len(block) for block in blocks)
+
+
+def archive_bytes(curriculum, codec=None, encoding=None):
+    buffer = io.BytesIO()
+    write_archive(buffer, curriculum, codec, encoding)
+    return buffer.getvalue()
+
+
+class CurriculumArchive:
+    """
+    Read-only, list-like view of an archive: the index is decoded on open and
+    each lesson only when it's accessed. Opens a path (memory-mapped) or
+    wraps bytes already in memory.
+    """
+
+    def __init__(self, source):
+        self._file = None
+        self._map = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._data = memoryview(source)
+        else:
+            self._file = open(source, "rb")
+            try:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self._file.close()
+                raise ValueError(f"{source}: empty file, not an EduPlan archive")
+            self._data = memoryview(self._map)
+
+        if len(self._data) < HEADER.size:
+            self.close()
+            raise ValueError("not an EduPlan archive (truncated header)")
+        magic, version, codec, encoding, index_length = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("not an EduPlan archive")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"unsupported archive version {version} (this build reads {VERSION})")
+        self.codec = {v: k for k, v in CODECS.items()}.get(codec)
+        self.encoding = {v: k for k, v in ENCODINGS.items()}.get(encoding)
+        if self.codec is None or self.encoding is None:
+            self.close()
+            raise ValueError(f"unknown archive codec {codec} or encoding {encoding}")
+
+        index_end = HEADER.size + index_length
+        try:
+            index = _decode(_decompress(bytes(self._data[HEADER.size:index_end]), self.codec), self.encoding)
+        except Exception as e:
+            self.close()
+            raise ValueError(f"corrupt archive index: {e}") from e
+        self.meta = index["meta"]
+        self._entries = index["topics"]
+        self._base = index_end
+
+    @property
+    def titles(self):
+        return [title for title, offset, length in self._entries]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def __getitem__(self, position):
+        title, offset, length = self._entries[position]
+        start = self._base + offset
+        return _decode(_decompress(self._data[start:start + length], self.codec), self.encoding)
+
+    def __iter__(self):
+        for position in range(len(self._entries)):
+            yield self[position]
+
+    def to_curriculum(self):
+        """The whole curriculum dict, lessons included."""
+        return dict(self.meta, lessons=list(self))
+
+    def close(self):
+        self._data.release()
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def open_archive(source):
+    return CurriculumArchive(source)
+
+
+def read_archive(source):
+    """Load a whole curriculum dict from an archive path or bytes."""
+    with CurriculumArchive(source) as archive:
+        return archive.to_curriculum()
+
+
+def export_curriculum(curriculum_id, target, codec=None, encoding=None, db_path=None):
+    """Write a stored curriculum to an archive. Returns the bytes written."""
+    curriculum = store.load_curriculum(curriculum_id, db_path)
+    if curriculum is None:
+        raise ValueError(f"no curriculum with id {curriculum_id}")
+    return write_archive(target, {
+        "subject": curriculum["subject"],
+        "grade": curriculum["grade"],
+        "mode": curriculum["mode"],
+        "toc_text": curriculum["toc_text"],
+        "topics": curriculum["topics"],
+        "lessons": list(curriculum["lessons"]),
+    }, codec, encoding)
+
+
+def import_archive(source, db_path=None):
+    """Save an archived curriculum to the store. Returns the new curriculum id."""
+    curriculum = read_archive(source)
+    return store.save_curriculum(
+        curriculum["subject"], curriculum["grade"], curriculum["mode"], curriculum.get("toc_text", ""),
+        curriculum.get("topics", []), [lesson for lesson in curriculum["lessons"] if lesson], db_path
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, import and inspect EduPlan curriculum archives.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write a stored curriculum to an archive")
+    export.add_argument("curriculum_id", type=int)
+    export.add_argument("path")
+    imp = commands.add_parser("import", help="Save an archive's curriculum to the store")
+    imp.add_argument("path")
+    show = commands.add_parser("show", help="List an archive's topics, or print one topic as JSON")
+    show.add_argument("path")
+    show.add_argument("--topic", type=int, help="1-based topic number")
+    from_json = commands.add_parser("from-json", help="Convert a cli.py JSON curriculum to an archive")
+    from_json.add_argument("json_path")
+    from_json.add_argument("path")
+    to_json = commands.add_parser("to-json", help="Convert an archive back to JSON")
+    to_json.add_argument("path")
+    to_json.add_argument("json_path")
+    for command in (export, from_json):
+        command.add_argument("--codec", choices=sorted(CODECS), help=f"Default: {default_codec()}")
+        command.add_argument("--encoding", choices=sorted(ENCODINGS), help=f"Default: {default_encoding()}")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            size = export_curriculum(args.curriculum_id, args.path, args.codec, args.encoding)
+            print(f"Wrote {args.path} ({size:,} bytes)")
+        elif args.command == "import":
+            print(f"Imported as curriculum {import_archive(args.path)}")
+        elif args.command == "from-json":
+            with open(args.json_path) as f:
+                size = write_archive(args.path, json.load(f), args.codec, args.encoding)
+            print(f"Wrote {args.path} ({size:,} bytes)")
+        elif args.command == "to-json":
+            with open(args.json_path, "w") as f:
+                json.dump(read_archive(args.path), f, indent=2)
+            print(f"Wrote {args.json_path}")
+        else:
+            with open_archive(args.path) as archive:
+                if args.topic:
+                    json.dump(archive[args.topic - 1], sys.stdout, indent=2)
+                    print()
+                else:
+                    meta = archive.meta
+                    print(f"{meta.get('subject')} - Grade {meta.get('grade')} • {meta.get('mode')} "
+                          f"({archive.codec}/{archive.encoding}, {len(archive)} topics)")
+                    for number, title in enumerate(archive.titles, 1):
+                        print(f"{number:3}. {title}")
+    except (OSError, ValueError, IndexError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
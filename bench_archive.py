@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import archive
+import bench_memory
+
+# --- ARCHIVE FORMAT BENCHMARK ---
+# Compares a curriculum saved as plain JSON (as cli.py writes it) with the
+# .eduplan archive in each available codec/encoding: file size, loading the
+# whole curriculum, and reading one topic.
+#
+#   python bench_archive.py --topics 12 --videos 12 --repeat 50
+
+
+def best_time(fn, repeat):
+    """Fastest of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the curriculum archive format against JSON.")
+    parser.add_argument("--topics", type=int, default=12)
+    parser.add_argument("--videos", type=int, default=12, help="Videos per topic")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    lessons = bench_memory.make_curriculum(args.topics, args.videos)
+    curriculum = {
+        "subject": "Physics", "grade": "9", "mode": "Physical (Classroom)",
+        "toc_text": "\n".join(f"{n}. {lesson['title']}" for n, lesson in enumerate(lessons, 1)),
+        "topics": [lesson["title"] for lesson in lessons],
+        "lessons": lessons,
+    }
+    middle = len(lessons) // 2
+
+    formats = [("json", None, None)]
+    formats += [(f"{codec}+{encoding}", codec, encoding) for codec, encoding in archive.available_formats()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Curriculum: {args.topics} topics x {args.videos} videos")
+        print(f"{'format':>14} {'bytes':>10} {'ratio':>6} {'full load':>10} {'one topic':>10}")
+        json_size = None
+        for name, codec, encoding in formats:
+            path = os.path.join(tmp, name)
+            if codec is None:
+                with open(path, "w") as f:
+                    json.dump(curriculum, f, indent=2)
+
+                def load_all():
+                    with open(path) as f:
+                        return json.load(f)
+
+                def load_one():
+                    with open(path) as f:
+                        return json.load(f)["lessons"][middle]
+            else:
+                archive.write_archive(path, curriculum, codec, encoding)
+                assert archive.read_archive(path) == curriculum
+
+                def load_all():
+                    return archive.read_archive(path)
+
+                def load_one():
+                    with archive.open_archive(path) as opened:
+                        return opened[middle]
+
+            size = os.path.getsize(path)
+            json_size = json_size or size
+            print(
+                f"{name:>14} {size:>10,} {json_size / size:>5.1f}x "
+                f"{best_time(load_all, args.repeat) * 1000:>8.2f}ms {best_time(load_one, args.repeat) * 1000:>8.2f}ms"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
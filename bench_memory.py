@@ -0,0 +1,102 @@
+import gc
+import sys
+import json
+import random
+import argparse
+import tracemalloc
+
+import lesson_model
+
+# --- SESSION MEMORY BENCHMARK ---
+# Measures what session state retains per curriculum: the lesson dicts the
+# pipeline produces versus the compact lesson model. Each simulated session
+# decodes its own copy of a realistic curriculum from JSON, as sessions
+# loading or generating separately would, so nothing is shared by accident.
+#
+#   python bench_memory.py --topics 12 --videos 12 --sessions 100
+
+CHANNELS = [
+    "Khan Academy", "CrashCourse", "National Geographic", "TED-Ed", "SciShow", "Veritasium",
+    "Amoeba Sisters", "The Organic Chemistry Tutor", "Bozeman Science", "Physics Girl",
+    "MinutePhysics", "Smarter Every Day", "Professor Dave Explains", "FuseSchool", "PBS Eons",
+]
+WORDS = (
+    "energy force motion cell atom molecule reaction wave light sound heat pressure planet orbit "
+    "ecosystem species gene protein circuit current voltage magnet fossil climate water rock "
+    "experiment observe measure compare predict model evidence structure function system"
+).split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_curriculum(topics, videos, seed=0):
+    """A curriculum in the generate_topic_content dict shape, with resolved videos."""
+    rng = random.Random(seed)
+    lessons = []
+    for t in range(topics):
+        title = f"Topic {t + 1}: {sentence(rng, 3)[:-1]}"
+        lesson_videos = []
+        for v in range(videos):
+            video_id = "".join(rng.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJ0123456789_-") for _ in range(11))
+            lesson_videos.append({
+                "type": "Theory" if v % 2 == 0 else "Experiment Demo",
+                "search_query": f"{title} {sentence(rng, 3)}",
+                "video_id": video_id,
+                "real_url": f"https://www.youtube.com/watch?v={video_id}",
+                "title": sentence(rng, 7),
+                "channel": rng.choice(CHANNELS),
+                "duration": f"{rng.randint(2, 15)}:{rng.randint(0, 59):02d}",
+                "description": sentence(rng, 25),
+            })
+        lessons.append({
+            "title": title,
+            "overview": " ".join(sentence(rng, 14) for _ in range(4)),
+            "objectives": [sentence(rng, 10) for _ in range(5)],
+            "materials": [sentence(rng, 3) for _ in range(8)],
+            "experiment": {"title": sentence(rng, 4), "steps": [sentence(rng, 14) for _ in range(7)]},
+            "videos": lesson_videos,
+        })
+    return lessons
+
+
+def retained(blob, sessions, convert):
+    """Bytes still allocated after building `sessions` curricula from blob with convert()."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = [convert(json.loads(blob)) for _ in range(sessions)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(held) == sessions
+    return after - before
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark session memory per curriculum.")
+    parser.add_argument("--topics", type=int, default=12)
+    parser.add_argument("--videos", type=int, default=12, help="Videos per topic")
+    parser.add_argument("--sessions", type=int, default=100, help="Concurrent sessions to simulate")
+    args = parser.parse_args(argv)
+
+    lessons = make_curriculum(args.topics, args.videos)
+    assert lesson_model.unpack_all(lesson_model.pack_all(lessons)) == lessons
+    blob = json.dumps(lessons)
+
+    print(f"Curriculum: {args.topics} topics x {args.videos} videos, {len(blob) / 1024:.0f} KiB as JSON")
+    results = {}
+    for name, convert in (("dicts", lambda lessons: lessons), ("compact", lesson_model.pack_all)):
+        total = retained(blob, args.sessions, convert)
+        results[name] = total
+        print(
+            f"{name:>8}: {total / args.sessions / 1024:8.1f} KiB per curriculum, "
+            f"{total / 1024 / 1024:6.1f} MiB per {args.sessions} sessions"
+        )
+    print(f"Saved: {100 * (1 - results['compact'] / results['dicts']):.0f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+# --- STARTUP AND RERUN BENCHMARK ---
+# Measures app.py headlessly with Streamlit's AppTest: the cold first run in a
+# fresh interpreter (imports included), the cost of a rerun once warm, and
+# which heavy modules the Step 1 form pulled in.
+#
+#   python bench_startup.py --cold 5 --reruns 50
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+HEAVY_MODULES = ["openai", "pandas", "httpx"]
+
+
+def measure(reruns):
+    """Run in a child process: one cold run, then `reruns` warm reruns. Prints JSON."""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP, default_timeout=60)
+    app.secrets["OPENAI_API_KEY"] = "sk-bench"
+    app.run()
+    cold = time.perf_counter() - start
+    if app.exception:
+        raise SystemExit(f"app raised: {app.exception[0].message}")
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    warm = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        warm.append(time.perf_counter() - start)
+    print(json.dumps({"cold": cold, "warm": warm, "loaded": loaded}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark EduPlan cold start and rerun cost.")
+    parser.add_argument("--cold", type=int, default=5, help="Fresh-interpreter cold runs")
+    parser.add_argument("--reruns", type=int, default=50, help="Warm reruns per cold run")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return measure(args.reruns)
+
+    colds, warms, loaded = [], [], set()
+    for _ in range(args.cold):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", "--reruns", str(args.reruns)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        colds.append(result["cold"])
+        warms += result["warm"]
+        loaded.update(result["loaded"])
+
+    warms.sort()
+    print(f"Cold first run: median {statistics.median(colds) * 1000:.0f} ms over {len(colds)} interpreters")
+    if warms:
+        print(
+            f"Warm rerun: p50 {warms[len(warms) // 2] * 1000:.1f} ms, "
+            f"p95 {warms[min(len(warms) - 1, int(0.95 * len(warms)))] * 1000:.1f} ms over {len(warms)} reruns"
+        )
+    print(f"Heavy modules loaded by the Step 1 form: {', '.join(sorted(loaded)) or 'none'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import threading
+import logging
+
+# --- OFFLINE BULK GENERATION ---
+# Generates whole curricula for district-wide rollouts through an OpenAI
+# Batch API style flow: requests are written to JSONL files, submitted as a
+# batch, polled, and the results ingested into the curriculum store. Batch
+# requests cost half as much as synchronous ones and a 24h turnaround is fine
+# for overnight runs.
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def batch_request(custom_id, body):
+    """One line of a Batch API input file."""
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def write_requests(path, requests):
+    with open(path, "w") as f:
+        for custom_id, body in requests.items():
+            f.write(json.dumps(batch_request(custom_id, body)) + "\n")
+
+
+def read_results(path):
+    """
+    Parse a Batch API output (or error) file into {custom_id: (content, tokens, error)};
+    exactly one of content/error is set per request.
+    """
+    results = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                error = item.get("error") or body.get("error") or {"message": f"HTTP {response.get('status_code')}"}
+                results[item["custom_id"]] = (None, 0, error.get("message", str(error)))
+                continue
+            content = body["choices"][0]["message"]["content"]
+            tokens = (body.get("usage") or {}).get("total_tokens", 0)
+            results[item["custom_id"]] = (content, tokens, None)
+    return results
+
+
+class OpenAIBatchBackend:
+    """Submits request files to the OpenAI Batch API and downloads the results."""
+
+    def __init__(self, client, completion_window="24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=self.completion_window
+        )
+        return batch.id
+
+    def poll(self, batch_id, output_path):
+        """Return the batch status, writing results (successes and errors) to output_path once it has ended."""
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in ("completed", "failed", "expired", "cancelled"):
+            return batch.status
+        with open(output_path, "w") as f:
+            # Requests that never ran (expired/cancelled batches) are simply
+            # absent from both files and get resubmitted
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).text)
+        return batch.status
+
+
+class LocalBatchBackend:
+    """
+    Stand-in for the Batch API that runs each request synchronously through
+    a chat-completions client on submit. For testing and small runs; no discount.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._outputs = {}
+
+    def submit(self, path):
+        batch_id = f"local-{len(self._outputs) + 1}-{int(time.time())}"
+        lines = []
+        with open(path) as f:
+            for line in f:
+                request = json.loads(line)
+                try:
+                    response = self.client.chat.completions.create(**request["body"])
+                    body = {
+                        "choices": [{"message": {"content": response.choices[0].message.content}}],
+                        "usage": {"total_tokens": response.usage.total_tokens if response.usage else 0},
+                    }
+                    lines.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None})
+                except Exception as e:
+                    lines.append({"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}})
+        self._outputs[batch_id] = lines
+        return batch_id
+
+    def poll(self, batch_id, output_path):
+        with open(output_path, "w") as f:
+            for line in self._outputs.pop(batch_id, []):
+                f.write(json.dumps(line) + "\n")
+        return "completed"
+
+
+class BulkJob:
+    """
+    Generates a curriculum for every (subject, grade, mode) entry in two batch
+    rounds - all TOCs, then every topic's lesson - through `backend`, using
+    the supplied callables:
+
+    - toc_request(subject, grade) -> chat-completions request body
+    - lesson_request(subject, grade, mode, topic) -> chat-completions request body
+    - parse_toc(text) -> topics
+    - parse_lesson(subject, grade, mode, topic, text) -> lesson dict (raises on unusable output)
+    - save(subject, grade, mode, toc_text, topics, lessons) -> curriculum id
+    - on_exit() (optional), called once run() returns however it ended, e.g.
+      to hand back the backend's client
+
+    Requests that fail or return unusable output are resubmitted in a smaller
+    follow-up batch, up to `max_attempts` times. A curriculum is saved with
+    the lessons that succeeded; topics that never did are listed in status.
+    Progress is kept in `work_dir/state.json`, along with the entries and the
+    caller's `meta` (e.g. which backend it ran on), so a stopped or
+    interrupted job can be listed by unfinished_jobs() and resumed on the same
+    work_dir; it re-polls its open batch instead of paying for it twice.
+    """
+
+    def __init__(self, backend, entries, toc_request, lesson_request, parse_toc, parse_lesson, save,
+                 work_dir, max_attempts=3, poll_interval=60, meta=None, on_exit=None):
+        self.backend = backend
+        self.entries = [(subject, str(grade), mode) for subject, grade, mode in entries]
+        self.toc_request = toc_request
+        self.lesson_request = lesson_request
+        self.parse_toc = parse_toc
+        self.parse_lesson = parse_lesson
+        self.save = save
+        self.work_dir = work_dir
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.on_exit = on_exit or (lambda: None)
+        self.stop_event = threading.Event()
+        self.status = {
+            "state": "idle",
+            "round": None,
+            "attempt": 0,
+            "requests": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "stopped": 0,
+            "tokens": 0,
+            "curricula_saved": 0,
+            "failures": {},
+        }
+        self._thread = None
+        os.makedirs(work_dir, exist_ok=True)
+        self.state_path = os.path.join(work_dir, "state.json")
+        self.state = self._load_state()
+        self.state.setdefault("entries", [list(entry) for entry in self.entries])
+        self.state.setdefault("meta", meta or {})
+        self.state.setdefault("finished", False)
+        self._save_state()
+
+    def _load_state(self):
+        return load_state(self.work_dir) or {"results": {}, "open_batch": None, "saved": []}
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _run_round(self, name, requests, parse):
+        """
+        Submit `requests` ({custom_id: body}) as batches until each has a parsed
+        result or has failed `max_attempts` times. Returns {custom_id: parsed}.
+        """
+        results = self.state["results"]
+        self.status.update(round=name, requests=self.status["requests"] + len(requests))
+        errors = {}
+
+        for attempt in range(1, self.max_attempts + 1):
+            todo = {cid: body for cid, body in requests.items() if cid not in results}
+            if not todo or self.stop_event.is_set():
+                break
+            self.status["attempt"] = attempt
+
+            open_batch = self.state["open_batch"]
+            if open_batch and open_batch["round"] == name:
+                batch_id = open_batch["batch_id"]
+            else:
+                input_path = os.path.join(self.work_dir, f"{name}-{attempt}-input.jsonl")
+                write_requests(input_path, todo)
+                batch_id = self.backend.submit(input_path)
+                self.state["open_batch"] = {"round": name, "batch_id": batch_id}
+                self._save_state()
+
+            output_path = os.path.join(self.work_dir, f"{name}-{attempt}-output.jsonl")
+            self.status["state"] = "waiting for batch"
+            while self.backend.poll(batch_id, output_path) not in ("completed", "failed", "expired", "cancelled"):
+                if self.stop_event.wait(self.poll_interval):
+                    return self._tally(requests, errors)
+
+            self.status["state"] = "ingesting"
+            for cid, (content, tokens, error) in read_results(output_path).items():
+                if cid not in todo:
+                    continue
+                self.status["tokens"] += tokens
+                if error is None:
+                    try:
+                        results[cid] = parse(cid, content)
+                        self.status["succeeded"] += 1
+                        continue
+                    except Exception as e:
+                        error = f"Unusable output: {e}"
+                errors[cid] = error
+            self.state["open_batch"] = None
+            self._save_state()
+
+        return self._tally(requests, errors)
+
+    def _tally(self, requests, errors):
+        """
+        Count the round's requests that got no result - failed, or still
+        pending when the job was stopped (a resume picks those up) - and
+        return {custom_id: parsed} for the rest.
+        """
+        results = self.state["results"]
+        for cid in requests:
+            if cid in results:
+                continue
+            if self.stop_event.is_set():
+                self.status["stopped"] += 1
+            else:
+                self.status["failed"] += 1
+                self.status["failures"][cid] = errors.get(cid, "Not returned by the batch")
+        return {cid: results[cid] for cid in requests if cid in results}
+
+    def run(self):
+        """Run both rounds and save every curriculum that has at least one lesson."""
+        self.status["state"] = "running"
+        try:
+            tocs = {
+                f"toc:{subject}:{grade}": (subject, grade)
+                for subject, grade, mode in self.entries
+            }
+            toc_results = self._run_round(
+                "toc",
+                {cid: self.toc_request(subject, grade) for cid, (subject, grade) in tocs.items()},
+                lambda cid, text: {"toc_text": text, "topics": self.parse_toc(text)},
+            )
+
+            lessons = {}
+            for subject, grade, mode in self.entries:
+                toc = toc_results.get(f"toc:{subject}:{grade}")
+                for seq, topic in enumerate(toc["topics"] if toc else [], 1):
+                    lessons[f"lesson:{subject}:{grade}:{mode}:{seq}"] = (subject, grade, mode, topic)
+            lesson_results = self._run_round(
+                "lesson",
+                {cid: self.lesson_request(*meta) for cid, meta in lessons.items()},
+                lambda cid, text: self.parse_lesson(*lessons[cid], text),
+            )
+
+            for subject, grade, mode in self.entries:
+                key = f"{subject}:{grade}:{mode}"
+                toc = toc_results.get(f"toc:{subject}:{grade}")
+                if key in self.state["saved"] or not toc or self.stop_event.is_set():
+                    continue
+                done = [
+                    lesson_results[f"lesson:{subject}:{grade}:{mode}:{seq}"]
+                    for seq in range(1, len(toc["topics"]) + 1)
+                    if f"lesson:{subject}:{grade}:{mode}:{seq}" in lesson_results
+                ]
+                if done:
+                    self.save(subject, grade, mode, toc["toc_text"], toc["topics"], done)
+                    self.state["saved"].append(key)
+                    self.status["curricula_saved"] += 1
+                    self._save_state()
+
+            if self.stop_event.is_set():
+                self.status["state"] = "stopped"
+            else:
+                self.status["state"] = "finished"
+                self.state["finished"] = True
+                self._save_state()
+        except Exception as e:
+            logger.exception("Bulk generation failed")
+            self.status["state"] = f"error: {e}"
+        finally:
+            self.on_exit()
+        return self.status
+
+    def start(self):
+        """Run the job on a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self.stop_event.clear()
+            self._thread = threading.Thread(target=self.run, name="eduplan-bulk", daemon=True)
+            self._thread.start()
+        return self
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        """Stop after the current poll or ingest; progress so far is kept for a resume."""
+        self.stop_event.set()
+
+
+def load_state(work_dir):
+    """A job's saved state.json, or None if it has none."""
+    path = os.path.join(work_dir, "state.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def unfinished_jobs(root):
+    """(work_dir, state) for jobs under `root` that were stopped or interrupted, newest first."""
+    if not os.path.isdir(root):
+        return []
+    jobs = []
+    for name in sorted(os.listdir(root), reverse=True):
+        work_dir = os.path.join(root, name)
+        state = load_state(work_dir) if os.path.isdir(work_dir) else None
+        # Jobs from before entries were recorded can't be resumed
+        if state and state.get("entries") and not state.get("finished"):
+            jobs.append((work_dir, state))
+    return jobs
+
+
+def parse_entries(text):
+    """Parse "Subject, Grade, Mode" lines (blank lines and # comments ignored)."""
+    entries = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = [part.strip() for part in line.split(",")]
+        if len(parts) != 3 or not all(parts):
+            raise ValueError(f"Expected 'Subject, Grade, Mode': {line}")
+        entries.append(tuple(parts))
+    return entries
@@ -0,0 +1,70 @@
+import threading
+
+# --- COOPERATIVE CANCELLATION ---
+# A token is shared by everything working for one generation (script thread,
+# worker pools, OpenAI calls, the YouTube scraper). Work checks it at every
+# stage boundary; cancelling also runs cleanup callbacks such as closing the
+# OpenAI client, which aborts requests already on the wire.
+
+
+class GenerationCancelled(BaseException):
+    """
+    Raised inside cancelled work. Derives from BaseException (like
+    KeyboardInterrupt) so the pipeline's broad `except Exception` handlers
+    don't mistake a cancellation for a failed topic.
+    """
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel once; cleanup callbacks run on the first call only."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """Register cleanup to run on cancel (immediately if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise GenerationCancelled()
+
+
+# The token governing work on the current thread, if any
+_current = threading.local()
+
+
+def set_current_token(token):
+    _current.token = token
+
+
+def current_token():
+    return getattr(_current, "token", None)
+
+
+def raise_if_cancelled():
+    """Stage-boundary check for whatever token the current thread is working under."""
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
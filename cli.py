@@ -0,0 +1,150 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import bulk
+import archive
+import clients
+import pipeline
+import curriculum_store as store
+
+# --- COMMAND-LINE GENERATION ---
+# Generates curricula without the web UI, one worker process per
+# (subject, grade, mode) entry, for scripted bulk runs and benchmarking.
+#
+#   python cli.py -e "Biology, 9, Physical (Classroom)" -e "Chemistry, 10, Online (Virtual)" -o out/
+#   python cli.py -f entries.txt --workers 4 --batch --no-cache -o out/
+#   python cli.py -e "Physics, 11, Online (Virtual)" --format archive -o out/
+
+logger = logging.getLogger("eduplan.cli")
+
+
+def generate_one(entry, options):
+    """Worker-process entry point: generate one curriculum and return it with timing and metrics."""
+    subject, grade, mode = entry
+    client = clients.get_client(options["api_key"])
+    session = pipeline.GenerationSession(
+        stage_models=dict(pipeline.DEFAULT_STAGE_MODELS, **options["models"]),
+        use_cache=options["use_cache"],
+    )
+    pipeline.set_session(session)
+
+    start = time.perf_counter()
+    curriculum = pipeline.generate_curriculum(
+        client, subject, grade, mode,
+        split=options["split"], batch=options["batch"], max_topics=options["max_topics"]
+    )
+    curriculum["seconds"] = round(time.perf_counter() - start, 2)
+    curriculum["cache_hits"] = session.counters["cache_hits"]
+    curriculum["stage_metrics"] = session.stage_metrics
+
+    if options["save"]:
+        lessons = [lesson for lesson in curriculum["lessons"] if lesson]
+        curriculum["curriculum_id"] = store.save_curriculum(
+            subject, grade, mode, curriculum["toc_text"], curriculum["topics"], lessons
+        )
+    return curriculum
+
+
+def output_path(output_dir, curriculum, extension=".json"):
+    slug = re.sub(r"[^a-z0-9]+", "-", f"{curriculum['subject']} grade {curriculum['grade']} {curriculum['mode']}".lower())
+    return os.path.join(output_dir, slug.strip("-") + extension)
+
+
+def parse_models(pairs):
+    """Parse STAGE=MODEL overrides."""
+    models = {}
+    for pair in pairs:
+        stage, _, model = pair.partition("=")
+        if stage not in pipeline.DEFAULT_STAGE_MODELS or not model:
+            raise SystemExit(f"--model expects STAGE=MODEL with STAGE one of {', '.join(pipeline.DEFAULT_STAGE_MODELS)}")
+        models[stage] = model
+    return models
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate EduPlan curricula to JSON without the web UI.")
+    parser.add_argument("-e", "--entry", action="append", default=[], help='"Subject, Grade, Mode" (repeatable)')
+    parser.add_argument("-f", "--entries-file", help="File with one 'Subject, Grade, Mode' per line")
+    parser.add_argument("-o", "--output-dir", default="curricula_out", help="Directory for the output files")
+    parser.add_argument("--format", choices=["json", "archive"], default="json", help="JSON or compressed .eduplan archives")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--split", action="store_true", help="Split each lesson into parallel requests")
+    parser.add_argument("--batch", action="store_true", help="Batch several topics per lesson request")
+    parser.add_argument("--max-topics", type=int, help="Only generate the first N topics of each curriculum")
+    parser.add_argument("--model", action="append", default=[], help="Stage model override, e.g. lesson=gpt-4o-mini")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the generation cache (for benchmarking)")
+    parser.add_argument("--save", action="store_true", help="Also save each curriculum to the curriculum store")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="Defaults to $OPENAI_API_KEY")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(levelname)s %(message)s")
+    if not args.api_key:
+        parser.error("no API key: pass --api-key or set OPENAI_API_KEY")
+
+    text = "\n".join(args.entry)
+    if args.entries_file:
+        with open(args.entries_file) as f:
+            text += "\n" + f.read()
+    try:
+        entries = bulk.parse_entries(text)
+    except ValueError as e:
+        parser.error(str(e))
+    if not entries:
+        parser.error("no curricula given: use --entry or --entries-file")
+
+    options = {
+        "api_key": args.api_key,
+        "models": parse_models(args.model),
+        "use_cache": not args.no_cache,
+        "split": args.split,
+        "batch": args.batch,
+        "max_topics": args.max_topics,
+        "save": args.save,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    topics = tokens = failures = 0
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(entries))) as pool:
+        futures = {pool.submit(generate_one, entry, options): entry for entry in entries}
+        for future in as_completed(futures):
+            subject, grade, mode = futures[future]
+            try:
+                curriculum = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"FAILED  {subject}, grade {grade}, {mode}: {e}", file=sys.stderr)
+                continue
+
+            if args.format == "archive":
+                path = output_path(args.output_dir, curriculum, ".eduplan")
+                archive.write_archive(path, curriculum)
+            else:
+                path = output_path(args.output_dir, curriculum)
+                with open(path, "w") as f:
+                    json.dump(curriculum, f, indent=2)
+            done = sum(1 for lesson in curriculum["lessons"] if lesson)
+            topics += done
+            tokens += curriculum["tokens"]
+            print(
+                f"OK      {subject}, grade {grade}, {mode}: {done}/{len(curriculum['lessons'])} lessons, "
+                f"{curriculum['tokens']:,} tokens, {curriculum['seconds']}s -> {path}"
+            )
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"\n{len(entries) - failures}/{len(entries)} curricula, {topics} lessons, {tokens:,} tokens in {elapsed:.1f}s "
+        f"({60 * topics / elapsed:.1f} topics/min, {tokens / max(1, topics):,.0f} tokens/topic)"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import os
+import time
+import hashlib
+import threading
+import importlib.util
+
+# --- OPENAI CLIENT REGISTRY ---
+# Building OpenAI() per button press starts every call on a cold connection
+# pool with a fresh TLS handshake. Clients here are created once per API key
+# and reused across reruns and sessions, with tuned keep-alive pools, HTTP/2
+# when the h2 package is installed, and a shared timeout/retry policy.
+#
+# get_client() returns the key's shared client. Work that aborts its
+# requests by closing its client on cancel (runs, speculation, hedged
+# attempts) checks out a dedicated warm client instead and checks it back in
+# when done; a client closed by cancellation is simply dropped.
+
+TIMEOUT_S = float(os.environ.get("EDUPLAN_OPENAI_TIMEOUT_S", 120))
+CONNECT_TIMEOUT_S = float(os.environ.get("EDUPLAN_OPENAI_CONNECT_TIMEOUT_S", 5))
+MAX_RETRIES = int(os.environ.get("EDUPLAN_OPENAI_MAX_RETRIES", 2))
+MAX_CONNECTIONS = int(os.environ.get("EDUPLAN_OPENAI_MAX_CONNECTIONS", 32))
+MAX_KEEPALIVE = int(os.environ.get("EDUPLAN_OPENAI_MAX_KEEPALIVE", 16))
+KEEPALIVE_EXPIRY_S = 60
+# Checked-in spares unused for this long are closed and forgotten
+IDLE_EVICT_S = float(os.environ.get("EDUPLAN_OPENAI_IDLE_S", 900))
+# Checked-in clients kept warm per key
+MAX_SPARE_CLIENTS = 4
+HTTP2 = os.environ.get("EDUPLAN_OPENAI_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+
+def key_id(api_key):
+    """Registry key for an API key; the key itself is never used as a dict key or logged."""
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+
+def make_client(api_key):
+    """A new client on a tuned, pooled HTTP connection."""
+    # openai takes the better part of a second to import; pages that never
+    # call the API (the Step 1 form, saved curricula) shouldn't pay for it
+    # Everything goes through the SDK's own exports: the HTTP library behind
+    # them (httpx or httpx2) depends on the installed openai version
+    from openai import OpenAI, DefaultHttpxClient, Timeout, DEFAULT_CONNECTION_LIMITS
+
+    limits = type(DEFAULT_CONNECTION_LIMITS)(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY_S,
+    )
+    return OpenAI(
+        api_key=api_key,
+        timeout=Timeout(TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+        max_retries=MAX_RETRIES,
+        http_client=DefaultHttpxClient(http2=HTTP2, limits=limits),
+    )
+
+
+class ClientRegistry:
+    """Process-wide OpenAI clients per API key: one shared, plus spares for checkout."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shared = {}
+        self._spares = {}
+        self.stats = {"created": 0, "reused": 0, "evicted": 0}
+
+    def _evict_idle(self, now):
+        """
+        Close checked-in spares idle longer than IDLE_EVICT_S. Caller holds the
+        lock. Shared clients are never evicted: callers hold on to them for as
+        long as they like, so the time one was handed out says nothing about
+        whether it's still in use.
+        """
+        cutoff = now - IDLE_EVICT_S
+        for kid, spares in list(self._spares.items()):
+            for entry in [entry for entry in spares if entry[1] < cutoff]:
+                spares.remove(entry)
+                entry[0].close()
+                self.stats["evicted"] += 1
+            if not spares:
+                del self._spares[kid]
+
+    def get(self, api_key):
+        """The shared client for api_key. Callers must not close it."""
+        now = time.monotonic()
+        kid = key_id(api_key)
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._shared.get(kid)
+            if entry and not entry[0].is_closed():
+                self.stats["reused"] += 1
+                client = entry[0]
+            else:
+                self.stats["created"] += 1
+                client = make_client(api_key)
+            self._shared[kid] = (client, now)
+            return client
+
+    def checkout(self, api_key):
+        """A client for the caller's exclusive use (warm if a spare is available); hand it back with checkin()."""
+        now = time.monotonic()
+        kid = key_id(api_key)
+        with self._lock:
+            self._evict_idle(now)
+            spares = self._spares.get(kid, [])
+            while spares:
+                client, last_used = spares.pop()
+                if not client.is_closed():
+                    self.stats["reused"] += 1
+                    return client
+            self.stats["created"] += 1
+        return make_client(api_key)
+
+    def checkin(self, client):
+        """Return a checked-out client; closed ones (cancelled work) are dropped."""
+        if client.is_closed():
+            return
+        with self._lock:
+            spares = self._spares.setdefault(key_id(client.api_key), [])
+            if len(spares) < MAX_SPARE_CLIENTS:
+                spares.append((client, time.monotonic()))
+                return
+        client.close()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                keys=len(set(self._shared) | set(self._spares)),
+                spares=sum(len(spares) for spares in self._spares.values()),
+            )
+
+    def close_all(self):
+        with self._lock:
+            clients = [client for client, last_used in self._shared.values()]
+            clients += [client for spares in self._spares.values() for client, last_used in spares]
+            self._shared.clear()
+            self._spares.clear()
+        for client in clients:
+            client.close()
+
+
+REGISTRY = ClientRegistry()
+
+
+def get_client(api_key):
+    return REGISTRY.get(api_key)
+
+
+def checkout(api_key):
+    return REGISTRY.checkout(api_key)
+
+
+def checkin(client):
+    REGISTRY.checkin(client)
@@ -0,0 +1,454 @@
+import os
+import json
+import sqlite3
+import time
+import threading
+
+# --- PERSISTENT CURRICULUM STORE ---
+# Curricula, their topic lists and generated lessons live in SQLite so a
+# refresh, restart or second teacher never pays for the same generation twice.
+
+DB_PATH = os.environ.get("EDUPLAN_DB_PATH", "eduplan.db")
+# Cached TOCs/lessons older than this are regenerated (default one week)
+CACHE_TTL_S = float(os.environ.get("EDUPLAN_CACHE_TTL_S", 7 * 24 * 3600))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS curricula (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    grade TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    toc_text TEXT NOT NULL,
+    lesson_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS topics (
+    curriculum_id INTEGER NOT NULL REFERENCES curricula(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    PRIMARY KEY (curriculum_id, seq)
+);
+CREATE TABLE IF NOT EXISTS lessons (
+    curriculum_id INTEGER NOT NULL REFERENCES curricula(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (curriculum_id, position)
+);
+CREATE TABLE IF NOT EXISTS generation_cache (
+    cache_key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generation_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    grade TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    toc_text TEXT NOT NULL,
+    topics TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    curriculum_id INTEGER,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_topics (
+    run_id INTEGER NOT NULL REFERENCES generation_runs(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    topic TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    data TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, seq)
+);
+CREATE TABLE IF NOT EXISTS session_spills (
+    session_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_generation_runs_status ON generation_runs(status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_curricula_subject ON curricula(subject COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_curricula_grade ON curricula(grade);
+CREATE INDEX IF NOT EXISTS idx_curricula_mode ON curricula(mode);
+CREATE INDEX IF NOT EXISTS idx_curricula_created_at ON curricula(created_at);
+"""
+# Columns added after a table first shipped, (table, column, definition),
+# and the indexes on them, for databases created before
+MIGRATIONS = [
+    ("generation_runs", "owner", "TEXT"),
+]
+MIGRATION_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_generation_runs_owner ON generation_runs(owner, status);
+"""
+
+
+def _migrate(conn):
+    for table, column, definition in MIGRATIONS:
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    conn.executescript(MIGRATION_INDEXES)
+
+
+# Connections are kept per thread (and process) and reused; the schema is
+# created once per database path rather than on every query.
+_local = threading.local()
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def connect(db_path=None):
+    """This thread's connection to the store. Use it as `with connect() as conn:`; don't close it."""
+    path = db_path or DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        with _init_lock:
+            if path not in _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                _migrate(conn)
+                _initialized.add(path)
+        conns[path] = conn
+    return conn
+
+
+def save_curriculum(subject, grade, mode, toc_text, topics, lessons, db_path=None):
+    """Persist a curriculum with its topic list and lessons. Returns the new curriculum id."""
+    with connect(db_path) as conn:
+        cur = conn.execute(
+            "INSERT INTO curricula (subject, grade, mode, toc_text, lesson_count, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (subject, str(grade), mode, toc_text, len(lessons), time.time())
+        )
+        curriculum_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO topics (curriculum_id, seq, title) VALUES (?, ?, ?)",
+            [(curriculum_id, seq, title) for seq, title in enumerate(topics, 1)]
+        )
+        conn.executemany(
+            "INSERT INTO lessons (curriculum_id, position, title, data) VALUES (?, ?, ?, ?)",
+            [(curriculum_id, pos, lesson.get('title', ''), json.dumps(lesson)) for pos, lesson in enumerate(lessons)]
+        )
+        return curriculum_id
+
+
+def update_lesson(curriculum_id, position, lesson, db_path=None):
+    """Replace one stored lesson, e.g. after section regeneration."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE lessons SET title = ?, data = ? WHERE curriculum_id = ? AND position = ?",
+            (lesson.get('title', ''), json.dumps(lesson), curriculum_id, position)
+        )
+
+
+def update_curriculum_meta(curriculum_id, grade, mode, db_path=None):
+    """Record a new grade/mode after the curriculum was adapted in place."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE curricula SET grade = ?, mode = ? WHERE id = ?",
+            (str(grade), mode, curriculum_id)
+        )
+
+
+def list_curricula(subject=None, grade=None, mode=None, limit=50, db_path=None):
+    """Newest-first curriculum headers, optionally filtered by subject/grade/mode."""
+    clauses, params = [], []
+    if subject:
+        clauses.append("subject = ? COLLATE NOCASE")
+        params.append(subject)
+    if grade:
+        clauses.append("grade = ?")
+        params.append(str(grade))
+    if mode:
+        clauses.append("mode = ?")
+        params.append(mode)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT id, subject, grade, mode, lesson_count, created_at FROM curricula {where} "
+            "ORDER BY created_at DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def load_curriculum(curriculum_id, db_path=None, decode=None):
+    """
+    Load a curriculum header, its topics and lesson titles - lesson bodies stay
+    on disk. decode, if given, is applied to each lesson as it is read.
+    """
+    with connect(db_path) as conn:
+        header = conn.execute("SELECT * FROM curricula WHERE id = ?", (curriculum_id,)).fetchone()
+        if header is None:
+            return None
+        topics = [row["title"] for row in conn.execute(
+            "SELECT title FROM topics WHERE curriculum_id = ? ORDER BY seq", (curriculum_id,)
+        )]
+        lesson_titles = [row["title"] for row in conn.execute(
+            "SELECT title FROM lessons WHERE curriculum_id = ? ORDER BY position", (curriculum_id,)
+        )]
+
+    curriculum = dict(header)
+    curriculum["topics"] = topics
+    curriculum["lessons"] = LazyLessons(curriculum_id, lesson_titles, db_path, decode)
+    return curriculum
+
+
+def load_lesson(curriculum_id, position, db_path=None):
+    """Read and decode a single stored lesson."""
+    with connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT data FROM lessons WHERE curriculum_id = ? AND position = ?",
+            (curriculum_id, position)
+        ).fetchone()
+    return json.loads(row["data"]) if row else None
+
+
+def load_lessons(curriculum_id, db_path=None):
+    """Read and decode all of a curriculum's lessons in one query, as {position: lesson}."""
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT position, data FROM lessons WHERE curriculum_id = ?", (curriculum_id,)
+        ).fetchall()
+    return {row["position"]: json.loads(row["data"]) for row in rows}
+
+
+def replace_lessons(curriculum_id, lessons, db_path=None):
+    """Rewrite all lessons of a curriculum, e.g. after failed topics were retried."""
+    with connect(db_path) as conn:
+        conn.execute("DELETE FROM lessons WHERE curriculum_id = ?", (curriculum_id,))
+        conn.executemany(
+            "INSERT INTO lessons (curriculum_id, position, title, data) VALUES (?, ?, ?, ?)",
+            [(curriculum_id, pos, lesson.get('title', ''), json.dumps(lesson)) for pos, lesson in enumerate(lessons)]
+        )
+        conn.execute("UPDATE curricula SET lesson_count = ? WHERE id = ?", (len(lessons), curriculum_id))
+
+
+def delete_curriculum(curriculum_id, db_path=None):
+    """Remove a curriculum and everything stored under it."""
+    with connect(db_path) as conn:
+        conn.execute("DELETE FROM curricula WHERE id = ?", (curriculum_id,))
+
+
+# --- CHECKPOINTED GENERATION RUNS ---
+# Every finished topic of a Step 2 batch is checkpointed as soon as it lands,
+# so a dropped websocket or refresh never loses completed LLM work.
+
+def create_run(subject, grade, mode, toc_text, topics, selected, owner=None, db_path=None):
+    """Start a run for the selected (seq, topic) pairs, optionally owned by one teacher. Returns the run id."""
+    now = time.time()
+    with connect(db_path) as conn:
+        cur = conn.execute(
+            "INSERT INTO generation_runs (subject, grade, mode, toc_text, topics, owner, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (subject, str(grade), mode, toc_text, json.dumps(list(topics)), owner, now, now)
+        )
+        run_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO run_topics (run_id, seq, topic) VALUES (?, ?, ?)",
+            [(run_id, seq, topic) for seq, topic in selected]
+        )
+        return run_id
+
+
+def checkpoint_topic(run_id, seq, lesson, db_path=None):
+    """Record a finished topic's lesson."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE run_topics SET status = 'done', data = ?, error = NULL, attempts = attempts + 1 "
+            "WHERE run_id = ? AND seq = ?",
+            (json.dumps(lesson), run_id, seq)
+        )
+        conn.execute("UPDATE generation_runs SET updated_at = ? WHERE id = ?", (time.time(), run_id))
+
+
+def update_run_lesson(run_id, position, lesson, db_path=None):
+    """
+    Replace the lesson of a run's position-th finished topic (the lesson at
+    that position in the curriculum), so edits made after generation -
+    regenerated sections, adaptation, filled-in parts - survive rebuilding
+    the curriculum from the run's checkpoints.
+    """
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE run_topics SET data = ? WHERE run_id = ? AND seq = "
+            "(SELECT seq FROM run_topics WHERE run_id = ? AND status = 'done' ORDER BY seq LIMIT 1 OFFSET ?)",
+            (json.dumps(lesson), run_id, run_id, position)
+        )
+
+
+def update_run_meta(run_id, grade, mode, db_path=None):
+    """Record a new grade/mode on a run whose curriculum was adapted in place."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE generation_runs SET grade = ?, mode = ?, updated_at = ? WHERE id = ?",
+            (str(grade), mode, time.time(), run_id)
+        )
+
+
+def fail_topic(run_id, seq, error, db_path=None):
+    """Record a topic whose generation failed, so it can be retried on its own."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE run_topics SET status = 'failed', error = ?, attempts = attempts + 1 "
+            "WHERE run_id = ? AND seq = ?",
+            (error, run_id, seq)
+        )
+        conn.execute("UPDATE generation_runs SET updated_at = ? WHERE id = ?", (time.time(), run_id))
+
+
+def finish_run(run_id, curriculum_id=None, db_path=None):
+    """Mark a run complete (no pending or failed topics) or incomplete, and link its curriculum."""
+    with connect(db_path) as conn:
+        remaining = conn.execute(
+            "SELECT COUNT(*) FROM run_topics WHERE run_id = ? AND status != 'done'", (run_id,)
+        ).fetchone()[0]
+        conn.execute(
+            "UPDATE generation_runs SET status = ?, curriculum_id = COALESCE(?, curriculum_id), updated_at = ? WHERE id = ?",
+            ("complete" if remaining == 0 else "incomplete", curriculum_id, time.time(), run_id)
+        )
+
+
+def load_run(run_id, with_data=True, db_path=None):
+    """Load a run header with its topics; finished topics carry their lesson when with_data is set."""
+    with connect(db_path) as conn:
+        header = conn.execute("SELECT * FROM generation_runs WHERE id = ?", (run_id,)).fetchone()
+        if header is None:
+            return None
+        rows = conn.execute(
+            "SELECT seq, topic, status, data, error, attempts FROM run_topics WHERE run_id = ? ORDER BY seq",
+            (run_id,)
+        ).fetchall()
+
+    run = dict(header)
+    run["topics"] = json.loads(run["topics"])
+    run["items"] = [
+        dict(row, data=json.loads(row["data"]) if with_data and row["data"] else None)
+        for row in rows
+    ]
+    return run
+
+
+def list_unfinished_runs(owner=None, limit=20, db_path=None):
+    """Newest-first runs of one owner that still have pending or failed topics."""
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT r.id, r.subject, r.grade, r.mode, r.status, r.updated_at, "
+            "SUM(t.status = 'done') AS done, SUM(t.status = 'failed') AS failed, "
+            "SUM(t.status = 'pending') AS pending "
+            "FROM generation_runs r JOIN run_topics t ON t.run_id = r.id "
+            "WHERE r.status != 'complete' AND r.owner IS ? GROUP BY r.id ORDER BY r.updated_at DESC LIMIT ?",
+            (owner, limit)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def discard_run(run_id, owner=None, db_path=None):
+    """Forget a run the teacher doesn't want to resume; only its owner can."""
+    with connect(db_path) as conn:
+        conn.execute("DELETE FROM generation_runs WHERE id = ? AND owner IS ?", (run_id, owner))
+
+
+def cache_key(parts):
+    """Stable string form of a generation key tuple."""
+    return json.dumps(list(parts), ensure_ascii=False)
+
+
+def get_cached(parts, max_age=None, db_path=None):
+    """Return (value, tokens) for a cached generation, or None if missing or stale."""
+    max_age = CACHE_TTL_S if max_age is None else max_age
+    with connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT value, tokens FROM generation_cache WHERE cache_key = ? AND created_at >= ?",
+            (cache_key(parts), time.time() - max_age)
+        ).fetchone()
+    return (json.loads(row["value"]), row["tokens"]) if row else None
+
+
+def put_cached(parts, value, tokens=0, db_path=None):
+    """Store the result of a generation under its key."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO generation_cache (cache_key, value, tokens, created_at) VALUES (?, ?, ?, ?)",
+            (cache_key(parts), json.dumps(value), tokens, time.time())
+        )
+
+
+def spill_session(session_id, data, db_path=None):
+    """Park a browser session's state on disk while it's evicted from memory."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO session_spills (session_id, data, created_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data), time.time())
+        )
+
+
+def take_spill(session_id, db_path=None):
+    """Remove and return a session's spilled state, or None if there is none."""
+    with connect(db_path) as conn:
+        row = conn.execute("SELECT data FROM session_spills WHERE session_id = ?", (session_id,)).fetchone()
+        conn.execute("DELETE FROM session_spills WHERE session_id = ?", (session_id,))
+    return json.loads(row["data"]) if row else None
+
+
+def delete_spills(max_age, db_path=None):
+    """Drop spills older than max_age seconds, left by sessions that never came back."""
+    with connect(db_path) as conn:
+        conn.execute("DELETE FROM session_spills WHERE created_at < ?", (time.time() - max_age,))
+
+
+class LazyLessons:
+    """
+    List-like view over a stored curriculum's lessons. Indexing reads and
+    decodes a single lesson, so opening a large archive only touches titles;
+    iterating (rendering all topics) reads the ones not yet loaded in one query.
+    """
+
+    def __init__(self, curriculum_id, titles, db_path=None, decode=None):
+        self.curriculum_id = curriculum_id
+        self.titles = list(titles)
+        self.db_path = db_path
+        self.decode = decode
+        self._loaded = {}
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __bool__(self):
+        return bool(self.titles)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self.titles)
+        if position not in self._loaded:
+            lesson = load_lesson(self.curriculum_id, position, self.db_path) or {"title": self.titles[position]}
+            self._loaded[position] = self.decode(lesson) if self.decode else lesson
+        return self._loaded[position]
+
+    def __setitem__(self, position, lesson):
+        self._loaded[position] = lesson
+        self.titles[position] = lesson.get('title', '')
+
+    def __iter__(self):
+        if len(self._loaded) < len(self.titles):
+            stored = load_lessons(self.curriculum_id, self.db_path)
+            for position, title in enumerate(self.titles):
+                if position not in self._loaded:
+                    lesson = stored.get(position) or {"title": title}
+                    self._loaded[position] = self.decode(lesson) if self.decode else lesson
+        for position in range(len(self.titles)):
+            yield self[position]
+
+    def append(self, lesson):
+        self._loaded[len(self.titles)] = lesson
+        self.titles.append(lesson.get('title', ''))
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from cancellation import raise_if_cancelled
+
+# --- HEDGED REQUESTS ---
+# Cuts the long tail of large completions: if a call hasn't finished by a
+# percentile of recently observed latency, a duplicate is fired and whichever
+# finishes first wins. Process-wide so every session feeds the latency window.
+
+
+class Hedger:
+    """
+    Runs call(client) on a client from make_client(), hedging with a second
+    attempt on its own client when the first is slower than the `percentile`
+    of the last `window` latencies. The losing attempt's client is closed,
+    which aborts its request; finished attempts' clients go to `release`. Extra spend is capped by `max_hedge_ratio`
+    (hedges / calls) and by `max_extra_tokens`, the prompt tokens re-sent
+    by hedges so far.
+    """
+
+    def __init__(self, window=200, min_samples=10, max_hedge_ratio=0.1, max_extra_tokens=500_000):
+        self.latencies = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_extra_tokens = max_extra_tokens
+        self.pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="eduplan-hedge")
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "extra_tokens": 0}
+
+    def threshold(self, percentile):
+        """Latency after which a call is hedged, or None until enough samples exist."""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def _may_hedge(self):
+        with self._lock:
+            return (
+                self.stats["hedges"] < self.max_hedge_ratio * self.stats["calls"]
+                and self.stats["extra_tokens"] < self.max_extra_tokens
+            )
+
+    def _wait(self, futures, timeout=None):
+        """wait() that stays responsive to cancellation of the calling thread's work."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            raise_if_cancelled()
+            step = 0.25 if deadline is None else max(0, min(0.25, deadline - time.monotonic()))
+            done, pending = wait(futures, timeout=step, return_when=FIRST_COMPLETED)
+            if done or (deadline is not None and time.monotonic() >= deadline):
+                return done, pending
+
+    def run(self, call, make_client, percentile=0.9, prompt_tokens=lambda result: 0, release=lambda client: client.close()):
+        """Run call(client), hedging with a duplicate if it is slow. Returns the first successful result."""
+        with self._lock:
+            self.stats["calls"] += 1
+        start = time.monotonic()
+        clients = {}
+
+        def submit():
+            client = make_client()
+            future = self.pool.submit(call, client)
+            clients[future] = client
+            return future
+
+        primary = submit()
+        futures = {primary}
+        hedge = None
+
+        try:
+            threshold = self.threshold(percentile)
+            done, _ = self._wait(futures, timeout=threshold)
+            if not done and threshold is not None and self._may_hedge():
+                hedge = submit()
+                futures.add(hedge)
+                with self._lock:
+                    self.stats["hedges"] += 1
+
+            # First successful attempt wins; a failure only counts once both have failed
+            error = None
+            while futures:
+                done, futures = self._wait(futures)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    self._record(
+                        time.monotonic() - start,
+                        won_by_hedge=future is hedge,
+                        extra_tokens=prompt_tokens(result) if hedge else 0
+                    )
+                    return result
+            raise error
+        finally:
+            # Closing an unfinished attempt's client aborts its request on the wire
+            for future, client in clients.items():
+                if future.done():
+                    release(client)
+                else:
+                    client.close()
+
+    def _record(self, latency, won_by_hedge, extra_tokens):
+        with self._lock:
+            self.latencies.append(latency)
+            self.stats["extra_tokens"] += extra_tokens
+            if won_by_hedge:
+                self.stats["hedge_wins"] += 1
+
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(stage):
+    """The process-wide hedger for a pipeline stage."""
+    with _hedgers_lock:
+        if stage not in _hedgers:
+            _hedgers[stage] = Hedger()
+        return _hedgers[stage]
+
+
+def get_hedgers():
+    """Snapshot of all hedgers, for metrics display."""
+    with _hedgers_lock:
+        return dict(_hedgers)
@@ -0,0 +1,119 @@
+import copy
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from cancellation import GenerationCancelled, raise_if_cancelled
+
+# --- IN-FLIGHT REQUEST REGISTRY ---
+# Lives in an imported module (not app.py, which Streamlit re-executes on every
+# rerun) so it is shared by every session in the server process.
+
+
+class InflightRegistry:
+    """
+    Coalesces identical concurrent work. The first caller for a key runs the
+    function; callers arriving while it is still running wait for and share
+    its result instead of issuing the same OpenAI calls again. A leader that
+    passes a scheduling.PriorityBoost inherits the priority class of the
+    callers that join it, so an interactive caller doesn't wait on work
+    queued at background priority.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    def run(self, key, fn, *args, boost=None, priority=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) once per in-flight key. Returns (result, coalesced).
+        `boost` is the leader's, raised to a follower's `priority` as it joins.
+        """
+        while True:
+            with self._lock:
+                future = self._futures.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    future.boost = boost
+                    self._futures[key] = future
+                    self.stats["executed"] += 1
+                else:
+                    self.stats["coalesced"] += 1
+
+            if leader:
+                return self._lead(key, future, fn, *args, **kwargs), False
+
+            if future.boost is not None and priority is not None:
+                future.boost.raise_to(priority)
+
+            try:
+                result = self._wait(future)
+            except GenerationCancelled:
+                # The leader was cancelled by its own session; a follower that
+                # still wants the result takes over instead of inheriting it.
+                raise_if_cancelled()
+                continue
+            # Followers get their own copy so in-place edits don't leak between sessions
+            return copy.deepcopy(result), True
+
+    def _lead(self, key, future, fn, *args, **kwargs):
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    def claim(self, key, boost=None):
+        """
+        Lead `key` for work run outside run(), e.g. one batched completion
+        covering several keys. Returns the Future to hand to settle(), or None
+        when the key is already in flight. Callers of run() join it as usual.
+        """
+        with self._lock:
+            if key in self._futures:
+                return None
+            future = Future()
+            future.boost = boost
+            self._futures[key] = future
+            self.stats["executed"] += 1
+            return future
+
+    def settle(self, key, future, result=None, error=None):
+        """Deliver a claimed key's result (or `error`) to its followers and release the key."""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    def _wait(self, future):
+        """Wait for the leader while staying responsive to this caller's own cancellation."""
+        while True:
+            raise_if_cancelled()
+            try:
+                return future.result(timeout=0.25)
+            except FutureTimeout:
+                continue
+
+    def running(self, key):
+        """True while a job for `key` is being computed."""
+        with self._lock:
+            return key in self._futures
+
+    def in_flight(self):
+        """Number of keys currently being computed."""
+        with self._lock:
+            return len(self._futures)
+
+
+REGISTRY = InflightRegistry()
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import curriculum_store as store
+
+# --- GENERATION JOB QUEUE ---
+# A SQLite-backed queue between the web tier and worker processes
+# (worker.py). The app submits TOC/lesson jobs and polls their status; workers
+# on any core or machine sharing the database claim and execute them. Claims
+# are leases: a job whose worker died is picked up again once its lease expires.
+
+# Seconds a claimed job stays with its worker without a heartbeat
+LEASE_S = float(os.environ.get("EDUPLAN_QUEUE_LEASE_S", 120))
+MAX_ATTEMPTS = 3
+FINISHED = ("done", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority DESC, id);
+"""
+
+
+_local = threading.local()
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def connect(db_path=None):
+    """
+    This thread's connection to the queue (in the curriculum store database by
+    default), in autocommit mode. Use it as `with connect() as conn:`; don't close it.
+    """
+    path = db_path or store.DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        with _init_lock:
+            if path not in _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                _initialized.add(path)
+        conns[path] = conn
+    return conn
+
+
+def _job(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def submit(kind, payload, priority=0, db_path=None):
+    """Queue a job. Higher priorities are claimed first. Returns the job id."""
+    with connect(db_path) as conn:
+        cur = conn.execute(
+            "INSERT INTO jobs (kind, payload, priority, created_at) VALUES (?, ?, ?, ?)",
+            (kind, json.dumps(payload), priority, time.time())
+        )
+        return cur.lastrowid
+
+
+def claim(worker, kinds=None, db_path=None):
+    """
+    Atomically take the next runnable job - queued, or running with an expired
+    lease - for `worker`. Returns the job, or None when the queue is empty.
+    """
+    now = time.time()
+    kind_filter = f"AND kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+    with connect(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"""SELECT * FROM jobs
+                    WHERE (status = 'queued' OR (status = 'running' AND lease_until < ?)) {kind_filter}
+                    ORDER BY priority DESC, id LIMIT 1""",
+                (now, *(kinds or []))
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["attempts"] >= MAX_ATTEMPTS:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                    (row["error"] or "Worker lost the job too many times", now, row["id"])
+                )
+                conn.execute("COMMIT")
+                return claim(worker, kinds, db_path)
+            conn.execute(
+                """UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1,
+                   started_at = COALESCE(started_at, ?) WHERE id = ?""",
+                (worker, now + LEASE_S, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    job = _job(row)
+    job.update(status="running", worker=worker, attempts=row["attempts"] + 1)
+    return job
+
+
+def heartbeat(job_id, worker, db_path=None):
+    """Extend a running job's lease. Returns its status, so the worker notices cancellation."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + LEASE_S, job_id, worker)
+        )
+        row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+
+def complete(job_id, worker, result, db_path=None):
+    """Record a job's result (ignored if the job was cancelled or re-leased meanwhile)."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (json.dumps(result), time.time(), job_id, worker)
+        )
+
+
+def fail(job_id, worker, error, retry=False, db_path=None):
+    """Record a failed attempt; with `retry` the job is queued again until it runs out of attempts."""
+    with connect(db_path) as conn:
+        conn.execute(
+            """UPDATE jobs SET status = CASE WHEN ? AND attempts < ? THEN 'queued' ELSE 'failed' END,
+               error = ?, finished_at = ? WHERE id = ? AND worker = ? AND status = 'running'""",
+            (retry, MAX_ATTEMPTS, error, time.time(), job_id, worker)
+        )
+
+
+def cancel(job_ids, db_path=None):
+    """Cancel jobs that haven't finished; running ones stop at their next heartbeat."""
+    if not job_ids:
+        return
+    with connect(db_path) as conn:
+        conn.execute(
+            f"""UPDATE jobs SET status = 'cancelled', finished_at = ?
+                WHERE id IN ({','.join('?' * len(job_ids))}) AND status IN ('queued', 'running')""",
+            (time.time(), *job_ids)
+        )
+
+
+def get_jobs(job_ids, db_path=None):
+    """Current state of the given jobs, as {id: job}."""
+    if not job_ids:
+        return {}
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT * FROM jobs WHERE id IN ({','.join('?' * len(job_ids))})", tuple(job_ids)
+        ).fetchall()
+    return {row["id"]: _job(row) for row in rows}
+
+
+def queue_stats(db_path=None):
+    """Queued/running job counts and how many workers were seen in the last lease period."""
+    with connect(db_path) as conn:
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+        ).fetchall())
+        workers = conn.execute(
+            "SELECT COUNT(DISTINCT worker) FROM jobs WHERE lease_until > ?", (time.time(),)
+        ).fetchone()[0]
+    return {"queued": counts.get("queued", 0), "running": counts.get("running", 0), "workers": workers}
+
+
+def purge(max_age_s=7 * 24 * 3600, db_path=None):
+    """Delete finished jobs older than max_age_s."""
+    with connect(db_path) as conn:
+        conn.execute(
+            f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED))}) AND finished_at < ?",
+            (*FINISHED, time.time() - max_age_s)
+        )
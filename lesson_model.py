@@ -0,0 +1,162 @@
+import sys
+
+# --- COMPACT LESSON MODEL ---
+# Sessions hold their curriculum for as long as the tab is open. As plain
+# dicts every lesson repeats its keys, and each of its ~12 videos is a dict
+# of its own with a private copy of strings shared across the whole server
+# ("Theory", channel names, durations). Lessons are kept in session state as
+# slotted records instead: lists become tuples, videos are stored column-wise
+# (one tuple per field), the common strings are interned, and watch URLs
+# derivable from the video ID aren't stored at all.
+#
+# pack() and unpack() convert at the boundary: the pipeline, the store and
+# the render code keep working with the generate_topic_content dict shape.
+
+VIDEO_FIELDS = ("type", "search_query", "video_id", "real_url", "title", "channel", "duration", "description", "search_url")
+# Values repeated across lessons and sessions
+INTERNED_VIDEO_FIELDS = ("type", "channel", "duration")
+# In generate_topic_content's key order
+LESSON_FIELDS = ("title", "overview", "objectives", "materials", "experiment", "videos", "pending")
+LIST_FIELDS = ("objectives", "materials", "pending")
+EXPERIMENT_FIELDS = ("title", "steps")
+WATCH_URL = "https://www.youtube.com/watch?v={}"
+
+
+class _Marker:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+    def __reduce__(self):
+        # Copies and unpickled states must get the module's singletons back:
+        # packed lessons are compared against them with `is`
+        return self.name
+
+
+# A key the dict didn't have (distinct from a None value)
+ABSENT = _Marker("ABSENT")
+# real_url equal to the watch URL of the video's video_id
+DERIVED = _Marker("DERIVED")
+
+
+class Videos:
+    """A lesson's videos stored column-wise: one tuple per field, None for a field no video has."""
+
+    __slots__ = VIDEO_FIELDS + ("count", "extra")
+
+    def __len__(self):
+        return self.count
+
+
+class Lesson:
+    """One lesson as a slotted record; fields the dict didn't have hold ABSENT."""
+
+    __slots__ = LESSON_FIELDS + ("extra",)
+
+    def get(self, name, default=None):
+        value = getattr(self, name)
+        return default if value is ABSENT else value
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def pack_videos(videos):
+    """Column-wise Videos for a list of video dicts."""
+    packed = Videos()
+    packed.count = len(videos)
+    for field in VIDEO_FIELDS:
+        column = tuple(video.get(field, ABSENT) for video in videos)
+        if field in INTERNED_VIDEO_FIELDS:
+            column = tuple(_intern(value) for value in column)
+        elif field == "real_url":
+            column = tuple(
+                DERIVED if url is not ABSENT and url == WATCH_URL.format(video.get("video_id")) else url
+                for url, video in zip(column, videos)
+            )
+        setattr(packed, field, None if all(value is ABSENT for value in column) else column)
+    extra = tuple({k: v for k, v in video.items() if k not in VIDEO_FIELDS} or None for video in videos)
+    packed.extra = extra if any(extra) else None
+    return packed
+
+
+def unpack_videos(packed):
+    videos = [{} for _ in range(packed.count)]
+    for field in VIDEO_FIELDS:
+        column = getattr(packed, field)
+        if column is None:
+            continue
+        for video, value in zip(videos, column):
+            if value is DERIVED:
+                value = WATCH_URL.format(video["video_id"])
+            if value is not ABSENT:
+                video[field] = value
+    if packed.extra:
+        for video, extra in zip(videos, packed.extra):
+            if extra:
+                video.update(extra)
+    return videos
+
+
+def pack(lesson):
+    """A Lesson record for a lesson dict. Values of unexpected types are kept as they are."""
+    if isinstance(lesson, Lesson):
+        return lesson
+    packed = Lesson()
+    packed.title = lesson.get("title", ABSENT)
+    packed.overview = lesson.get("overview", ABSENT)
+    for field in LIST_FIELDS:
+        value = lesson.get(field, ABSENT)
+        setattr(packed, field, tuple(value) if type(value) is list else value)
+
+    experiment = lesson.get("experiment", ABSENT)
+    if type(experiment) is dict and experiment.keys() <= set(EXPERIMENT_FIELDS):
+        steps = experiment.get("steps", ABSENT)
+        experiment = (experiment.get("title", ABSENT), tuple(steps) if type(steps) is list else steps)
+    packed.experiment = experiment
+
+    videos = lesson.get("videos", ABSENT)
+    if type(videos) is list and all(type(video) is dict for video in videos):
+        videos = pack_videos(videos)
+    packed.videos = videos
+
+    packed.extra = {k: v for k, v in lesson.items() if k not in LESSON_FIELDS} or None
+    return packed
+
+
+def unpack(packed):
+    """The lesson dict for a Lesson record (a fresh dict the caller may modify)."""
+    if isinstance(packed, dict):
+        return packed
+    lesson = {}
+    for field in LESSON_FIELDS:
+        value = getattr(packed, field)
+        if field == "experiment" and type(value) is tuple:
+            title, steps = value
+            value = {}
+            if title is not ABSENT:
+                value["title"] = title
+            if steps is not ABSENT:
+                value["steps"] = list(steps) if type(steps) is tuple else steps
+        elif field == "videos" and isinstance(value, Videos):
+            value = unpack_videos(value)
+        elif type(value) is tuple:
+            value = list(value)
+        if value is not ABSENT:
+            lesson[field] = value
+    if packed.extra:
+        lesson.update(packed.extra)
+    return lesson
+
+
+def pack_all(lessons):
+    return [pack(lesson) for lesson in lessons]
+
+
+def unpack_all(lessons):
+    return [unpack(lesson) for lesson in lessons]
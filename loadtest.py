@@ -0,0 +1,108 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+
+# --- API LOAD TEST ---
+# Drives the HTTP job API (api.py) with concurrent clients, each submitting a
+# curriculum job, following its topics until it finishes, then submitting the
+# next, and reports sustained jobs and topics per minute.
+#
+#   python loadtest.py --url http://localhost:8000 --clients 8 --duration 300 --max-topics 3
+
+DEFAULT_ENTRIES = [
+    ("Biology", "9"), ("Chemistry", "10"), ("Physics", "11"), ("Algebra", "8"),
+    ("Geometry", "9"), ("US History", "11"), ("World History", "10"), ("Earth Science", "6"),
+]
+
+
+def request(method, url, token=None, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    with urllib.request.urlopen(req, timeout=30) as response:
+        return json.load(response)
+
+
+def run_job(args, subject, grade):
+    """Submit one job and follow its topics to the end. Returns (status, topics, seconds)."""
+    start = time.perf_counter()
+    job = request("POST", f"{args.url}/jobs", args.token, {
+        "subject": subject, "grade": grade, "mode": random.choice(["Physical (Classroom)", "Online (Virtual)"]),
+        "max_topics": args.max_topics, "batch": args.batch, "split": args.split,
+    })
+    since, topics = 0, 0
+    while True:
+        page = request("GET", f"{args.url}/jobs/{job['id']}/topics?since={since}", args.token)
+        since = page["next"]
+        topics += sum(1 for topic in page["topics"] if topic["status"] == "done")
+        if page["status"] in ("done", "failed", "cancelled"):
+            return page["status"], topics, time.perf_counter() - start
+        time.sleep(args.poll_interval)
+
+
+def client_loop(args, deadline, results, lock):
+    while time.perf_counter() < deadline:
+        subject, grade = random.choice(DEFAULT_ENTRIES)
+        try:
+            outcome = run_job(args, subject, grade)
+        except urllib.error.HTTPError as e:
+            outcome = (f"http {e.code}", 0, 0.0)
+            time.sleep(1)
+        except OSError as e:
+            outcome = (f"error: {e}", 0, 0.0)
+            time.sleep(1)
+        with lock:
+            results.append(outcome)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the EduPlan HTTP job API.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--token", help="Bearer token, if the server sets EDUPLAN_API_TOKEN")
+    parser.add_argument("-c", "--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("-d", "--duration", type=float, default=300, help="Seconds to keep submitting")
+    parser.add_argument("--max-topics", type=int, default=3, help="Topics per job")
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--split", action="store_true")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    args = parser.parse_args(argv)
+    args.url = args.url.rstrip("/")
+
+    results, lock = [], threading.Lock()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=client_loop, args=(args, deadline, results, lock), daemon=True)
+        for _ in range(args.clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    done = [(topics, seconds) for status, topics, seconds in results if status == "done"]
+    statuses = {}
+    for status, topics, seconds in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = [seconds for topics, seconds in done]
+    topics = sum(topics for topics, seconds in done)
+    print(f"{len(results)} jobs in {elapsed:.1f}s with {args.clients} clients: {statuses}")
+    print(f"Sustained: {60 * len(done) / elapsed:.1f} jobs/min, {60 * topics / elapsed:.1f} topics/min")
+    print(f"Job latency: p50 {percentile(latencies, 0.5):.1f}s, p95 {percentile(latencies, 0.95):.1f}s")
+    return 0 if len(done) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1092 @@
+import re
+import copy
+import json
+import time
+import random
+import logging
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import curriculum_store as store
+import inflight
+import cancellation
+import clients
+import hedging
+import prompts
+import scheduling
+
+# --- GENERATION PIPELINE ---
+# TOC, lesson and video generation with no Streamlit dependency, so it can be
+# imported by the app, the CLI and background workers alike. Whatever differs
+# per caller (models, budgets, metrics, where errors go) lives on the
+# GenerationSession set for the current thread.
+
+logger = logging.getLogger(__name__)
+
+# --- MODEL TIERS ---
+# Light stages (numbered TOC, boilerplate search intents, JSON repair) run on
+# cheaper, faster models; only the lesson body needs the full model.
+MODEL_CHOICES = ["gpt-4o", "gpt-4o-mini", "gpt-4.1", "gpt-4.1-mini", "gpt-4.1-nano"]
+DEFAULT_STAGE_MODELS = {
+    "toc": "gpt-4o-mini",
+    "lesson": "gpt-4o",
+    "video_intents": "gpt-4o-mini",
+    "repair": "gpt-4o-mini",
+}
+
+# Sections that differ by learning mode (via exp_guide/video_guide) or by grade.
+# Theory videos depend on neither and are always reused.
+MODE_DEPENDENT_SECTIONS = ["materials", "experiment"]
+GRADE_DEPENDENT_SECTIONS = ["overview", "objectives"]
+
+# Output-token ceilings per model; batched lesson requests are sized to fit under them
+MAX_OUTPUT_TOKENS = {
+    "gpt-4o": 16384,
+    "gpt-4o-mini": 16384,
+    "gpt-4.1": 32768,
+    "gpt-4.1-mini": 32768,
+    "gpt-4.1-nano": 32768,
+}
+BATCH_MAX_TOPICS = 8
+# Completion tokens assumed per lesson until batched calls have been observed
+DEFAULT_LESSON_OUTPUT_TOKENS = 1500
+
+# Stages whose long-tail latency is worth a duplicate request
+HEDGED_STAGES = {"lesson"}
+
+# Per-stage and per-topic time budgets; parts that miss them are delivered later
+DEFAULT_LATENCY_BUDGETS = {"llm_s": 90, "videos_s": 10, "topic_s": 120}
+# Retries a budgeted LLM call may make, and the time that must be left for one
+BUDGET_RETRIES = 1
+MIN_RETRY_S = 5
+# Seconds a batched completion gets on top of topic_s for each topic past the
+# first (about one lesson's output at typical decode speed)
+BATCH_TOPIC_ALLOWANCE_S = 30
+
+
+# --- SESSION AND LLM CALLS ---
+# Tokens spent by LLM calls on the current thread (used by background jobs for budgeting)
+llm_usage = threading.local()
+# The GenerationSession that work on the current thread is done for
+thread_session = threading.local()
+# Per-topic deadline and LLM budget for calls made on the current thread
+thread_budget = threading.local()
+
+
+class GenerationSession:
+    """
+    Per-caller settings and metric sinks for the pipeline: stage models (and
+    the B variant while A/B testing), latency budgets, the hedging
+    percentile, whether to use the generation cache, per-call and per-topic
+    metrics, and counters. `flow`, `priority` and `weight` place its LLM
+    calls and scrapes in the fair scheduler; `boost` lifts them while an
+    interactive caller waits on the work (see coalesced_call). Headless
+    callers get the defaults - no budgets, no hedging, problems logged; the
+    Streamlit app passes its session-state objects in and reports on the page.
+    """
+    
+    def __init__(self, stage_models=None, ab_stage_models=None, latency_budgets=None, hedge_percentile=None,
+                 use_cache=True, stage_metrics=None, topic_latencies=None, counters=None,
+                 flow=None, priority="interactive", weight=1.0):
+        self.stage_models = stage_models if stage_models is not None else dict(DEFAULT_STAGE_MODELS)
+        self.ab_stage_models = ab_stage_models
+        self.latency_budgets = latency_budgets
+        self.hedge_percentile = hedge_percentile
+        self.use_cache = use_cache
+        self.stage_metrics = stage_metrics if stage_metrics is not None else []
+        self.topic_latencies = topic_latencies if topic_latencies is not None else []
+        self.counters = counters if counters is not None else {"cache_hits": 0, "coalesced_calls": 0}
+        self.flow = flow
+        self.priority = priority
+        self.weight = weight
+        self.boost = None
+    
+    def boosted(self, boost):
+        """A copy of this session (sharing its metric sinks) whose calls carry `boost`."""
+        session = copy.copy(self)
+        session.boost = boost
+        return session
+    
+    def count(self, name):
+        self.counters[name] = self.counters.get(name, 0) + 1
+    
+    def report(self, level, message):
+        """Surface a recoverable problem ("error" or "warning") to whoever runs the pipeline."""
+        getattr(logger, level)(message)
+    
+    def slot(self, resource, pool="shared"):
+        """Hold one of `resource`'s scheduler slots for this session."""
+        return scheduling.get_scheduler(resource, pool).slot(self.flow, self.priority, self.weight, self.boost)
+
+
+def set_session(session):
+    """Make `session` govern pipeline calls on the current thread."""
+    thread_session.session = session
+
+def current_session():
+    """The current thread's session, created with defaults on first use."""
+    session = getattr(thread_session, "session", None)
+    if session is None:
+        session = thread_session.session = GenerationSession()
+    return session
+
+def current_stage_models():
+    """The current session's stage models."""
+    return current_session().stage_models
+
+def select_stage_model(stage):
+    """Pick the model for a pipeline stage, honouring the A/B switch."""
+    session = current_session()
+    if session.ab_stage_models and random.random() < 0.5:
+        return session.ab_stage_models[stage], "B"
+    return session.stage_models[stage], "A"
+
+def current_latency_budgets():
+    """The session's latency budgets; None runs unbudgeted."""
+    return current_session().latency_budgets
+
+def llm_timeout():
+    """Seconds the next LLM call on this thread may take, or None when unbudgeted."""
+    llm_s = getattr(thread_budget, "llm_s", None)
+    deadline = getattr(thread_budget, "deadline", None)
+    if llm_s is None and deadline is None:
+        return None
+    remaining = [llm_s] if llm_s else []
+    if deadline:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError("Topic latency budget exhausted")
+        remaining.append(left)
+    return min(remaining)
+
+def is_retryable(error):
+    """True for failures worth another attempt: dropped connections, rate limits and server errors."""
+    import openai
+    if isinstance(error, openai.APITimeoutError):
+        return False
+    return isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+def missed_budget(error):
+    """True when a call failed because its latency budget ran out."""
+    import openai
+    return isinstance(error, (TimeoutError, openai.APITimeoutError))
+
+def call_llm(client, stage, template, fields, **kwargs):
+    """
+    Run a chat completion of `template` (rendered with `fields`) on the model
+    configured for `stage` and record its latency and token usage, including
+    prompt tokens served from the provider's prompt cache. Returns
+    (response, metrics_record); callers add stage-specific quality proxies
+    (keys prefixed with "q_") to the record.
+    """
+    model, variant = select_stage_model(stage)
+    cancellation.raise_if_cancelled()
+    messages = template.render(**fields)
+    kwargs.setdefault("prompt_cache_key", template.cache_key)
+    
+    session = current_session()
+    # Calls on the same key share its rate limit, so they queue fairly for it
+    with session.slot("llm", scheduling.key_pool(client.api_key)):
+        # Under a latency budget each call gets the smaller of the LLM budget and
+        # what's left of the topic deadline. The SDK's own retries would each
+        # start a fresh timeout, so retries are made here, only while enough of
+        # that time is left
+        timeout = llm_timeout()
+        call_deadline = None if timeout is None else time.monotonic() + timeout
+        retries = BUDGET_RETRIES
+        
+        start = time.perf_counter()
+        while True:
+            attempt = client
+            if call_deadline is not None:
+                attempt = client.with_options(timeout=max(0.0, call_deadline - time.monotonic()), max_retries=0)
+            try:
+                if stage in HEDGED_STAGES and session.hedge_percentile is not None:
+                    response = hedging.get_hedger(f"{stage}:{model}").run(
+                        lambda attempt_client: attempt_client.with_options(
+                            timeout=attempt.timeout, max_retries=attempt.max_retries
+                        ).chat.completions.create(model=model, messages=messages, **kwargs),
+                        lambda: clients.checkout(client.api_key),
+                        percentile=session.hedge_percentile,
+                        prompt_tokens=lambda r: r.usage.prompt_tokens if r.usage else 0,
+                        release=clients.checkin
+                    )
+                else:
+                    response = attempt.chat.completions.create(model=model, messages=messages, **kwargs)
+                break
+            except Exception as e:
+                # Cancelling closes the client, which surfaces here as a connection error
+                cancellation.raise_if_cancelled()
+                if call_deadline is None or not retries or not is_retryable(e):
+                    raise
+                if call_deadline - time.monotonic() < MIN_RETRY_S:
+                    raise
+                retries -= 1
+    record = {
+        "stage": stage,
+        "variant": variant,
+        "model": model,
+        "prompt_version": template.version,
+        "latency_s": time.perf_counter() - start,
+        "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+        "cached_tokens": cached_prompt_tokens(response.usage),
+        "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+    }
+    session.stage_metrics.append(record)
+    llm_usage.tokens = getattr(llm_usage, "tokens", 0) + (response.usage.total_tokens if response.usage else 0)
+    return response, record
+
+def cached_prompt_tokens(usage):
+    """Prompt tokens the provider served from its prompt cache (0 when not reported)."""
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    return getattr(details, "cached_tokens", None) or 0
+
+def toc_key(subject, grade):
+    """
+    In-flight and cache key for a TOC request; identical across sessions asking
+    for the same curriculum. Includes the prompt version, so rewording a
+    prompt stops serving results generated from the old wording.
+    """
+    return (
+        "toc", subject.strip().lower(), str(grade).strip().lower(), current_stage_models()["toc"],
+        prompts.version_of("toc")
+    )
+
+def lesson_key(subject, grade, mode, topic):
+    """In-flight key for one lesson request."""
+    return (
+        "lesson", subject.strip().lower(), str(grade).strip().lower(), mode, topic.strip().lower(),
+        current_stage_models()["lesson"], prompts.version_of("lesson", "lesson_sections", "lesson_batch", "video_intents")
+    )
+
+def coalesced_call(key, fn, *args, **kwargs):
+    """
+    Run fn through the process-wide in-flight registry, attaching to an
+    identical running job. The leader's calls carry a priority boost, so a
+    teacher's Generate that joins a lesson speculation or pre-warm is leading
+    lifts it out of the background queue instead of waiting behind it.
+    """
+    session = current_session()
+    boost = scheduling.PriorityBoost(session.boost)
+    
+    def lead():
+        set_session(session.boosted(boost))
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            set_session(session)
+    
+    result, coalesced = inflight.REGISTRY.run(key, lead, boost=boost, priority=session.priority)
+    if coalesced:
+        session.count("coalesced_calls")
+    return result
+
+def use_generation_cache():
+    """Whether to read and write the generation cache; A/B runs always call the API so the comparison measures real completions."""
+    session = current_session()
+    return session.use_cache and not session.ab_stage_models
+
+def cached_toc(client, grade, subject):
+    """Serve a TOC from the generation cache, else generate it (coalesced) and cache it. Returns (toc, cached)."""
+    key = toc_key(subject, grade)
+    if use_generation_cache():
+        hit = store.get_cached(key)
+        if hit:
+            current_session().count("cache_hits")
+            return hit[0], True
+    
+    toc = coalesced_call(key, get_table_of_contents, client, grade, subject)
+    if toc and use_generation_cache():
+        store.put_cached(key, toc)
+    return toc, False
+
+def cached_lesson(client, grade, subject, mode, topic, sequence_num, split=False):
+    """Serve a lesson from the generation cache, else generate it (coalesced) and cache it. Returns (data, tokens, cached)."""
+    key = lesson_key(subject, grade, mode, topic)
+    if use_generation_cache():
+        hit = store.get_cached(key)
+        if hit:
+            current_session().count("cache_hits")
+            return hit[0], 0, True
+    
+    data, tokens = coalesced_call(
+        key, generate_topic_content, client, grade, subject, mode, topic, sequence_num,
+        split=split, budgets=current_latency_budgets()
+    )
+    # Lessons degraded by a latency budget are cached once their pending parts are filled in
+    if data and not data.get('pending') and use_generation_cache():
+        store.put_cached(key, data, tokens)
+    return data, tokens, False
+
+def cached_lesson_batch(client, grade, subject, mode, items, split=False):
+    """
+    Batched counterpart of cached_lesson for (seq, topic) items: cached topics
+    are served from the cache, the rest go out as one batched completion, and
+    topics already being generated elsewhere are joined once it is sent. The
+    batch leads its topics in the in-flight registry, so a cached_lesson for
+    one of them (e.g. speculation) joins the batch instead of generating it
+    again. Returns [(data, tokens, cached)] in item order.
+    """
+    session = current_session()
+    boost = scheduling.PriorityBoost(session.boost)
+    results = {}
+    todo = []
+    claimed = {}
+    joined = []
+    for seq, topic in items:
+        key = lesson_key(subject, grade, mode, topic)
+        hit = store.get_cached(key) if use_generation_cache() else None
+        if hit:
+            session.count("cache_hits")
+            results[seq] = (hit[0], 0, True)
+            continue
+        future = inflight.REGISTRY.claim(key, boost=boost)
+        if future is None:
+            joined.append((seq, topic))
+        else:
+            claimed[seq] = (key, future)
+            todo.append((seq, topic))
+    
+    if todo:
+        set_session(session.boosted(boost))
+        try:
+            generated = generate_topic_batch(
+                client, grade, subject, mode, todo, split=split, budgets=current_latency_budgets()
+            )
+        except BaseException as e:
+            for key, future in claimed.values():
+                inflight.REGISTRY.settle(key, future, error=e)
+            raise
+        finally:
+            set_session(session)
+        for (seq, topic), (data, tokens) in zip(todo, generated):
+            key, future = claimed[seq]
+            inflight.REGISTRY.settle(key, future, (data, tokens))
+            results[seq] = (data, tokens, False)
+        for seq, topic in todo:
+            data, tokens, cached = results[seq]
+            if data and not data.get('pending') and use_generation_cache():
+                store.put_cached(claimed[seq][0], data, tokens)
+    
+    for seq, topic in joined:
+        results[seq] = cached_lesson(client, grade, subject, mode, topic, seq, split=split)
+    
+    return [results[seq] for seq, topic in items]
+
+def lesson_quality(data):
+    """Cheap output-quality proxies for a lesson dict, used to compare model tiers."""
+    videos = data.get('videos', [])
+    return {
+        "q_overview_words": len(str(data.get('overview', '')).split()),
+        "q_objectives": len(data.get('objectives', [])),
+        "q_materials": len(data.get('materials', [])),
+        "q_steps": len(data.get('experiment', {}).get('steps', [])),
+        "q_videos": len(videos),
+        "q_experiment_videos": len([v for v in videos if v.get('type') == 'Experiment Demo']),
+    }
+
+def get_mode_guides(mode):
+    """Return (exp_context, exp_guide, video_guide) for a learning mode."""
+    if mode == "Physical (Classroom)":
+        exp_context = "PHYSICAL CLASSROOM LAB"
+        exp_guide = "Use standard school science lab equipment (microscopes, beakers, graduated cylinders, safety goggles, Bunsen burners, etc.)."
+        video_guide = "Include formal laboratory demonstrations showing proper equipment usage and safety procedures."
+    else:
+        exp_context = "HOME/VIRTUAL LEARNING"
+        exp_guide = "Use ONLY safe, common household items (no hazardous chemicals, no dangerous equipment)."
+        video_guide = "Include DIY demonstrations using household materials that are safe for home experiments."
+    return exp_context, exp_guide, video_guide
+
+def repair_json_output(client, raw_text):
+    """Ask the repair-tier model to turn malformed model output into valid JSON."""
+    response, record = call_llm(
+        client,
+        "repair",
+        prompts.REPAIR,
+        {"raw_text": raw_text},
+        response_format={"type": "json_object"},
+        temperature=0
+    )
+    data = json.loads(response.choices[0].message.content)
+    record["q_repaired"] = 1
+    return data, response.usage.total_tokens
+
+def generate_video_intents(client, grade, subject, mode, topic, experiment_only=False):
+    """Generate only the YouTube search intents for a topic on the video-intents tier."""
+    exp_context, exp_guide, video_guide = get_mode_guides(mode)
+    
+    if experiment_only:
+        counts = '- 4-6 of type "Experiment Demo" for practical demonstrations (no "Theory" videos)'
+    else:
+        counts = """- 6-8 of type "Theory" for conceptual learning
+- 4-6 of type "Experiment Demo" for practical demonstrations"""
+    
+    response, record = call_llm(
+        client,
+        "video_intents",
+        prompts.VIDEO_INTENTS,
+        {
+            "subject": subject, "grade": grade, "topic": topic, "exp_context": exp_context,
+            "video_guide": video_guide, "count": "4-6" if experiment_only else "10-12", "counts": counts
+        },
+        response_format={"type": "json_object"},
+        temperature=0.7
+    )
+    videos = json.loads(response.choices[0].message.content).get('videos', [])
+    record["q_videos"] = len(videos)
+    return videos, response.usage.total_tokens
+
+def fetch_youtube_results_html(search_query):
+    """Download the raw YouTube search results page for a query."""
+    import urllib.request
+
+    # Encode the search query
+    encoded_query = urllib.parse.quote(search_query)
+    search_url = f"https://www.youtube.com/results?search_query={encoded_query}"
+
+    # Make HTTP request to YouTube search
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept-Language': 'en-US,en;q=0.9'
+    }
+    req = urllib.request.Request(search_url, headers=headers)
+
+    with urllib.request.urlopen(req, timeout=10) as response:
+        return response.read().decode('utf-8')
+
+def _yt_text(node):
+    """Flatten a YouTube text node ({'simpleText': ...} or {'runs': [...]}) to a string."""
+    if not isinstance(node, dict):
+        return ""
+    if 'simpleText' in node:
+        return node['simpleText']
+    return "".join(run.get('text', '') for run in node.get('runs', []))
+
+def _iter_video_renderers(node):
+    """Walk ytInitialData depth-first and yield every videoRenderer in page order."""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            if 'videoRenderer' in current:
+                yield current['videoRenderer']
+                continue
+            stack.extend(reversed(list(current.values())))
+        elif isinstance(current, list):
+            stack.extend(reversed(current))
+
+def parse_yt_initial_data(html):
+    """
+    Parse the ytInitialData JSON embedded in a YouTube results page into
+    real video metadata records (video_id, title, channel, description, duration).
+    """
+    match = re.search(r'(?:var\s+|window\[["\'])ytInitialData(?:["\']\])?\s*=\s*', html)
+    if not match:
+        return []
+
+    try:
+        initial_data, _ = json.JSONDecoder().raw_decode(html, match.end())
+    except ValueError:
+        return []
+
+    records = []
+    for renderer in _iter_video_renderers(initial_data):
+        video_id = renderer.get('videoId')
+        if not video_id:
+            continue
+
+        snippets = renderer.get('detailedMetadataSnippets') or []
+        if snippets:
+            description = _yt_text(snippets[0].get('snippetText'))
+        else:
+            description = _yt_text(renderer.get('descriptionSnippet'))
+
+        records.append({
+            'video_id': video_id,
+            'real_url': f"https://www.youtube.com/watch?v={video_id}",
+            'title': _yt_text(renderer.get('title')),
+            'channel': _yt_text(renderer.get('ownerText') or renderer.get('longBylineText')),
+            'description': description,
+            # Live streams and premieres have no lengthText
+            'duration': _yt_text(renderer.get('lengthText')) or "Live",
+        })
+    return records
+
+def get_real_youtube_video(search_query):
+    """
+    Search YouTube and return metadata for the first real video using direct HTTP scraping.
+    Metadata comes from the page's ytInitialData, so it matches the video we embed.
+    Returns None when the page has no video; network errors propagate.
+    """
+    html = fetch_youtube_results_html(search_query)
+
+    records = parse_yt_initial_data(html)
+    if records:
+        return records[0]
+
+    # Fall back to the bare videoId when the embedded JSON layout changes
+    # YouTube video IDs are in the format: "videoId":"VIDEO_ID_HERE"
+    pattern = r'"videoId":"([a-zA-Z0-9_-]{11})"'
+    matches = re.findall(pattern, html)
+
+    if matches:
+        video_id = matches[0]  # Get the first video
+        return {
+            'video_id': video_id,
+            'real_url': f"https://www.youtube.com/watch?v={video_id}",
+        }
+    else:
+        return None
+
+
+def extract_video_id(url):
+    """Extract YouTube video ID from various URL formats."""
+    if not url:
+        return None
+    patterns = [
+        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
+        r'(?:embed\/)([0-9A-Za-z_-]{11})',
+        r'^([0-9A-Za-z_-]{11})$'
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+def get_table_of_contents(client, grade, subject):
+    """Generate REALISTIC curriculum topics based on actual subject standards."""
+    
+    try:
+        response, record = call_llm(
+            client,
+            "toc",
+            prompts.TOC,
+            {"subject": subject, "grade": grade},
+            temperature=0.6
+        )
+        toc = response.choices[0].message.content.strip()
+        record["q_topics"] = len(parse_topics(toc))
+        return toc
+    except Exception as e:
+        current_session().report("error", f"Error generating curriculum: {e}")
+        return None
+
+def parse_topics(toc_text):
+    """Extract clean topic names from numbered list."""
+    lines = toc_text.split('\n')
+    topics = []
+    for line in lines:
+        clean_line = re.sub(r'^\d+\.\s*', '', line).strip()
+        if clean_line and len(clean_line) > 3:
+            topics.append(clean_line)
+    return topics
+
+def generate_topic_content(client, grade, subject, mode, topic, sequence_num, split=False, budgets=None):
+    """
+    Generate comprehensive lesson content with MULTIPLE relevant videos.
+    
+    With `budgets` ({"llm_s", "videos_s", "topic_s"}) the topic is delivered
+    with whatever is ready when a budget runs out: parts that missed it are
+    listed under "pending" (unresolved videos become search links) and are
+    filled in later in the background.
+    """
+    thread_budget.llm_s = budgets.get("llm_s") if budgets else None
+    thread_budget.deadline = time.monotonic() + budgets["topic_s"] if budgets and budgets.get("topic_s") else None
+    thread_budget.videos_s = budgets.get("videos_s") if budgets else None
+    
+    try:
+        if split:
+            return generate_topic_content_split(client, grade, subject, mode, topic)
+        return generate_topic_content_monolithic(client, grade, subject, mode, topic)
+    finally:
+        thread_budget.llm_s = thread_budget.deadline = thread_budget.videos_s = None
+
+def generate_topic_content_monolithic(client, grade, subject, mode, topic):
+    """Generate the whole lesson in one large JSON completion."""
+    
+    exp_context, exp_guide, video_guide = get_mode_guides(mode)
+
+    try:
+        llm_start = time.perf_counter()
+        response, record = call_llm(
+            client,
+            "lesson",
+            prompts.LESSON,
+            {
+                "subject": subject, "grade": grade, "topic": topic,
+                "exp_context": exp_context, "exp_guide": exp_guide, "video_guide": video_guide
+            },
+            response_format={"type": "json_object"},
+            temperature=0.7
+        )
+        total_tokens = response.usage.total_tokens
+        raw_text = response.choices[0].message.content
+        
+        try:
+            data = json.loads(raw_text)
+            record["q_json_valid"] = 1
+        except json.JSONDecodeError:
+            record["q_json_valid"] = 0
+            data, repair_tokens = repair_json_output(client, raw_text)
+            total_tokens += repair_tokens
+        
+        record.update(lesson_quality(data))
+        
+        # Lessons that come back without search intents get them from the light tier
+        if not data.get('videos'):
+            data['videos'], intent_tokens = generate_video_intents(client, grade, subject, mode, topic)
+            total_tokens += intent_tokens
+        
+        record_topic_latency("monolithic", time.perf_counter() - llm_start, tokens=total_tokens)
+        
+        if resolve_videos(data.get('videos', []), video_deadline()):
+            data['pending'] = ['videos']
+        
+        return data, total_tokens
+    
+    except Exception as e:
+        if missed_budget(e):
+            # One large completion that misses the deadline has nothing to show;
+            # sections requested separately deliver whatever is ready instead
+            current_session().report("warning", f"'{topic}' missed its latency budget, delivering it in parts: {e}")
+            return generate_topic_content_split(client, grade, subject, mode, topic)
+        current_session().report("error", f"Error generating content: {e}")
+        return None, 0
+
+def generate_topic_content_split(client, grade, subject, mode, topic):
+    """
+    Generate a lesson as concurrent sub-requests (text sections, activity,
+    video intents) merged into the same dict shape as the monolithic call,
+    so per-topic latency is set by the largest section rather than the sum.
+    """
+    session = current_session()
+    token = cancellation.current_token()
+    budget = dict(vars(thread_budget))
+    
+    def init_worker():
+        set_session(session)
+        cancellation.set_current_token(token)
+        vars(thread_budget).update(budget)
+    
+    try:
+        llm_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=3, initializer=init_worker) as pool:
+            text_future = pool.submit(
+                generate_lesson_sections, client, grade, subject, mode, topic, ["overview", "objectives"]
+            )
+            activity_future = pool.submit(
+                generate_lesson_sections, client, grade, subject, mode, topic, ["materials", "experiment"]
+            )
+            videos_future = pool.submit(generate_video_intents, client, grade, subject, mode, topic)
+            
+            # Deliver whichever parts are ready; parts that miss the budget
+            # (or fail) are listed as pending and filled in later
+            data = {"title": topic, "videos": []}
+            pending = []
+            errors = []
+            total_tokens = 0
+            for parts, future in (
+                (["overview", "objectives"], text_future),
+                (["materials", "experiment"], activity_future),
+                (["videos"], videos_future),
+            ):
+                try:
+                    value, tokens = future.result()
+                except Exception as e:
+                    pending += parts
+                    errors.append(e)
+                    continue
+                if parts == ["videos"]:
+                    data["videos"] = value
+                else:
+                    data.update(value)
+                total_tokens += tokens
+        
+        # With nothing ready the topic is only delivered (all pending) when the
+        # budget is to blame; sections that all failed outright fail the topic
+        if len(pending) == 5 and not all(missed_budget(e) for e in errors):
+            raise errors[0]
+        record_topic_latency("split", time.perf_counter() - llm_start, tokens=total_tokens)
+        
+        if resolve_videos(data['videos'], video_deadline()):
+            pending.append('videos')
+        if pending:
+            data['pending'] = list(dict.fromkeys(pending))
+        
+        return data, total_tokens
+    
+    except Exception as e:
+        current_session().report("error", f"Error generating content: {e}")
+        return None, 0
+
+def lesson_output_estimate():
+    """Completion tokens per lesson, learned from this session's batched calls once there are any."""
+    batched = [m for m in current_session().stage_metrics if "q_batch_valid" in m]
+    if batched:
+        completion = sum(m["completion_tokens"] for m in batched)
+        return max(1, completion / max(1, sum(m["q_batch_valid"] for m in batched)))
+    return DEFAULT_LESSON_OUTPUT_TOKENS
+
+def lesson_batch_size():
+    """Topics per batched completion: as many lessons as fit in 80% of the lesson model's output limit."""
+    limit = MAX_OUTPUT_TOKENS.get(current_stage_models()["lesson"], 16384)
+    return max(1, min(BATCH_MAX_TOPICS, int(limit * 0.8 // lesson_output_estimate())))
+
+def validate_lesson(data):
+    """True when a lesson dict has every section the topic card renders."""
+    return (
+        isinstance(data, dict)
+        and isinstance(data.get('overview'), str) and bool(data['overview'].strip())
+        and isinstance(data.get('objectives'), list) and bool(data['objectives'])
+        and isinstance(data.get('materials'), list) and bool(data['materials'])
+        and isinstance(data.get('experiment'), dict) and bool(data['experiment'].get('steps'))
+        and isinstance(data.get('videos', []), list)
+    )
+
+def generate_topic_batch(client, grade, subject, mode, items, split=False, budgets=None):
+    """
+    Generate lessons for several (seq, topic) items in one structured
+    completion (an array of lesson objects), so the instruction overhead is
+    paid once. Each lesson is validated on its own; topics missing from the
+    reply or failing validation are re-issued individually. Returns
+    [(data, tokens)] in item order.
+    
+    With `budgets` the batch as a whole runs under one deadline: topic_s plus
+    BATCH_TOPIC_ALLOWANCE_S for every topic past the first (at most
+    BATCH_MAX_TOPICS - 1 of them), with llm_s scaled by the topic count inside
+    it and videos_s applying to the shared scrape fan-out. A batch that misses
+    its deadline falls back to generating its topics one at a time, each under
+    the ordinary per-topic budgets.
+    """
+    exp_context, exp_guide, video_guide = get_mode_guides(mode)
+    topics = [topic for seq, topic in items]
+    lessons = {}
+    total_tokens = 0
+    
+    # The LLM budget scales with the number of lessons requested; the deadline grows by a bounded allowance
+    extra = min(len(topics), BATCH_MAX_TOPICS) - 1
+    thread_budget.llm_s = budgets["llm_s"] * len(topics) if budgets and budgets.get("llm_s") else None
+    thread_budget.deadline = (
+        time.monotonic() + budgets["topic_s"] + BATCH_TOPIC_ALLOWANCE_S * extra
+        if budgets and budgets.get("topic_s") else None
+    )
+    thread_budget.videos_s = budgets.get("videos_s") if budgets else None
+    try:
+        llm_start = time.perf_counter()
+        response, record = call_llm(
+            client,
+            "lesson",
+            prompts.LESSON_BATCH,
+            {
+                "subject": subject, "grade": grade, "exp_context": exp_context, "exp_guide": exp_guide,
+                "video_guide": video_guide, "topics": "\n".join(f"{i}. {t}" for i, t in enumerate(topics, 1))
+            },
+            response_format={"type": "json_object"},
+            temperature=0.7,
+            max_tokens=MAX_OUTPUT_TOKENS.get(current_stage_models()["lesson"], 16384)
+        )
+        total_tokens = response.usage.total_tokens
+        try:
+            returned = json.loads(response.choices[0].message.content).get('lessons', [])
+        except (json.JSONDecodeError, AttributeError):
+            # Usually a reply cut off at the output limit; every topic is re-issued
+            returned = []
+        returned = [lesson for lesson in returned if isinstance(lesson, dict)]
+        
+        by_title = {str(lesson.get('title', '')).strip().lower(): lesson for lesson in returned}
+        for i, topic in enumerate(topics):
+            lesson = by_title.get(topic.strip().lower())
+            if lesson is None and len(returned) == len(topics):
+                lesson = returned[i]
+            if validate_lesson(lesson):
+                lesson['title'] = topic
+                lessons[topic] = lesson
+        
+        record["q_batch_topics"] = len(topics)
+        record["q_batch_valid"] = len(lessons)
+        record_topic_latency("batched", time.perf_counter() - llm_start, topics=len(lessons), tokens=total_tokens)
+        
+        for topic, lesson in lessons.items():
+            if not lesson.get('videos'):
+                try:
+                    lesson['videos'], intent_tokens = generate_video_intents(client, grade, subject, mode, topic)
+                    total_tokens += intent_tokens
+                except Exception as e:
+                    if not missed_budget(e):
+                        raise
+                    # Past the batch deadline the lessons already written still ship; videos follow
+                    lesson['videos'] = []
+        
+        # One scrape fan-out for the whole batch; lessons with search-link fallbacks fill in later
+        resolve_videos([v for lesson in lessons.values() for v in lesson['videos']], video_deadline())
+        for lesson in lessons.values():
+            if not lesson['videos'] or any(v.get('search_url') for v in lesson['videos']):
+                lesson['pending'] = ['videos']
+    except Exception as e:
+        current_session().report("warning", f"Batched generation failed, generating topics one at a time: {e}")
+    finally:
+        thread_budget.llm_s = thread_budget.deadline = thread_budget.videos_s = None
+    
+    share = total_tokens // max(1, len(lessons))
+    results = []
+    for seq, topic in items:
+        if topic in lessons:
+            results.append((lessons[topic], share))
+        else:
+            results.append(generate_topic_content(client, grade, subject, mode, topic, seq, split=split, budgets=budgets))
+    return results
+
+def generate_lesson_sections(client, grade, subject, mode, topic, sections):
+    """Generate only the requested lesson sections with a minimal prompt."""
+    exp_context, exp_guide, video_guide = get_mode_guides(mode)
+    
+    response, record = call_llm(
+        client,
+        "lesson",
+        prompts.LESSON_SECTIONS_PROMPT,
+        {
+            "subject": subject, "grade": grade, "topic": topic, "exp_context": exp_context,
+            "exp_guide": exp_guide, "sections": ", ".join(sections)
+        },
+        response_format={"type": "json_object"},
+        temperature=0.7
+    )
+    data = json.loads(response.choices[0].message.content)
+    record.update(lesson_quality(data))
+    return {name: data[name] for name in sections if name in data}, response.usage.total_tokens
+
+def regenerate_section(client, grade, subject, mode, topic, section):
+    """
+    Regenerate a single lesson section with the minimal prompt for it.
+    Returns (new_value, tokens); the caller patches the stored lesson in place.
+    """
+    try:
+        if section == "videos":
+            videos, tokens = generate_video_intents(client, grade, subject, mode, topic)
+            resolve_videos(videos)
+            return videos, tokens
+        
+        data, tokens = generate_lesson_sections(client, grade, subject, mode, topic, [section])
+        return data.get(section), tokens
+    
+    except Exception as e:
+        current_session().report("error", f"Error regenerating {section}: {e}")
+        return None, 0
+
+def is_adjacent_grade(old_grade, new_grade):
+    """True when two grade levels are numerically one apart (e.g. "9" -> "10")."""
+    try:
+        return abs(int(str(old_grade).strip()) - int(str(new_grade).strip())) == 1
+    except ValueError:
+        return False
+
+def adapt_lesson(client, lesson, grade, subject, mode, mode_changed, grade_changed):
+    """
+    Differentially regenerate a lesson for a new learning mode and/or an
+    adjacent grade. Only mode-dependent parts (materials, experiment,
+    experiment-demo videos) and grade-dependent parts (overview, objectives)
+    are regenerated; everything else is reused. Returns (new_lesson, tokens).
+    """
+    topic = lesson.get('title', '')
+    sections = []
+    if grade_changed:
+        sections += GRADE_DEPENDENT_SECTIONS
+    if mode_changed:
+        sections += MODE_DEPENDENT_SECTIONS
+    
+    try:
+        new_lesson = dict(lesson)
+        total_tokens = 0
+        
+        if sections:
+            data, tokens = generate_lesson_sections(client, grade, subject, mode, topic, sections)
+            new_lesson.update(data)
+            total_tokens += tokens
+        
+        if mode_changed:
+            demo_videos, tokens = generate_video_intents(client, grade, subject, mode, topic, experiment_only=True)
+            resolve_videos(demo_videos)
+            theory_videos = [v for v in lesson.get('videos', []) if v.get('type') != 'Experiment Demo']
+            new_lesson['videos'] = theory_videos + demo_videos
+            total_tokens += tokens
+        
+        return new_lesson, total_tokens
+    
+    except Exception as e:
+        current_session().report("error", f"Error adapting '{topic}': {e}")
+        return None, 0
+
+def video_deadline():
+    """Monotonic deadline for video resolution on this thread, or None when unbudgeted."""
+    deadlines = []
+    if getattr(thread_budget, "videos_s", None):
+        deadlines.append(time.monotonic() + thread_budget.videos_s)
+    if getattr(thread_budget, "deadline", None):
+        deadlines.append(thread_budget.deadline)
+    return min(deadlines) if deadlines else None
+
+def resolve_videos(videos, deadline=None):
+    """
+    Resolve each search intent to a real YouTube video and its metadata, in
+    place. Scrapes run concurrently; intents still unresolved at `deadline`
+    fall back to a YouTube search link. Returns the number left unresolved.
+    """
+    token = cancellation.current_token()
+    session = current_session()
+    
+    def scrape(search_query):
+        cancellation.set_current_token(token)
+        cancellation.raise_if_cancelled()
+        # Get real video from YouTube scraping
+        return get_real_youtube_video(search_query)
+    
+    # Scrapes from every session share the process-wide scrape slots, taken in fair order
+    scheduler = scheduling.get_scheduler("scrape")
+    futures = {
+        scheduler.submit(
+            scrape, video['search_query'],
+            flow=session.flow, priority=session.priority, weight=session.weight, boost=session.boost
+        ): video
+        for video in videos if video.get('search_query')
+    }
+    timeout = None if deadline is None else max(0, deadline - time.monotonic())
+    done, not_done = wait(futures, timeout=timeout)
+    cancellation.raise_if_cancelled()
+    
+    for future in done:
+        video = futures[future]
+        error = future.exception()
+        # Reported from the caller's thread: pool threads have no Streamlit
+        # script context, so the app's session couldn't draw anything there
+        if isinstance(error, Exception):
+            session.report("error", f"YouTube search failed for '{video['search_query']}': {error}")
+        meta = future.result() if not error else None
+        if meta:
+            video.update({k: v for k, v in meta.items() if v})
+        else:
+            video['real_url'] = None
+    
+    for future in not_done:
+        future.cancel()
+        video = futures[future]
+        video['real_url'] = None
+        video['search_url'] = f"https://www.youtube.com/results?search_query={urllib.parse.quote(video['search_query'])}"
+    
+    return len(not_done)
+
+def record_topic_latency(strategy, seconds, topics=1, tokens=0):
+    """Record the LLM phase latency and tokens of one request for the generation strategy comparison."""
+    current_session().topic_latencies.append(
+        {"strategy": strategy, "latency_s": seconds, "topics": topics, "tokens": tokens}
+    )
+
+
+# --- PENDING PART FILL-IN ---
+def fill_pending(client, lesson, grade, subject, mode, curriculum_id, position, run_id=None):
+    """Fill in a lesson's pending parts in place (unbudgeted), then persist it (and its run checkpoint)."""
+    topic = lesson.get('title', '')
+    pending = lesson.get('pending', [])
+    
+    sections = [part for part in pending if part in prompts.LESSON_SECTIONS]
+    if sections:
+        lesson.update(generate_lesson_sections(client, grade, subject, mode, topic, sections)[0])
+    
+    if 'videos' in pending:
+        if not lesson.get('videos'):
+            lesson['videos'] = generate_video_intents(client, grade, subject, mode, topic)[0]
+        resolve_videos([v for v in lesson['videos'] if not v.get('real_url')])
+        for video in lesson['videos']:
+            video.pop('search_url', None)
+    
+    lesson.pop('pending', None)
+    if curriculum_id is not None:
+        store.update_lesson(curriculum_id, position, lesson)
+    if run_id is not None:
+        store.update_run_lesson(run_id, position, lesson)
+    store.put_cached(lesson_key(subject, grade, mode, topic), lesson)
+
+
+# --- BACKGROUND JOB HELPERS ---
+def prewarm_toc(client, subject, grade):
+    """Warm one TOC. Returns (topics, tokens, cached) for the pre-warm job."""
+    llm_usage.tokens = 0
+    toc, cached = cached_toc(client, grade, subject)
+    return (parse_topics(toc) if toc else []), llm_usage.tokens, cached
+
+def prewarm_lesson(client, subject, grade, mode, topic, seq):
+    """Warm one lesson. Returns (tokens, cached) for the pre-warm job."""
+    llm_usage.tokens = 0
+    data, tokens, cached = cached_lesson(client, grade, subject, mode, topic, seq)
+    return llm_usage.tokens, cached
+
+def bulk_request_body(template, fields, model, **kwargs):
+    """Chat-completions body for one Batch API line, rendered the same way call_llm renders it."""
+    return {"model": model, "messages": template.render(**fields), "prompt_cache_key": template.cache_key, **kwargs}
+
+def bulk_toc_request(subject, grade, models):
+    return bulk_request_body(prompts.TOC, {"subject": subject, "grade": grade}, models["toc"], temperature=0.6)
+
+def bulk_lesson_request(subject, grade, mode, topic, models):
+    exp_context, exp_guide, video_guide = get_mode_guides(mode)
+    return bulk_request_body(
+        prompts.LESSON,
+        {
+            "subject": subject, "grade": grade, "topic": topic,
+            "exp_context": exp_context, "exp_guide": exp_guide, "video_guide": video_guide
+        },
+        models["lesson"],
+        response_format={"type": "json_object"},
+        temperature=0.7
+    )
+
+def ingest_bulk_lesson(client, subject, grade, mode, topic, text):
+    """
+    Turn one batched lesson completion into a lesson the way
+    generate_topic_content does: validate it, back-fill missing search
+    intents and resolve the videos. Unusable output raises, so the topic is
+    resubmitted in the next batch instead of being repaired synchronously.
+    """
+    data = json.loads(text)
+    if not validate_lesson(data):
+        raise ValueError("lesson is missing sections")
+    data.setdefault('title', topic)
+    if not data.get('videos'):
+        data['videos'], tokens = generate_video_intents(client, grade, subject, mode, topic)
+    resolve_videos(data['videos'])
+    store.put_cached(lesson_key(subject, grade, mode, topic), data)
+    return data
+
+
+# --- HEADLESS CURRICULUM GENERATION ---
+def generate_curriculum(client, subject, grade, mode, split=False, batch=False, max_topics=None):
+    """
+    Generate a whole curriculum (TOC, then each topic's lesson) on the current
+    thread under the current session. Returns a dict with the TOC, topics,
+    lessons in topic order (None for topics that failed) and the tokens spent.
+    """
+    llm_usage.tokens = 0
+    toc, cached = cached_toc(client, grade, subject)
+    if not toc:
+        raise RuntimeError(f"No table of contents for {subject} grade {grade}")
+    topics = parse_topics(toc)
+    items = list(enumerate(topics, 1))[:max_topics]
+    
+    if batch:
+        results = []
+        while len(results) < len(items):
+            chunk = items[len(results):len(results) + lesson_batch_size()]
+            results += cached_lesson_batch(client, grade, subject, mode, chunk, split=split)
+    else:
+        results = [cached_lesson(client, grade, subject, mode, topic, seq, split=split) for seq, topic in items]
+    
+    return {
+        "subject": subject,
+        "grade": str(grade),
+        "mode": mode,
+        "toc_text": toc,
+        "topics": topics,
+        "lessons": [data for data, tokens, cached in results],
+        "tokens": llm_usage.tokens,
+    }
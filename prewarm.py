@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+
+# --- OFF-PEAK PRE-WARM JOB ---
+# Generates and caches TOCs and lesson plans for popular subject x grade x mode
+# combinations overnight so morning requests are served from cache.
+
+logger = logging.getLogger(__name__)
+
+# Subjects the TOC prompt already knows typical chapter counts for
+DEFAULT_SUBJECTS = ["Physics", "Chemistry", "Biology", "Algebra", "Geometry", "US History", "World History"]
+DEFAULT_GRADES = ["9", "10", "11", "12"]
+DEFAULT_MODES = ["Physical (Classroom)", "Online (Virtual)"]
+
+
+def load_matrix(path=None):
+    """
+    Load the subject x grade x mode matrix to pre-warm. The optional JSON file
+    holds {"subjects": [...], "grades": [...], "modes": [...]}; missing keys use the defaults.
+    """
+    config = {}
+    path = path or os.environ.get("EDUPLAN_PREWARM_MATRIX")
+    if path and os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+
+    return [
+        (subject, str(grade), mode)
+        for subject in config.get("subjects", DEFAULT_SUBJECTS)
+        for grade in config.get("grades", DEFAULT_GRADES)
+        for mode in config.get("modes", DEFAULT_MODES)
+    ]
+
+
+def in_window(now, start_hour, end_hour):
+    """True when `now` falls in the off-peak window (which may wrap past midnight)."""
+    if start_hour <= end_hour:
+        return start_hour <= now.hour < end_hour
+    return now.hour >= start_hour or now.hour < end_hour
+
+
+def seconds_until_window(now, start_hour):
+    """Seconds from `now` until the next start of the off-peak window."""
+    start = now.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+    if start <= now:
+        start += timedelta(days=1)
+    return (start - now).total_seconds()
+
+
+class PrewarmJob:
+    """
+    Walks the matrix and warms the cache through the supplied callables:
+
+    - warm_toc(subject, grade) -> (topics, tokens, cached)
+    - warm_lesson(subject, grade, mode, topic, seq) -> (tokens, cached)
+
+    Only uncached work counts against the requests-per-minute limit and the
+    per-run token budget; the run stops as soon as the budget is spent or
+    the off-peak window closes.
+    """
+
+    def __init__(self, warm_toc, warm_lesson, matrix=None, token_budget=2_000_000,
+                 requests_per_minute=20, window=(1, 5)):
+        self.warm_toc = warm_toc
+        self.warm_lesson = warm_lesson
+        self.matrix = matrix if matrix is not None else load_matrix()
+        self.token_budget = token_budget
+        self.min_interval = 60.0 / requests_per_minute if requests_per_minute else 0
+        self.window = window
+        self.stop_event = threading.Event()
+        self.status = {
+            "state": "idle",
+            "last_run_started": None,
+            "last_run_finished": None,
+            "tokens_spent": 0,
+            "tocs_warmed": 0,
+            "lessons_warmed": 0,
+            "cache_hits": 0,
+            "failures": 0,
+        }
+        self._last_request = 0.0
+        self._thread = None
+
+    def _throttle(self):
+        """Space uncached requests out to respect the rate limit."""
+        wait = self._last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            self.stop_event.wait(wait)
+        self._last_request = time.monotonic()
+
+    def _should_continue(self, respect_window):
+        if self.stop_event.is_set():
+            return False
+        if self.status["tokens_spent"] >= self.token_budget:
+            self.status["state"] = "budget exhausted"
+            return False
+        if respect_window and not in_window(datetime.now(), *self.window):
+            self.status["state"] = "window closed"
+            return False
+        return True
+
+    def run_once(self, respect_window=True):
+        """Warm every matrix entry once, within the token budget and window."""
+        self.status.update(state="running", last_run_started=time.time(), tokens_spent=0)
+
+        for subject, grade, mode in self.matrix:
+            if not self._should_continue(respect_window):
+                break
+
+            self._throttle()
+            try:
+                topics, tokens, cached = self.warm_toc(subject, grade)
+            except Exception as e:
+                logger.warning("Pre-warm TOC failed for %s grade %s: %s", subject, grade, e)
+                self.status["failures"] += 1
+                continue
+            self._account(tokens, cached, "tocs_warmed")
+
+            for seq, topic in enumerate(topics or [], 1):
+                if not self._should_continue(respect_window):
+                    break
+                self._throttle()
+                try:
+                    tokens, cached = self.warm_lesson(subject, grade, mode, topic, seq)
+                except Exception as e:
+                    logger.warning("Pre-warm lesson failed for %s: %s", topic, e)
+                    self.status["failures"] += 1
+                    continue
+                self._account(tokens, cached, "lessons_warmed")
+
+        if self.status["state"] == "running":
+            self.status["state"] = "idle"
+        self.status["last_run_finished"] = time.time()
+
+    def _account(self, tokens, cached, counter):
+        if cached:
+            self.status["cache_hits"] += 1
+            # Cache hits never hit the API, so they don't need rate limiting
+            self._last_request = 0.0
+        else:
+            self.status[counter] += 1
+            self.status["tokens_spent"] += tokens
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            now = datetime.now()
+            if in_window(now, *self.window):
+                self.run_once()
+                # Sleep past the end of this window before looking again
+                self.stop_event.wait(seconds_until_window(datetime.now(), self.window[0]))
+            else:
+                self.status["state"] = "waiting for window"
+                self.stop_event.wait(seconds_until_window(now, self.window[0]))
+
+    def start(self):
+        """Start the scheduler on a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self.stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, name="eduplan-prewarm", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def job_from_env(warm_toc, warm_lesson):
+    """Build a PrewarmJob from EDUPLAN_PREWARM_* environment settings."""
+    start_hour, end_hour = (int(h) for h in os.environ.get("EDUPLAN_PREWARM_WINDOW", "1-5").split("-"))
+    return PrewarmJob(
+        warm_toc,
+        warm_lesson,
+        matrix=load_matrix(),
+        token_budget=int(os.environ.get("EDUPLAN_PREWARM_TOKEN_BUDGET", 2_000_000)),
+        requests_per_minute=float(os.environ.get("EDUPLAN_PREWARM_RPM", 20)),
+        window=(start_hour, end_hour),
+    )
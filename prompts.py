@@ -0,0 +1,317 @@
+import hashlib
+
+# --- PROMPT TEMPLATES ---
+# Every prompt is a static prefix (sent as the system message, identical for
+# every call) followed by a short dynamic suffix holding the subject, grade,
+# topic and mode. With everything variable at the end, provider-side prompt
+# caching can reuse the prefix across the 10-15 topic calls of a curriculum.
+
+
+class PromptTemplate:
+    """
+    A versioned prompt. `prefix` is sent verbatim; `suffix` is formatted with
+    the call's fields. `version` hashes both, so it changes whenever the
+    wording does and doubles as a cache-key component.
+    """
+
+    def __init__(self, name, prefix, suffix):
+        self.name = name
+        self.prefix = prefix.strip()
+        self.suffix = suffix.strip()
+        self.version = hashlib.sha256(f"{self.prefix}\0{self.suffix}".encode()).hexdigest()[:12]
+
+    @property
+    def cache_key(self):
+        """Routing hint for the provider's prompt cache (requests sharing it share a prefix)."""
+        return f"eduplan-{self.name}-{self.version}"
+
+    def render(self, **fields):
+        """Chat messages for one call: the static prefix, then the formatted suffix."""
+        return [
+            {"role": "system", "content": self.prefix},
+            {"role": "user", "content": self.suffix.format(**fields)},
+        ]
+
+
+REGISTRY = {}
+
+
+def register(name, prefix, suffix):
+    template = PromptTemplate(name, prefix, suffix)
+    REGISTRY[name] = template
+    return template
+
+
+def get(name):
+    return REGISTRY[name]
+
+
+def version_of(*names):
+    """Combined version of several templates, for results built from more than one prompt."""
+    return "+".join(REGISTRY[name].version for name in names)
+
+
+# Minimal per-section instructions, shared by split generation and section regeneration.
+LESSON_SECTIONS = {
+    "overview": {
+        "instructions": """TOPIC OVERVIEW
+Write 4-5 sentences that explain what this topic covers, why it matters for
+students in the given grade, real-world applications and how it connects to other topics.""",
+        "shape": '"Comprehensive 4-5 sentence overview..."',
+    },
+    "objectives": {
+        "instructions": """LEARNING OBJECTIVES
+List 3-4 specific, measurable objectives using action verbs, assessable and aligned with US standards.""",
+        "shape": '["Students will be able to...", "Students will be able to..."]',
+    },
+    "materials": {
+        "instructions": """REQUIRED MATERIALS
+List 6-10 specific materials needed for the hands-on activity on the topic.
+Follow the materials guidance for the learning mode.
+Be precise with quantities and specifications.""",
+        "shape": '["Material 1", "Material 2"]',
+    },
+    "experiment": {
+        "instructions": """HANDS-ON ACTIVITY
+Create an engaging activity with a creative, descriptive title and 7-10 detailed,
+numbered steps including safety notes (if applicable) and expected outcomes.
+Follow the materials guidance for the learning mode.""",
+        "shape": '{"title": "Activity Title", "steps": ["Step 1...", "Step 2..."]}',
+    },
+}
+
+VIDEO_QUERY_RULES = """**SEARCH QUERY REQUIREMENTS:**
+- Include a real educational channel name (Khan Academy, CrashCourse, TED-Ed, Veritasium, SciShow, Bozeman Science, MIT OpenCourseWare, Amoeba Sisters, Professor Dave Explains, etc.)
+- Include specific keywords related to the topic
+- For experiments, include the learning mode keywords given with the request
+- Examples (for a topic such as "Photosynthesis" in a physical classroom):
+  - "Photosynthesis Khan Academy tutorial"
+  - "Photosynthesis CrashCourse biology"
+  - "Photosynthesis PHYSICAL CLASSROOM LAB experiment demonstration"
+  - "Photosynthesis laboratory procedure Bozeman Science"
+
+For each intent provide ONLY:
+- type: "Theory" or "Experiment Demo"
+- search_query: HIGHLY SPECIFIC search query that will find the exact video type needed
+
+Do NOT invent titles, channels, descriptions or durations - they are read from the real search results."""
+
+
+TOC = register(
+    "toc",
+    """
+You are a US curriculum expert who generates realistic, standards-aligned topic lists.
+You have deep knowledge of standard textbooks and curriculum frameworks.
+
+TASK: Generate the complete Table of Contents for the subject and grade given by the user, based on ACTUAL US curriculum standards.
+
+CRITICAL INSTRUCTIONS:
+1. Research what topics are ACTUALLY taught in that subject for that grade in US schools
+2. The number of topics should match REAL textbook chapter counts:
+   - Physics: typically 10-14 major topics
+   - Chemistry: typically 10-14 major topics
+   - Biology: typically 9-12 major topics
+   - Algebra: typically 8-11 units
+   - Geometry: typically 10-12 units
+   - US History: typically 10-15 units
+   - World History: typically 12-16 units
+
+3. Topics must be:
+   - Aligned with NGSS (Science), Common Core (Math), or NCSS (Social Studies)
+   - Age-appropriate for the grade
+   - Sequenced in the order they're typically taught
+   - Use proper terminology from standard textbooks
+
+4. Include the FULL CURRICULUM - don't abbreviate or skip topics
+
+EXAMPLES OF REAL CURRICULA:
+- Chemistry Grade 10: Atomic Structure, Periodic Table, Chemical Bonding, Chemical Reactions, Stoichiometry, Gas Laws, Solutions, Acids and Bases, Thermochemistry, Kinetics, Equilibrium, Electrochemistry, Organic Chemistry
+- Physics Grade 9: Motion and Forces, Energy and Work, Momentum, Waves, Sound, Light, Electricity, Magnetism, Heat and Temperature, Simple Machines
+
+Output format STRICTLY:
+1. Topic Name
+2. Topic Name
+3. Topic Name
+... (continue for ALL topics in the standard curriculum)
+
+OUTPUT ONLY THE NUMBERED LIST. No introduction, no conclusion, no extra text.
+""",
+    """
+Subject: {subject}
+Grade: {grade}
+""",
+)
+
+# Shared by the single-topic and batched lesson prompts
+LESSON_PLAN_INSTRUCTIONS = f"""
+Create a detailed, professional lesson plan with the following structure:
+
+1. TOPIC OVERVIEW
+Write 4-5 sentences that explain:
+- What this topic covers
+- Why it matters for students in the given grade
+- Real-world applications
+- How it connects to other topics
+
+2. LEARNING OBJECTIVES
+List 3-4 specific, measurable objectives:
+- Use action verbs (understand, analyze, calculate, demonstrate, etc.)
+- Make them assessable
+- Align with US standards
+
+3. REQUIRED MATERIALS
+List 6-10 specific materials needed, following the materials guidance for the learning mode.
+Be precise with quantities and specifications.
+
+4. HANDS-ON ACTIVITY
+Create an engaging activity with:
+- Creative, descriptive title
+- 7-10 detailed, numbered steps
+- Safety notes (if applicable)
+- Expected outcomes
+
+5. VIDEO SEARCH INTENTS
+
+CRITICAL: Generate 10-12 TOTAL YouTube search intents with diverse, highly relevant content:
+- 6-8 intents of type "Theory" for conceptual learning
+- 4-6 intents of type "Experiment Demo" for practical demonstrations, following the video guidance for the learning mode
+
+{VIDEO_QUERY_RULES}
+"""
+
+LESSON_SHAPE = """{
+    "title": "<topic name>",
+    "overview": "Comprehensive 4-5 sentence overview...",
+    "objectives": [
+        "Students will be able to...",
+        "Students will be able to...",
+        "Students will be able to...",
+        "Students will be able to..."
+    ],
+    "materials": [
+        "Material 1",
+        "Material 2",
+        "Material 3",
+        "Material 4",
+        "Material 5",
+        "Material 6"
+    ],
+    "experiment": {
+        "title": "Activity Title",
+        "steps": [
+            "Step 1...",
+            "Step 2...",
+            "Step 3...",
+            "Step 4...",
+            "Step 5...",
+            "Step 6...",
+            "Step 7..."
+        ]
+    },
+    "videos": [
+        {"type": "Theory", "search_query": "<topic> Khan Academy tutorial"},
+        {"type": "Theory", "search_query": "<topic> CrashCourse"},
+        {"type": "Experiment Demo", "search_query": "<topic> <mode keywords> experiment demonstration"}
+    ]
+}"""
+
+LESSON = register(
+    "lesson",
+    f"""
+You are a US curriculum expert creating detailed lesson plans with YouTube video search intents.
+Each request gives the subject, grade, topic and learning mode, plus mode-specific guidance.
+{LESSON_PLAN_INSTRUCTIONS}
+OUTPUT AS VALID JSON:
+{LESSON_SHAPE}
+
+CRITICAL: Output ONLY valid JSON. Generate 10-12 video search intents total with highly specific search queries.
+""",
+    """
+Subject: {subject}
+Grade: {grade}
+Topic: {topic}
+Mode: {exp_context}
+Materials guidance: {exp_guide}
+Video guidance: {video_guide}
+""",
+)
+
+LESSON_BATCH = register(
+    "lesson_batch",
+    f"""
+You are a US curriculum expert creating detailed lesson plans with YouTube video search intents.
+Each request gives the subject, grade and learning mode, mode-specific guidance and a numbered
+list of topics. Write one complete, independent lesson plan for EACH topic.
+
+For every topic:
+{LESSON_PLAN_INSTRUCTIONS}
+OUTPUT AS VALID JSON of the form {{"lessons": [...]}}, with one object per topic shaped like:
+{LESSON_SHAPE}
+
+CRITICAL: Output ONLY valid JSON. Return exactly one lesson per topic, in the order given, with
+"title" copied exactly from the topic list. Every lesson needs 10-12 video search intents.
+""",
+    """
+Subject: {subject}
+Grade: {grade}
+Mode: {exp_context}
+Materials guidance: {exp_guide}
+Video guidance: {video_guide}
+
+Topics:
+{topics}
+""",
+)
+
+LESSON_SECTIONS_PROMPT = register(
+    "lesson_sections",
+    "\n\n".join([
+        """
+You are a US curriculum expert creating detailed lesson plans.
+Each request names the lesson sections to write; write ONLY those sections.
+
+The sections you may be asked for:""",
+        *(f"[{name}] {section['instructions']}" for name, section in LESSON_SECTIONS.items()),
+        "OUTPUT AS VALID JSON containing only the requested keys, shaped like:\n{\n"
+        + ",\n".join(f'    "{name}": {section["shape"]}' for name, section in LESSON_SECTIONS.items())
+        + "\n}",
+    ]),
+    """
+Subject: {subject}
+Grade: {grade}
+Topic: {topic}
+Mode: {exp_context}
+Materials guidance: {exp_guide}
+
+Write ONLY these sections: {sections}
+""",
+)
+
+VIDEO_INTENTS = register(
+    "video_intents",
+    f"""
+You are a US curriculum expert choosing YouTube search queries for lessons.
+Each request gives the subject, grade, topic and learning mode, and how many intents of each type to generate.
+
+{VIDEO_QUERY_RULES}
+
+OUTPUT AS VALID JSON:
+{{"videos": [{{"type": "Theory", "search_query": "<topic> Khan Academy tutorial"}}]}}
+""",
+    """
+Subject: {subject}
+Grade: {grade}
+Topic: {topic}
+Mode: {exp_context}
+Video guidance: {video_guide}
+
+Generate {count} YouTube search intents for this lesson:
+{counts}
+""",
+)
+
+REPAIR = register(
+    "repair",
+    "You repair malformed JSON. Return the same content as a single valid JSON object, changing nothing else.",
+    "{raw_text}",
+)
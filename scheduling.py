@@ -0,0 +1,234 @@
+import os
+import time
+import heapq
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from cancellation import raise_if_cancelled
+
+# --- FAIR SCHEDULING ---
+# Sessions on the server's secrets key share one OpenAI rate-limit pool, and
+# every session shares the scraper's IP. Calls take one of a fixed number of
+# slots per resource; when none is free they queue, interactive work ahead
+# of background work (speculation, fill-in, bulk, pre-warm), and within a
+# class by weighted fair queuing across flows (browser sessions or API jobs),
+# so one teacher generating three whole curricula can't starve the rest.
+
+PRIORITIES = ("interactive", "background")
+DEFAULT_SLOTS = {
+    "llm": int(os.environ.get("EDUPLAN_LLM_SLOTS", 8)),
+    "scrape": int(os.environ.get("EDUPLAN_SCRAPE_SLOTS", 8)),
+}
+# Per-flow wait statistics kept for this many most recent flows
+MAX_TRACKED_FLOWS = 1000
+
+
+class PriorityBoost:
+    """
+    Priority inheritance for one piece of work. Calls made with the boost run
+    at their own priority class until raise_to() lifts them - including the
+    ones already queued - to the class of a caller now waiting on that work,
+    e.g. a teacher's Generate joining a lesson speculation started. Boosts
+    nest: raising one raises the boosts of the work it started.
+    """
+
+    def __init__(self, parent=None):
+        self.priority = parent.priority if parent else None
+        self.children = []
+        if parent:
+            parent.children.append(self)
+
+    def raise_to(self, priority):
+        if self.priority is not None and PRIORITIES.index(self.priority) <= PRIORITIES.index(priority):
+            return
+        self.priority = priority
+        for scheduler in get_schedulers().values():
+            scheduler._promote(self)
+        for child in list(self.children):
+            child.raise_to(priority)
+
+
+def _effective(priority, boost):
+    """The class a call is queued in: its own, or its boost's if that's higher."""
+    if boost is None or boost.priority is None:
+        return priority
+    return min(priority, boost.priority, key=PRIORITIES.index)
+
+
+class _Entry:
+    __slots__ = ("flow", "enqueued", "admitted", "abandoned", "fn", "future", "boost")
+
+    def __init__(self, flow, fn=None, future=None, boost=None):
+        self.flow = flow
+        self.enqueued = time.perf_counter()
+        self.admitted = threading.Event()
+        self.abandoned = False
+        self.fn = fn
+        self.future = future
+        self.boost = boost
+
+
+class FairScheduler:
+    """
+    Admits at most `slots` concurrent calls. Waiting calls are ordered by
+    priority class, then by start-time fair queuing: a flow's next call is
+    tagged max(virtual time, the flow's previous tag) + 1/weight, and the
+    lowest tag goes first - equal-weight flows alternate, a flow with weight
+    2 gets twice the turns, and a flow that was idle doesn't bank credit.
+
+    slot() gates a call made on the caller's thread; submit() queues a
+    function to run on the scheduler's own threads and returns a Future.
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.pool = ThreadPoolExecutor(max_workers=slots, thread_name_prefix="eduplan-sched")
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._virtual = 0.0
+        self._finish = {}
+        self._running = 0
+        self._queued = dict.fromkeys(PRIORITIES, 0)
+        self._flows = OrderedDict()
+        self.stats = {"admitted": 0, "max_queued": 0, "wait_s": 0.0, "max_wait_s": 0.0}
+
+    def _enqueue(self, entry, priority, weight):
+        with self._lock:
+            # Read under the lock: a boost raised after this sees the entry queued in _promote
+            priority = _effective(priority, entry.boost)
+            start = max(self._virtual, self._finish.get(entry.flow, 0.0))
+            self._finish[entry.flow] = start + 1.0 / weight
+            heapq.heappush(self._heap, (PRIORITIES.index(priority), start, next(self._seq), priority, entry))
+            self._queued[priority] += 1
+            self.stats["max_queued"] = max(self.stats["max_queued"], sum(self._queued.values()))
+            self._dispatch()
+
+    def _dispatch(self):
+        """Admit waiting calls while slots are free. Caller holds the lock."""
+        while self._running < self.slots and self._heap:
+            rank, start, seq, priority, entry = heapq.heappop(self._heap)
+            self._queued[priority] -= 1
+            if entry.abandoned:
+                continue
+            self._running += 1
+            self._virtual = start
+            self._record(entry.flow, time.perf_counter() - entry.enqueued)
+            if entry.fn is not None:
+                self.pool.submit(self._run, entry)
+            entry.admitted.set()
+        if not self._heap and len(self._finish) > MAX_TRACKED_FLOWS:
+            # Flows with nothing queued restart from the virtual time anyway
+            self._finish = {flow: tag for flow, tag in self._finish.items() if tag > self._virtual}
+
+    def _promote(self, boost):
+        """Move queued calls made with `boost` up to its class."""
+        with self._lock:
+            promoted = False
+            for i, (rank, start, seq, priority, entry) in enumerate(self._heap):
+                new = _effective(priority, entry.boost) if entry.boost is boost else priority
+                if new != priority:
+                    self._heap[i] = (PRIORITIES.index(new), start, seq, new, entry)
+                    self._queued[priority] -= 1
+                    self._queued[new] += 1
+                    promoted = True
+            if promoted:
+                heapq.heapify(self._heap)
+
+    def _record(self, flow, wait_s):
+        self.stats["admitted"] += 1
+        self.stats["wait_s"] += wait_s
+        self.stats["max_wait_s"] = max(self.stats["max_wait_s"], wait_s)
+        flow_stats = self._flows.pop(flow, None) or {"calls": 0, "wait_s": 0.0, "max_wait_s": 0.0}
+        flow_stats["calls"] += 1
+        flow_stats["wait_s"] += wait_s
+        flow_stats["max_wait_s"] = max(flow_stats["max_wait_s"], wait_s)
+        self._flows[flow] = flow_stats
+        if len(self._flows) > MAX_TRACKED_FLOWS:
+            self._flows.popitem(last=False)
+
+    def _release(self):
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    def _run(self, entry):
+        try:
+            if entry.future.set_running_or_notify_cancel():
+                try:
+                    entry.future.set_result(entry.fn())
+                except BaseException as e:
+                    entry.future.set_exception(e)
+        finally:
+            self._release()
+
+    def slot(self, flow, priority="interactive", weight=1.0, boost=None):
+        """Context manager holding one slot for the duration of a call; waiting honours cancellation."""
+        return _Slot(self, flow, priority, weight, boost)
+
+    def submit(self, fn, *args, flow=None, priority="interactive", weight=1.0, boost=None, **kwargs):
+        future = Future()
+        self._enqueue(_Entry(flow, lambda: fn(*args, **kwargs), future, boost), priority, weight)
+        return future
+
+    def snapshot(self):
+        """Slots in use, queue depth per priority class and admission/wait totals."""
+        with self._lock:
+            return dict(self.stats, slots=self.slots, running=self._running, queued=dict(self._queued))
+
+    def flow_stats(self, flow):
+        """Calls admitted and time spent waiting for one flow (zeros if unseen)."""
+        with self._lock:
+            return dict(self._flows.get(flow) or {"calls": 0, "wait_s": 0.0, "max_wait_s": 0.0})
+
+
+class _Slot:
+    def __init__(self, scheduler, flow, priority, weight, boost=None):
+        self.scheduler = scheduler
+        self.entry = _Entry(flow, boost=boost)
+        self.priority = priority
+        self.weight = weight
+
+    def __enter__(self):
+        self.scheduler._enqueue(self.entry, self.priority, self.weight)
+        try:
+            while not self.entry.admitted.wait(0.25):
+                raise_if_cancelled()
+        except BaseException:
+            with self.scheduler._lock:
+                self.entry.abandoned = True
+                admitted = self.entry.admitted.is_set()
+            if admitted:
+                self.scheduler._release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.scheduler._release()
+        return False
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def key_pool(api_key):
+    """Pool name for calls on an API key: keys share a scheduler exactly when they share a rate limit."""
+    return "key-" + hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+
+
+def get_scheduler(resource, pool="shared"):
+    """The process-wide scheduler for a resource ("llm" or "scrape") and pool."""
+    with _schedulers_lock:
+        if (resource, pool) not in _schedulers:
+            _schedulers[(resource, pool)] = FairScheduler(DEFAULT_SLOTS[resource])
+        return _schedulers[(resource, pool)]
+
+
+def get_schedulers():
+    """Snapshot of all schedulers, for metrics display."""
+    with _schedulers_lock:
+        return dict(_schedulers)
@@ -0,0 +1,237 @@
+import os
+import sys
+import time
+import threading
+
+import curriculum_store as store
+import lesson_model
+
+# --- SESSION MEMORY CAPS ---
+# Streamlit keeps every browser session's state in RAM until the session
+# ends, and tabs left open for days hold on to whole curricula. Each rerun
+# reports its session here; when it finishes, the session's curriculum
+# fields are measured and budgets enforced:
+#   - a session over its own budget is spilled once its rerun is done,
+#   - sessions idle longer than IDLE_SPILL_S are spilled,
+#   - while all resident sessions together exceed the global budget, the
+#     least recently active ones are spilled.
+# Spilling moves the fields to the store and leaves a SPILLED placeholder in
+# session state; the session's next rerun puts them back before the script
+# reads them. Sessions whose rerun is still going, or whose lessons a
+# background fill-in is writing to, are never spilled.
+#
+# Ended sessions are dropped from the registry, but their spills are only
+# purged by age: a session that looks gone may still reconnect, and its
+# spill is what it rehydrates from.
+
+SPILL_FIELDS = ("topics", "toc_text", "generated_content")
+SPILL_REASONS = ("session_budget", "idle", "global_budget")
+SESSION_BUDGET_BYTES = int(float(os.environ.get("EDUPLAN_SESSION_MEMORY_MB", 8)) * 2**20)
+GLOBAL_BUDGET_BYTES = int(float(os.environ.get("EDUPLAN_GLOBAL_SESSION_MEMORY_MB", 512)) * 2**20)
+IDLE_SPILL_S = float(os.environ.get("EDUPLAN_SESSION_IDLE_S", 900))
+# A rerun that never reported its end (st.stop(), a crash) stops counting as running after this
+MAX_RUN_S = 3600
+# Spills of sessions that never came back are dropped after this
+SPILL_TTL_S = 24 * 3600
+PURGE_INTERVAL_S = 3600
+
+
+class Spilled:
+    """Placeholder left in session state for a field that was moved to disk."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<spilled>"
+
+
+SPILLED = Spilled()
+
+
+def deep_size(obj, seen=None):
+    """Approximate bytes held by obj and everything it references."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif isinstance(obj, store.LazyLessons):
+        # Only what has been loaded so far; iterating would read the rest from disk
+        size += deep_size(vars(obj), seen)
+    elif hasattr(type(obj), "__slots__"):
+        size += sum(deep_size(getattr(obj, name, None), seen) for name in type(obj).__slots__)
+    return size
+
+
+def _encode(field, value):
+    return lesson_model.unpack_all(value) if field == "generated_content" else value
+
+
+def _decode(field, value):
+    return lesson_model.pack_all(value) if field == "generated_content" else value
+
+
+def _default(field):
+    return "" if field == "toc_text" else []
+
+
+class _Session:
+    __slots__ = ("lock", "state", "size", "last_active", "running_since", "spilled")
+
+    def __init__(self, state):
+        self.lock = threading.Lock()
+        self.state = state
+        self.size = 0
+        self.last_active = time.monotonic()
+        self.running_since = None
+        self.spilled = False
+
+
+class SessionMemory:
+    """
+    Per-process registry of browser sessions and the memory their curricula
+    hold. `state` is the session's state mapping (st.session_state or the
+    run context's SafeSessionState). is_alive(session_id) is False once a
+    session can no longer come back (a disconnected one still can);
+    is_busy(state) vetoes spilling while background work writes into the
+    session.
+    """
+
+    def __init__(self, session_budget=SESSION_BUDGET_BYTES, global_budget=GLOBAL_BUDGET_BYTES,
+                 idle_s=IDLE_SPILL_S, is_alive=None, is_busy=None):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.idle_s = idle_s
+        self.is_alive = is_alive or (lambda session_id: True)
+        self.is_busy = is_busy or (lambda state: False)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._last_purge = 0.0
+        self.stats = {
+            "spills": dict.fromkeys(SPILL_REASONS, 0),
+            "rehydrations": 0,
+            "spilled_bytes": 0,
+            "lost": 0,
+            "ended": 0,
+        }
+
+    def begin(self, session_id, state):
+        """Call at the top of a rerun: puts the session's spilled fields back in place."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(state)
+        with session.lock:
+            session.state = state
+            session.running_since = session.last_active = time.monotonic()
+            if any(field in state and isinstance(state[field], Spilled) for field in SPILL_FIELDS):
+                self._rehydrate(session_id, session)
+
+    def end(self, session_id, state):
+        """Call when a rerun finished: measures the session and enforces the budgets."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(state)
+        with session.lock:
+            session.state = state
+            session.running_since = None
+            session.last_active = time.monotonic()
+            session.size = self._measure(state)
+            if session.size > self.session_budget and not self.is_busy(state):
+                self._spill(session_id, session, "session_budget")
+        self.enforce(exclude=session_id)
+
+    def enforce(self, exclude=None):
+        """Forget ended sessions, spill idle ones, then spill LRU sessions while over the global budget."""
+        now = time.monotonic()
+        with self._lock:
+            ended = [sid for sid in self._sessions if not self.is_alive(sid)]
+            for sid in ended:
+                del self._sessions[sid]
+            self.stats["ended"] += len(ended)
+            purge = now - self._last_purge > PURGE_INTERVAL_S
+            if purge:
+                self._last_purge = now
+            candidates = sorted(
+                (session.last_active, sid, session) for sid, session in self._sessions.items()
+                if sid != exclude and not session.spilled
+            )
+            resident = sum(session.size for session in self._sessions.values() if not session.spilled)
+        if purge:
+            store.delete_spills(SPILL_TTL_S)
+
+        for last_active, sid, session in candidates:
+            if now - last_active > self.idle_s:
+                reason = "idle"
+            elif resident > self.global_budget:
+                reason = "global_budget"
+            else:
+                break
+            size = session.size
+            with session.lock:
+                if self._spillable(session, now):
+                    self._spill(sid, session, reason)
+                    resident -= size
+
+    def _spillable(self, session, now):
+        """Caller holds the session's lock."""
+        running = session.running_since is not None and now - session.running_since < MAX_RUN_S
+        return not session.spilled and not running and not self.is_busy(session.state)
+
+    def _measure(self, state):
+        seen = set()
+        return sum(deep_size(state[field], seen) for field in SPILL_FIELDS if field in state)
+
+    def _spill(self, session_id, session, reason):
+        """Move the session's curriculum fields to the store. Caller holds the session's lock."""
+        state = session.state
+        data = {
+            field: _encode(field, state[field]) for field in SPILL_FIELDS
+            if field in state and not isinstance(state[field], Spilled)
+        }
+        if not data:
+            return
+        store.spill_session(session_id, data)
+        for field in data:
+            state[field] = SPILLED
+        session.spilled = True
+        with self._lock:
+            self.stats["spills"][reason] += 1
+            self.stats["spilled_bytes"] += session.size
+
+    def _rehydrate(self, session_id, session):
+        """Put spilled fields back. Caller holds the session's lock."""
+        data = store.take_spill(session_id) or {}
+        state = session.state
+        lost = False
+        for field in SPILL_FIELDS:
+            if field in state and isinstance(state[field], Spilled):
+                if field in data:
+                    state[field] = _decode(field, data[field])
+                else:
+                    # Purged or written by another process: start the session over
+                    state[field] = _default(field)
+                    lost = True
+        session.spilled = False
+        with self._lock:
+            self.stats["rehydrations"] += 1
+            self.stats["lost"] += lost
+
+    def snapshot(self):
+        """Tracked/spilled sessions, resident bytes, budgets and spill/rehydration totals."""
+        with self._lock:
+            resident = [session.size for session in self._sessions.values() if not session.spilled]
+            return dict(
+                self.stats,
+                spills=dict(self.stats["spills"]),
+                sessions=len(self._sessions),
+                spilled_sessions=len(self._sessions) - len(resident),
+                resident_bytes=sum(resident),
+                session_budget=self.session_budget,
+                global_budget=self.global_budget,
+            )
@@ -0,0 +1,110 @@
+import threading
+import logging
+
+from cancellation import CancelToken, GenerationCancelled, set_current_token
+
+# --- SPECULATIVE LESSON GENERATION ---
+# Starts generating lessons while the teacher is still choosing topics on
+# Step 2, so several are already cached by the time they press Generate.
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeGenerator:
+    """
+    Runs generate(client, seq, topic) for a topic list on a few background
+    threads, earliest topics first. Pending topics can be reprioritized or
+    cancelled as the selection changes; a topic that is already running
+    finishes and lands in the cache anyway.
+
+    The workers share a client from acquire(), taken when they start and
+    handed to release() as soon as the last one exits, whether it ran out of
+    topics or was stopped; topics added back later acquire a fresh one.
+    stop() passes the client in use to abort() to cut requests in flight.
+    """
+
+    def __init__(self, generate, topics, max_workers=2, acquire=None, release=None, abort=None):
+        self.generate = generate
+        self.topics = list(topics)
+        self.max_workers = max_workers
+        self.acquire = acquire or (lambda: None)
+        self.release = release or (lambda client: None)
+        self.abort = abort or (lambda client: None)
+        self._pending = list(self.topics)
+        self._running = set()
+        self._done = set()
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._workers = 0
+        self._client = None
+        self.token = CancelToken()
+
+    def start(self):
+        self._ensure_workers()
+        return self
+
+    def _ensure_workers(self):
+        """Top the pool back up; idle workers exit once nothing is pending."""
+        with self._lock:
+            if self._stopped.is_set() or not self._pending:
+                return
+            if self._workers == 0:
+                self._client = self.acquire()
+            start = range(self._workers, self.max_workers)
+            self._workers = self.max_workers
+        for i in start:
+            threading.Thread(target=self._worker, name=f"eduplan-speculative-{i}", daemon=True).start()
+
+    def _worker(self):
+        set_current_token(self.token)
+        try:
+            while True:
+                with self._lock:
+                    if self._stopped.is_set() or not self._pending:
+                        return
+                    item = self._pending.pop(0)
+                    self._running.add(item)
+                    client = self._client
+                try:
+                    self.generate(client, *item)
+                    outcome = self._done
+                except GenerationCancelled:
+                    return
+                except Exception as e:
+                    logger.warning("Speculative generation failed for %s: %s", item[1], e)
+                    outcome = self._failed
+                with self._lock:
+                    self._running.discard(item)
+                    outcome.add(item)
+        finally:
+            with self._lock:
+                self._workers -= 1
+                client = self._client if self._workers == 0 else None
+                if client is not None:
+                    self._client = None
+            if client is not None:
+                self.release(client)
+
+    def reprioritize(self, selected):
+        """Keep only `selected` topics pending, in selection order; others are cancelled."""
+        selected = list(selected)
+        with self._lock:
+            finished = self._running | self._done | self._failed
+            self._pending = [item for item in selected if item not in finished]
+        self._ensure_workers()
+
+    def stop(self):
+        """Cancel pending topics and abort the ones already running."""
+        self._stopped.set()
+        with self._lock:
+            self._pending = []
+            client = self._client
+        self.token.cancel()
+        if client is not None:
+            self.abort(client)
+
+    def progress(self):
+        """(done, running, pending) counts for display."""
+        with self._lock:
+            return len(self._done), len(self._running), len(self._pending)
@@ -0,0 +1,74 @@
+import json
+import time
+
+import bulk
+
+
+class Backend:
+    """Answers every request once `ready`; until then batches stay in progress."""
+
+    def __init__(self, ready=True):
+        self.ready = ready
+        self.batches = {}
+
+    def submit(self, path):
+        batch_id = f"batch-{len(self.batches) + 1}"
+        with open(path) as f:
+            self.batches[batch_id] = [json.loads(line)["custom_id"] for line in f]
+        return batch_id
+
+    def poll(self, batch_id, output_path):
+        if not self.ready:
+            return "in_progress"
+        with open(output_path, "w") as f:
+            for custom_id in self.batches.get(batch_id, []):
+                content = "1. Cells\n2. Genetics" if custom_id.startswith("toc:") else f"lesson for {custom_id}"
+                body = {"choices": [{"message": {"content": content}}], "usage": {"total_tokens": 1}}
+                f.write(json.dumps({"custom_id": custom_id, "response": {"status_code": 200, "body": body}}) + "\n")
+        return "completed"
+
+
+def make_job(backend, work_dir, saved, exits=None):
+    return bulk.BulkJob(
+        backend,
+        [("Biology", 9, "Online (Virtual)")],
+        toc_request=lambda subject, grade: {"toc": subject},
+        lesson_request=lambda subject, grade, mode, topic: {"lesson": topic},
+        parse_toc=lambda text: [line[3:] for line in text.splitlines()],
+        parse_lesson=lambda subject, grade, mode, topic, text: {"title": topic},
+        save=lambda *curriculum: saved.append(curriculum),
+        work_dir=work_dir,
+        poll_interval=0.01,
+        meta={"backend": "test"},
+        on_exit=lambda: exits.append(work_dir) if exits is not None else None,
+    )
+
+
+def test_stopped_job_is_listed_and_resumes_its_open_batch(tmp_path):
+    work_dir = str(tmp_path / "job-1")
+    saved, exits = [], []
+    waiting = Backend(ready=False)
+    job = make_job(waiting, work_dir, saved, exits).start()
+    while job.status["state"] != "waiting for batch":
+        time.sleep(0.01)
+    job.stop()
+    job._thread.join(5)
+    assert job.status["state"] == "stopped"
+    assert exits == [work_dir]
+    # The open TOC batch is pending, not failed
+    assert job.status["stopped"] == 1
+    assert job.status["failed"] == 0 and job.status["failures"] == {}
+
+    [(listed_dir, state)] = bulk.unfinished_jobs(str(tmp_path))
+    assert listed_dir == work_dir
+    assert state["entries"] == [["Biology", "9", "Online (Virtual)"]]
+    assert state["meta"] == {"backend": "test"}
+
+    # The resumed job polls the batch it already paid for instead of submitting another
+    waiting.ready = True
+    resumed = make_job(waiting, work_dir, saved)
+    assert resumed.run()["state"] == "finished"
+    assert list(waiting.batches) == ["batch-1", "batch-2"]
+    assert saved == [("Biology", "9", "Online (Virtual)", "1. Cells\n2. Genetics", ["Cells", "Genetics"],
+                      [{"title": "Cells"}, {"title": "Genetics"}])]
+    assert bulk.unfinished_jobs(str(tmp_path)) == []
@@ -0,0 +1,42 @@
+import clients
+
+
+def test_make_client_builds_a_real_client():
+    client = clients.make_client("sk-test")
+    try:
+        assert client.max_retries == clients.MAX_RETRIES
+        assert client.timeout.read == clients.TIMEOUT_S
+        assert client.timeout.connect == clients.CONNECT_TIMEOUT_S
+        assert not client.is_closed()
+    finally:
+        client.close()
+
+
+def test_checked_in_client_is_reused():
+    registry = clients.ClientRegistry()
+    client = registry.checkout("sk-test")
+    registry.checkin(client)
+    assert registry.checkout("sk-test") is client
+    registry.checkin(client)
+    registry.close_all()
+    assert client.is_closed()
+
+
+def test_closed_client_is_dropped_on_checkin():
+    registry = clients.ClientRegistry()
+    client = registry.checkout("sk-test")
+    client.close()
+    registry.checkin(client)
+    assert registry.snapshot()["spares"] == 0
+
+
+def test_idle_eviction_spares_shared_clients(monkeypatch):
+    registry = clients.ClientRegistry()
+    shared = registry.get("sk-test")
+    spare = registry.checkout("sk-test")
+    registry.checkin(spare)
+    monkeypatch.setattr(clients, "IDLE_EVICT_S", -1)
+    assert registry.get("sk-test") is shared
+    assert not shared.is_closed()
+    assert spare.is_closed()
+    registry.close_all()
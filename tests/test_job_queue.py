@@ -0,0 +1,32 @@
+import threading
+
+import job_queue
+
+
+def test_connection_is_reused_per_thread(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    assert job_queue.connect(db_path) is job_queue.connect(db_path)
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(job_queue.connect(db_path)))
+    thread.start()
+    thread.join()
+    assert other[0] is not job_queue.connect(db_path)
+
+
+def test_job_lifecycle(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    low = job_queue.submit("lesson", {"topic": "Cells"}, db_path=db_path)
+    high = job_queue.submit("toc", {"subject": "Biology"}, priority=1, db_path=db_path)
+
+    job = job_queue.claim("w1", db_path=db_path)
+    assert job["id"] == high and job["status"] == "running"
+    assert job_queue.heartbeat(high, "w1", db_path=db_path) == "running"
+    job_queue.complete(high, "w1", {"toc": "1. Cells"}, db_path=db_path)
+
+    job_queue.cancel([low], db_path=db_path)
+    assert job_queue.claim("w1", db_path=db_path) is None
+    jobs = job_queue.get_jobs([low, high], db_path=db_path)
+    assert jobs[high]["result"] == {"toc": "1. Cells"}
+    assert jobs[low]["status"] == "cancelled"
+    assert job_queue.queue_stats(db_path=db_path) == {"queued": 0, "running": 0, "workers": 1}
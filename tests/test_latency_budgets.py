@@ -0,0 +1,84 @@
+import json
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import pipeline
+import prompts
+
+LESSON_PARTS = {
+    "overview": "Objects in motion.",
+    "objectives": ["Describe motion"],
+    "materials": ["Ramp"],
+    "experiment": {"title": "Rolling", "steps": ["Roll a ball"]},
+    "videos": [],
+}
+REQUEST = openai.DefaultHttpxClient().build_request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+class FakeClient:
+    """Answers every prompt with LESSON_PARTS; `failures` maps a prompt to the errors its calls raise first."""
+
+    def __init__(self, failures=None):
+        self.api_key = "sk-test"
+        self.timeout = None
+        self.max_retries = 2
+        self.failures = failures or {}
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, timeout=None, max_retries=None):
+        self.timeout, self.max_retries = timeout, max_retries
+        return self
+
+    def create(self, model, messages, prompt_cache_key, **kwargs):
+        self.calls.append((prompt_cache_key, self.max_retries))
+        errors = self.failures.get(prompt_cache_key)
+        if errors:
+            raise errors.pop(0)
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=10, total_tokens=20, prompt_tokens_details=None)
+        message = SimpleNamespace(content=json.dumps(LESSON_PARTS))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+@pytest.fixture(autouse=True)
+def session():
+    pipeline.set_session(pipeline.GenerationSession(use_cache=False))
+    yield
+    pipeline.set_session(None)
+
+
+def generate(client, budgets=None):
+    budgets = budgets or dict(pipeline.DEFAULT_LATENCY_BUDGETS)
+    return pipeline.generate_topic_content(client, "9", "Physics", "Physical (Classroom)", "Motion", 1, budgets=budgets)
+
+
+def test_budgeted_call_retries_a_dropped_connection():
+    client = FakeClient({prompts.LESSON.cache_key: [openai.APIConnectionError(request=REQUEST)]})
+    data, tokens = generate(client)
+    assert data["overview"] == LESSON_PARTS["overview"]
+    assert [key for key, retries in client.calls].count(prompts.LESSON.cache_key) == 2
+    assert all(retries == 0 for key, retries in client.calls)
+
+
+def test_budgeted_call_does_not_retry_without_time_left(monkeypatch):
+    monkeypatch.setattr(pipeline, "MIN_RETRY_S", 10**6)
+    client = FakeClient({prompts.LESSON.cache_key: [openai.APIConnectionError(request=REQUEST)]})
+    data, tokens = generate(client)
+    assert data is None
+
+
+def test_monolithic_timeout_degrades_to_sections():
+    client = FakeClient({prompts.LESSON.cache_key: [openai.APITimeoutError(request=REQUEST)]})
+    data, tokens = generate(client)
+    assert data["overview"] == LESSON_PARTS["overview"]
+    assert data["experiment"] == LESSON_PARTS["experiment"]
+    assert "pending" not in data
+
+
+def test_exhausted_topic_budget_delivers_every_part_pending():
+    budgets = {"llm_s": 90, "videos_s": 10, "topic_s": 1e-9}
+    data, tokens = generate(FakeClient(), budgets)
+    assert data["title"] == "Motion"
+    assert set(data["pending"]) == {"overview", "objectives", "materials", "experiment", "videos"}
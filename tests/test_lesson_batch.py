@@ -0,0 +1,116 @@
+import time
+import threading
+
+import pytest
+
+import inflight
+import pipeline
+
+MODE = "Physical (Classroom)"
+
+
+@pytest.fixture(autouse=True)
+def session():
+    pipeline.set_session(pipeline.GenerationSession(use_cache=False))
+    yield
+    pipeline.set_session(None)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def in_thread(fn, *args, **kwargs):
+    """Run fn on its own thread (with its own session); returns (thread, results list)."""
+    results = []
+
+    def target():
+        pipeline.set_session(pipeline.GenerationSession(use_cache=False))
+        results.append(fn(*args, **kwargs))
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, results
+
+
+def test_lesson_joins_the_batch_generating_it(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    singles = []
+
+    def batch(client, grade, subject, mode, items, split=False, budgets=None):
+        started.set()
+        release.wait(5)
+        return [({"title": topic}, 10) for seq, topic in items]
+
+    def single(client, grade, subject, mode, topic, sequence_num, split=False, budgets=None):
+        singles.append(topic)
+        return {"title": topic}, 10
+
+    monkeypatch.setattr(pipeline, "generate_topic_batch", batch)
+    monkeypatch.setattr(pipeline, "generate_topic_content", single)
+    batch_thread, batched = in_thread(
+        pipeline.cached_lesson_batch, None, "9", "Physics", MODE, [(1, "A"), (2, "B"), (3, "C")]
+    )
+    assert started.wait(5)
+    coalesced = inflight.REGISTRY.stats["coalesced"]
+    lesson_thread, lesson = in_thread(pipeline.cached_lesson, None, "9", "Physics", MODE, "B", 2)
+    assert wait_for(lambda: inflight.REGISTRY.stats["coalesced"] > coalesced)
+    release.set()
+    batch_thread.join(5)
+    lesson_thread.join(5)
+
+    assert singles == []
+    assert lesson == [({"title": "B"}, 10, False)]
+    assert [data["title"] for data, tokens, cached in batched[0]] == ["A", "B", "C"]
+    assert inflight.REGISTRY.in_flight() == 0
+
+
+def test_batch_is_sent_before_joining_running_topics(monkeypatch):
+    release = threading.Event()
+    sent = []
+
+    def batch(client, grade, subject, mode, items, split=False, budgets=None):
+        sent.append([topic for seq, topic in items])
+        return [({"title": topic}, 10) for seq, topic in items]
+
+    def lead_b():
+        release.wait(10)
+        return {"title": "B"}, 10
+
+    monkeypatch.setattr(pipeline, "generate_topic_batch", batch)
+    key = pipeline.lesson_key("Physics", "9", MODE, "B")
+    leader, _ = in_thread(inflight.REGISTRY.run, key, lead_b)
+    assert wait_for(lambda: inflight.REGISTRY.running(key))
+    batch_thread, batched = in_thread(
+        pipeline.cached_lesson_batch, None, "9", "Physics", MODE, [(1, "A"), (2, "B"), (3, "C")]
+    )
+    assert wait_for(lambda: sent, timeout=2)
+    assert sent == [["A", "C"]]
+    release.set()
+    batch_thread.join(5)
+    leader.join(5)
+
+    assert [data["title"] for data, tokens, cached in batched[0]] == ["A", "B", "C"]
+
+
+def test_batch_deadline_allows_for_each_extra_topic(monkeypatch):
+    deadlines = []
+
+    def call_llm(*args, **kwargs):
+        deadlines.append(pipeline.thread_budget.deadline - time.monotonic())
+        raise TimeoutError("Topic latency budget exhausted")
+
+    monkeypatch.setattr(pipeline, "call_llm", call_llm)
+    budgets = dict(pipeline.DEFAULT_LATENCY_BUDGETS)
+    pipeline.generate_topic_batch(None, "9", "Physics", MODE, [(1, "A"), (2, "B"), (3, "C")], budgets=budgets)
+
+    expected = budgets["topic_s"] + 2 * pipeline.BATCH_TOPIC_ALLOWANCE_S
+    assert expected - 1 < deadlines[0] <= expected
+    # Topics the batch didn't deliver are re-issued under their own topic budget
+    assert all(budgets["topic_s"] - 1 < left <= budgets["topic_s"] for left in deadlines[1:])
+    assert pipeline.thread_budget.deadline is None
@@ -0,0 +1,33 @@
+import copy
+import pickle
+
+import lesson_model
+
+LESSON = {
+    "title": "Motion",
+    "overview": "Objects in motion.",
+    "objectives": ["Describe motion"],
+    "materials": ["Ramp"],
+    "experiment": {"title": "Rolling", "steps": ["Roll a ball"]},
+    "videos": [
+        {"type": "Theory", "search_query": "motion", "video_id": "abcdefghijk",
+         "real_url": "https://www.youtube.com/watch?v=abcdefghijk", "channel": "Chan"},
+        {"type": "Experiment Demo", "search_query": "ramp", "real_url": None,
+         "search_url": "https://www.youtube.com/results?search_query=ramp"},
+    ],
+    "pending": ["videos"],
+}
+# No overview or pending, so both markers are in play
+PARTIAL = {"title": "Forces", "objectives": [], "materials": [], "experiment": {}, "videos": []}
+
+
+def test_pack_round_trip():
+    assert lesson_model.unpack_all(lesson_model.pack_all([LESSON, PARTIAL])) == [LESSON, PARTIAL]
+
+
+def test_markers_survive_copy_and_pickle():
+    packed = lesson_model.pack_all([LESSON, PARTIAL])
+    for clone in (copy.copy(packed), copy.deepcopy(packed), pickle.loads(pickle.dumps(packed))):
+        assert lesson_model.unpack_all(clone) == [LESSON, PARTIAL]
+    assert copy.deepcopy(lesson_model.ABSENT) is lesson_model.ABSENT
+    assert pickle.loads(pickle.dumps(lesson_model.DERIVED)) is lesson_model.DERIVED
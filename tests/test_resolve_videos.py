@@ -0,0 +1,27 @@
+import pipeline
+
+
+class RecordingSession(pipeline.GenerationSession):
+    def __init__(self):
+        super().__init__(use_cache=False)
+        self.reports = []
+
+    def report(self, level, message):
+        self.reports.append((level, message))
+
+
+def test_scrape_errors_reach_the_callers_session(monkeypatch):
+    def offline(search_query):
+        raise OSError("network unreachable")
+
+    monkeypatch.setattr(pipeline, "fetch_youtube_results_html", offline)
+    session = RecordingSession()
+    pipeline.set_session(session)
+    try:
+        videos = [{"type": "Theory", "search_query": "newton's laws"}]
+        pipeline.resolve_videos(videos)
+    finally:
+        pipeline.set_session(None)
+
+    assert videos[0]["real_url"] is None
+    assert session.reports == [("error", "YouTube search failed for 'newton's laws': network unreachable")]
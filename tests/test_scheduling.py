@@ -0,0 +1,52 @@
+import time
+import threading
+
+import inflight
+import scheduling
+
+
+def test_raised_boost_promotes_queued_calls(monkeypatch):
+    scheduler = scheduling.FairScheduler(1)
+    monkeypatch.setitem(scheduling._schedulers, ("llm", "test"), scheduler)
+    order = []
+    boost = scheduling.PriorityBoost()
+    with scheduler.slot("teacher"):
+        earlier = scheduler.submit(order.append, "other background", flow="prewarm", priority="background")
+        boosted = scheduler.submit(order.append, "speculation", flow="spec", priority="background", boost=boost)
+        assert scheduler.snapshot()["queued"] == {"interactive": 0, "background": 2}
+        boost.raise_to("interactive")
+        assert scheduler.snapshot()["queued"] == {"interactive": 1, "background": 1}
+    earlier.result(5)
+    boosted.result(5)
+    assert order == ["speculation", "other background"]
+
+
+def test_nested_boosts_are_raised_with_their_parent():
+    parent = scheduling.PriorityBoost()
+    child = scheduling.PriorityBoost(parent)
+    parent.raise_to("interactive")
+    assert child.priority == "interactive"
+    assert scheduling.PriorityBoost(parent).priority == "interactive"
+
+
+def test_follower_raises_the_leaders_boost():
+    registry = inflight.InflightRegistry()
+    boost = scheduling.PriorityBoost()
+    started, release = threading.Event(), threading.Event()
+
+    def lead():
+        started.set()
+        release.wait(5)
+        return "lesson"
+
+    leader = threading.Thread(target=lambda: registry.run("key", lead, boost=boost, priority="background"))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=lambda: registry.run("key", lead, priority="interactive"))
+    follower.start()
+    while registry.stats["coalesced"] == 0:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert boost.priority == "interactive"
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import curriculum_store as store
+import lesson_model
+import session_memory
+
+LESSON = {
+    "title": "Motion",
+    "overview": "Objects in motion.",
+    "objectives": ["Describe motion"],
+    "materials": ["Ramp"],
+    "experiment": {"title": "Rolling", "steps": ["Roll a ball"]},
+    "videos": [{"type": "Theory", "search_query": "motion", "video_id": "abcdefghijk",
+                "real_url": "https://www.youtube.com/watch?v=abcdefghijk", "channel": "Chan"}],
+}
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "DB_PATH", str(tmp_path / "eduplan.db"))
+
+
+def session_state():
+    return {"topics": ["Motion"], "toc_text": "1. Motion", "generated_content": lesson_model.pack_all([LESSON])}
+
+
+def test_idle_session_is_spilled_and_rehydrated():
+    memory = session_memory.SessionMemory(idle_s=0.01)
+    state = session_state()
+    memory.begin("a", state)
+    memory.end("a", state)
+    time.sleep(0.02)
+    memory.enforce()
+    assert isinstance(state["generated_content"], session_memory.Spilled)
+
+    memory.begin("a", state)
+    assert state["topics"] == ["Motion"]
+    assert lesson_model.unpack_all(state["generated_content"]) == [LESSON]
+    assert memory.snapshot()["rehydrations"] == 1
+
+
+def test_disconnected_session_rehydrates_after_reconnect():
+    alive = {"a": True}
+    memory = session_memory.SessionMemory(idle_s=0.01, is_alive=lambda sid: alive.get(sid, False))
+    state = session_state()
+    memory.begin("a", state)
+    memory.end("a", state)
+    time.sleep(0.02)
+    memory.enforce()
+    assert isinstance(state["toc_text"], session_memory.Spilled)
+
+    # The tab disconnects long enough to be dropped from the registry...
+    alive["a"] = False
+    memory.enforce()
+    assert memory.snapshot()["sessions"] == 0
+
+    # ...and reconnects with the same session state
+    alive["a"] = True
+    memory.begin("a", state)
+    assert state["toc_text"] == "1. Motion"
+    assert lesson_model.unpack_all(state["generated_content"]) == [LESSON]
+    assert memory.snapshot()["lost"] == 0
+
+
+def test_over_budget_session_is_spilled_after_its_rerun():
+    memory = session_memory.SessionMemory(session_budget=1)
+    state = session_state()
+    memory.begin("a", state)
+    memory.end("a", state)
+    assert memory.snapshot()["spills"]["session_budget"] == 1
+
+    memory.begin("a", state)
+    assert lesson_model.unpack_all(state["generated_content"]) == [LESSON]
+
+
+def test_busy_session_is_not_spilled():
+    memory = session_memory.SessionMemory(session_budget=1, is_busy=lambda state: True)
+    state = session_state()
+    memory.begin("a", state)
+    memory.end("a", state)
+    assert state["topics"] == ["Motion"]
@@ -0,0 +1,82 @@
+import time
+import threading
+
+from cancellation import raise_if_cancelled
+import speculative
+
+
+class Pool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquired = []
+        self.released = []
+        self.aborted = []
+
+    def acquire(self):
+        with self.lock:
+            client = f"client-{len(self.acquired)}"
+            self.acquired.append(client)
+            return client
+
+    def release(self, client):
+        with self.lock:
+            self.released.append(client)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_client_is_released_once_topics_run_out():
+    pool = Pool()
+    seen = []
+    topics = [(1, "A"), (2, "B"), (3, "C")]
+    speculator = speculative.SpeculativeGenerator(
+        lambda client, seq, topic: seen.append(client), topics, acquire=pool.acquire, release=pool.release
+    ).start()
+    assert wait_for(lambda: pool.released)
+    assert speculator.progress() == (3, 0, 0)
+    assert pool.acquired == pool.released == ["client-0"]
+    assert set(seen) == {"client-0"}
+
+
+def test_topics_added_back_acquire_a_fresh_client():
+    pool = Pool()
+    speculator = speculative.SpeculativeGenerator(
+        lambda client, seq, topic: None, [(1, "A"), (2, "B")], acquire=pool.acquire, release=pool.release
+    )
+    speculator.reprioritize([(1, "A")])
+    assert wait_for(lambda: pool.released == ["client-0"])
+    speculator.reprioritize([(1, "A"), (2, "B")])
+    assert wait_for(lambda: pool.released == ["client-0", "client-1"])
+    assert speculator.progress() == (2, 0, 0)
+
+
+def test_stop_aborts_then_releases_the_client():
+    pool = Pool()
+    started = threading.Event()
+    aborted = threading.Event()
+
+    def generate(client, seq, topic):
+        started.set()
+        aborted.wait(5)
+        raise_if_cancelled()
+
+    def abort(client):
+        pool.aborted.append(client)
+        aborted.set()
+
+    speculator = speculative.SpeculativeGenerator(
+        generate, [(1, "A"), (2, "B"), (3, "C")], max_workers=1,
+        acquire=pool.acquire, release=pool.release, abort=abort
+    ).start()
+    assert started.wait(5)
+    speculator.stop()
+    assert pool.aborted == ["client-0"]
+    assert wait_for(lambda: pool.released == ["client-0"])
+    assert speculator.progress() == (0, 1, 0)
@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import logging
+import threading
+import multiprocessing
+
+import clients
+import pipeline
+import job_queue
+import cancellation
+
+# --- GENERATION WORKERS ---
+# Worker processes that execute queued TOC and lesson jobs with the headless
+# pipeline, so generation capacity scales independently of the web tier.
+# Run any number of them, on any machine that shares the database:
+#
+#   python worker.py --processes 4
+
+logger = logging.getLogger("eduplan.worker")
+
+# Seconds between lease renewals (and cancellation checks) for a running job
+HEARTBEAT_S = 2
+
+
+class QueueSession(pipeline.GenerationSession):
+    """Pipeline session for one job; problems are logged and returned with the result."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.messages = []
+
+    def report(self, level, message):
+        super().report(level, message)
+        self.messages.append({"level": level, "message": message})
+
+
+def job_session(payload):
+    return QueueSession(
+        stage_models=dict(pipeline.DEFAULT_STAGE_MODELS, **payload.get("models", {})),
+        ab_stage_models=payload.get("ab_models"),
+        latency_budgets=payload.get("budgets"),
+        hedge_percentile=payload.get("hedge_percentile"),
+    )
+
+
+def run_toc(client, payload):
+    toc, cached = pipeline.cached_toc(client, payload["grade"], payload["subject"])
+    if not toc:
+        raise RuntimeError("No table of contents returned")
+    return {"toc": toc, "cached": cached}
+
+
+def run_lessons(client, payload):
+    """One topic through cached_lesson, or several through the batched path."""
+    items = [tuple(item) for item in payload["items"]]
+    args = (client, payload["grade"], payload["subject"], payload["mode"])
+    if len(items) == 1:
+        seq, topic = items[0]
+        results = [pipeline.cached_lesson(*args, topic, seq, split=payload.get("split", False))]
+    else:
+        results = pipeline.cached_lesson_batch(*args, items, split=payload.get("split", False))
+    return {
+        "lessons": [
+            [seq, data, tokens, cached]
+            for (seq, topic), (data, tokens, cached) in zip(items, results)
+        ]
+    }
+
+
+TASKS = {"toc": run_toc, "lessons": run_lessons}
+
+
+def execute(job, worker_id, api_key):
+    """
+    Run one job on a helper thread while this thread renews its lease. A job
+    cancelled from the UI is aborted mid-call by closing its OpenAI client.
+    """
+    token = cancellation.CancelToken()
+    client = clients.checkout(api_key)
+    token.on_cancel(client.close)
+    session = job_session(job["payload"])
+    outcome = {}
+
+    def work():
+        pipeline.set_session(session)
+        cancellation.set_current_token(token)
+        try:
+            outcome["result"] = TASKS[job["kind"]](client, job["payload"])
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=work, name=f"eduplan-job-{job['id']}", daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(HEARTBEAT_S)
+            if thread.is_alive() and job_queue.heartbeat(job["id"], worker_id) != "running":
+                logger.info("Job %s was cancelled", job["id"])
+                token.cancel()
+                thread.join(HEARTBEAT_S)
+                return
+    finally:
+        clients.checkin(client)
+
+    error = outcome.get("error")
+    if isinstance(error, cancellation.GenerationCancelled):
+        return
+    if error is not None:
+        logger.warning("Job %s failed: %s", job["id"], error)
+        job_queue.fail(job["id"], worker_id, str(error), retry=True)
+        return
+
+    result = outcome["result"]
+    result.update(
+        stage_metrics=session.stage_metrics,
+        topic_latencies=session.topic_latencies,
+        counters=session.counters,
+        messages=session.messages,
+    )
+    job_queue.complete(job["id"], worker_id, result)
+
+
+def worker_loop(api_key, poll_interval=0.5, kinds=None):
+    """Claim and execute jobs until the process is stopped."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s {worker_id} %(levelname)s %(message)s")
+    logger.info("Worker started")
+    while True:
+        job = job_queue.claim(worker_id, kinds)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        logger.info("Running %s job %s (attempt %s)", job["kind"], job["id"], job["attempts"])
+        execute(job, worker_id, api_key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run EduPlan generation workers against the job queue.")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1, help="Worker processes to start")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between polls of an empty queue")
+    parser.add_argument("--kind", action="append", choices=sorted(TASKS), help="Only run these job kinds")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="Defaults to $OPENAI_API_KEY")
+    args = parser.parse_args(argv)
+    if not args.api_key:
+        parser.error("no API key: pass --api-key or set OPENAI_API_KEY")
+
+    processes = [
+        multiprocessing.Process(
+            target=worker_loop, args=(args.api_key, args.poll_interval, args.kind),
+            name=f"eduplan-worker-{i}", daemon=True
+        )
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())